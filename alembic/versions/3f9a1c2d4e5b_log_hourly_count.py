@@ -0,0 +1,46 @@
+"""log hourly count
+
+Revision ID: 3f9a1c2d4e5b
+Revises: 7c07acdb1498
+Create Date: 2026-10-18 10:12:40.318211
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9a1c2d4e5b"
+down_revision: Union[str, Sequence[str], None] = "7c07acdb1498"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if "log_hourly_count" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "log_hourly_count",
+            sa.Column("bucket", sa.DateTime(), nullable=False),
+            sa.Column("service", sa.String(length=100), nullable=False),
+            sa.Column("level", sa.String(length=20), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("bucket", "service", "level"),
+        )
+    op.execute("DELETE FROM log_hourly_count")
+    op.execute(
+        """
+        INSERT INTO log_hourly_count (bucket, service, level, count)
+        SELECT strftime('%Y-%m-%d %H:00:00.000000', timestamp), service, level, count(*)
+        FROM log
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("log_hourly_count")
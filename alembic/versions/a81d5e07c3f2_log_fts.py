@@ -0,0 +1,49 @@
+"""log fts
+
+Revision ID: a81d5e07c3f2
+Revises: 3f9a1c2d4e5b
+Create Date: 2026-10-18 11:02:15.904127
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a81d5e07c3f2"
+down_revision: Union[str, Sequence[str], None] = "3f9a1c2d4e5b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS log_fts "
+        "USING fts5(message, content='log', content_rowid='id')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS log_fts_ai AFTER INSERT ON log BEGIN "
+        "INSERT INTO log_fts(rowid, message) VALUES (new.id, new.message); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS log_fts_ad AFTER DELETE ON log BEGIN "
+        "INSERT INTO log_fts(log_fts, rowid, message) "
+        "VALUES ('delete', old.id, old.message); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS log_fts_au AFTER UPDATE OF message ON log BEGIN "
+        "INSERT INTO log_fts(log_fts, rowid, message) "
+        "VALUES ('delete', old.id, old.message); "
+        "INSERT INTO log_fts(rowid, message) VALUES (new.id, new.message); END"
+    )
+    op.execute("INSERT INTO log_fts(log_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS log_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS log_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS log_fts_ai")
+    op.execute("DROP TABLE IF EXISTS log_fts")
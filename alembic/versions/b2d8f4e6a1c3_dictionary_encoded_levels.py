@@ -0,0 +1,139 @@
+"""dictionary encoded levels and services
+
+Revision ID: b2d8f4e6a1c3
+Revises: e4b7c1d09a36
+Create Date: 2026-10-18 15:20:41.318205
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from app.config import PROMOTED_METADATA_KEYS
+from app.crud.metadata_filters import sync_promoted_columns
+from app.crud.partitions import PARTITION_PATTERN
+from app.schemas.log_schemas import LEVEL_CODES, fts_ddl
+
+# revision identifiers, used by Alembic.
+revision: str = "b2d8f4e6a1c3"
+down_revision: Union[str, Sequence[str], None] = "e4b7c1d09a36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LEVEL_TO_CODE = " ".join(
+    f"WHEN '{level}' THEN {code}" for level, code in LEVEL_CODES.items()
+)
+CODE_TO_LEVEL = " ".join(
+    f"WHEN {code} THEN '{level}'" for level, code in LEVEL_CODES.items()
+)
+
+
+def log_tables() -> list[str]:
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    return ["log"] + sorted(name for name in tables if PARTITION_PATTERN.match(name))
+
+
+def read_sequences() -> dict[str, int]:
+    # sqlite_sequence появляется только вместе с первой AUTOINCREMENT-таблицей,
+    # а в исходной схеме log объявлена без AUTOINCREMENT
+    bind = op.get_bind()
+    exists = bind.execute(
+        sa.text(
+            "SELECT 1 FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'sqlite_sequence'"
+        )
+    ).first()
+    if exists is None:
+        return {}
+    rows = bind.execute(sa.text("SELECT name, seq FROM sqlite_sequence"))
+    return {name: seq for name, seq in rows}
+
+
+def rebuild(
+    name: str,
+    level_type: str,
+    service_type: str,
+    select: str,
+    sequence: int | None = None,
+):
+    bind = op.get_bind()
+    partition = name != "log"
+
+    op.execute(
+        f"CREATE TABLE {name}_rebuild ("
+        f"id INTEGER NOT NULL PRIMARY KEY{' AUTOINCREMENT' if partition else ''}, "
+        f"timestamp DATETIME{'' if partition else ' NOT NULL'}, "
+        f"level {level_type}{'' if partition else ' NOT NULL'}, "
+        f"service {service_type}{'' if partition else ' NOT NULL'}, "
+        f"message VARCHAR{'' if partition else ' NOT NULL'}, "
+        f"metadata_json TEXT"
+        f"{', FOREIGN KEY(service) REFERENCES service (id)' if service_type == 'INTEGER' else ''})"
+    )
+    op.execute(
+        f"INSERT INTO {name}_rebuild (id, timestamp, level, service, message, metadata_json) "
+        + select.format(name=name)
+    )
+    op.execute(f"DROP TABLE {name}")
+    op.execute(f"ALTER TABLE {name}_rebuild RENAME TO {name}")
+    if sequence is not None:
+        op.execute(
+            sa.text(
+                "UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = :name"
+            ).bindparams(seq=sequence, name=name)
+        )
+
+    op.execute(f"CREATE INDEX index_{name}_timestamp ON {name} (timestamp)")
+    op.execute(f"CREATE INDEX index_{name}_service ON {name} (service)")
+    op.execute(f"CREATE INDEX idx_{name}_level_service ON {name} (level, service)")
+    for ddl in fts_ddl(name):
+        op.execute(ddl)
+    sync_promoted_columns(bind, PROMOTED_METADATA_KEYS, name)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    tables = log_tables()
+    sequences = read_sequences()
+    op.create_table(
+        "service",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    for name in tables:
+        op.execute(
+            f"INSERT OR IGNORE INTO service (name) "
+            f"SELECT DISTINCT service FROM {name} ORDER BY service"
+        )
+    for name in tables:
+        rebuild(
+            name,
+            "SMALLINT",
+            "INTEGER",
+            "SELECT l.id, l.timestamp, CASE l.level "
+            + LEVEL_TO_CODE
+            + " END, s.id, l.message, l.metadata_json "
+            "FROM {name} AS l JOIN service AS s ON s.name = l.service",
+            sequences.get(name),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    sequences = read_sequences()
+    for name in log_tables():
+        rebuild(
+            name,
+            "VARCHAR(20)",
+            "VARCHAR(100)",
+            "SELECT l.id, l.timestamp, CASE l.level "
+            + CODE_TO_LEVEL
+            + " END, s.name, l.message, l.metadata_json "
+            "FROM {name} AS l JOIN service AS s ON s.id = l.service",
+            sequences.get(name),
+        )
+    op.execute("CREATE INDEX index_log_level ON log (level)")
+    op.drop_table("service")
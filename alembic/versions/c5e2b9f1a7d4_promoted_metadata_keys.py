@@ -0,0 +1,37 @@
+"""promoted metadata keys
+
+Revision ID: c5e2b9f1a7d4
+Revises: a81d5e07c3f2
+Create Date: 2026-10-18 11:47:53.220519
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from app.config import PROMOTED_METADATA_KEYS
+from app.crud.metadata_filters import (promoted_column_name,
+                                       sync_promoted_columns)
+
+# revision identifiers, used by Alembic.
+revision: str = "c5e2b9f1a7d4"
+down_revision: Union[str, Sequence[str], None] = "a81d5e07c3f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    sync_promoted_columns(op.get_bind(), PROMOTED_METADATA_KEYS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    existing = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("log")}
+    for key in PROMOTED_METADATA_KEYS:
+        column_name = promoted_column_name(key)
+        op.execute(f"DROP INDEX IF EXISTS idx_log_{column_name}")
+        if column_name in existing:
+            op.execute(f"ALTER TABLE log DROP COLUMN {column_name}")
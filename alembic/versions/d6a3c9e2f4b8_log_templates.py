@@ -0,0 +1,149 @@
+"""log templates
+
+Revision ID: d6a3c9e2f4b8
+Revises: b2d8f4e6a1c3
+Create Date: 2026-10-18 16:42:09.551873
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from app.crud.partitions import PARTITION_PATTERN
+from app.utils.templates import template_miner
+
+# revision identifiers, used by Alembic.
+revision: str = "d6a3c9e2f4b8"
+down_revision: Union[str, Sequence[str], None] = "b2d8f4e6a1c3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+
+
+def log_tables() -> list[str]:
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    return ["log"] + sorted(name for name in tables if PARTITION_PATTERN.match(name))
+
+
+def allocate(templates):
+    # Миграция выполняется одна, поэтому id можно выдавать подряд
+    ids = {template.text: template.id for template in template_miner.templates.values()}
+    next_id = len(template_miner.templates) + 1
+    for template in templates:
+        if template.id is None:
+            if template.text not in ids:
+                ids[template.text] = next_id
+                next_id += 1
+            template.id = ids[template.text]
+
+
+def merge_duplicates(tables: list[str], stats: dict):
+    # После обобщения два шаблона могут прийти к одному тексту
+    bind = op.get_bind()
+    owners = {}
+    for template_id in sorted(stats):
+        owner = owners.setdefault(
+            template_miner.templates[template_id].text, template_id
+        )
+        if owner == template_id:
+            continue
+        for name in tables:
+            bind.execute(
+                sa.text(
+                    f"UPDATE {name} SET template_id = :owner "
+                    "WHERE template_id = :template_id"
+                ),
+                {"owner": owner, "template_id": template_id},
+            )
+        count, first_seen, last_seen = stats.pop(template_id)
+        owner_count, owner_first, owner_last = stats[owner]
+        stats[owner] = (
+            owner_count + count,
+            min(owner_first, first_seen),
+            max(owner_last, last_seen),
+        )
+
+
+def backfill(name: str, stats: dict):
+    bind = op.get_bind()
+    last_id = None
+    while True:
+        query = f"SELECT id, timestamp, message FROM {name}"
+        if last_id is not None:
+            query += f" WHERE id > {last_id}"
+        rows = bind.execute(sa.text(f"{query} ORDER BY id LIMIT {BATCH_SIZE}")).all()
+        if not rows:
+            return
+
+        templates = template_miner.add_messages([row.message for row in rows])
+        allocate(templates)
+        template_miner.register(templates)
+        bind.execute(
+            sa.text(f"UPDATE {name} SET template_id = :template_id WHERE id = :id"),
+            [
+                {"template_id": template.id, "id": row.id}
+                for row, template in zip(rows, templates)
+            ],
+        )
+        for row, template in zip(rows, templates):
+            count, first_seen, last_seen = stats.get(
+                template.id, (0, row.timestamp, row.timestamp)
+            )
+            stats[template.id] = (
+                count + 1,
+                min(first_seen, row.timestamp),
+                max(last_seen, row.timestamp),
+            )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "log_template",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("template", sa.Text(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("first_seen", sa.DateTime(), nullable=False),
+        sa.Column("last_seen", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("template"),
+    )
+
+    template_miner.clear()
+    stats = {}
+    tables = log_tables()
+    for name in tables:
+        op.add_column(name, sa.Column("template_id", sa.Integer(), nullable=True))
+        op.create_index(f"index_{name}_template", name, ["template_id"])
+        backfill(name, stats)
+    merge_duplicates(tables, stats)
+
+    if stats:
+        op.get_bind().execute(
+            sa.text(
+                "INSERT INTO log_template (id, template, count, first_seen, last_seen) "
+                "VALUES (:id, :template, :count, :first_seen, :last_seen)"
+            ),
+            [
+                {
+                    "id": template_id,
+                    "template": template_miner.templates[template_id].text,
+                    "count": count,
+                    "first_seen": first_seen,
+                    "last_seen": last_seen,
+                }
+                for template_id, (count, first_seen, last_seen) in stats.items()
+            ],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in log_tables():
+        op.drop_index(f"index_{name}_template", table_name=name)
+        op.execute(f"ALTER TABLE {name} DROP COLUMN template_id")
+    op.drop_table("log_template")
@@ -0,0 +1,70 @@
+"""log rollups
+
+Revision ID: e4b7c1d09a36
+Revises: c5e2b9f1a7d4
+Create Date: 2026-10-18 12:35:08.671932
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e4b7c1d09a36"
+down_revision: Union[str, Sequence[str], None] = "c5e2b9f1a7d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_BUCKETS = {
+    "log_rollup_minute": "%Y-%m-%d %H:%M:00.000000",
+    "log_rollup_hour": "%Y-%m-%d %H:00:00.000000",
+    "log_rollup_day": "%Y-%m-%d 00:00:00.000000",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if "log_hourly_count" in tables:
+        op.drop_table("log_hourly_count")
+
+    for table_name, bucket_format in ROLLUP_BUCKETS.items():
+        if table_name not in tables:
+            op.create_table(
+                table_name,
+                sa.Column("bucket", sa.DateTime(), nullable=False),
+                sa.Column("service", sa.String(length=100), nullable=False),
+                sa.Column("level", sa.String(length=20), nullable=False),
+                sa.Column("count", sa.Integer(), nullable=False),
+                sa.PrimaryKeyConstraint("bucket", "service", "level"),
+            )
+        op.execute(f"DELETE FROM {table_name}")
+        op.execute(
+            f"""
+            INSERT INTO {table_name} (bucket, service, level, count)
+            SELECT strftime('{bucket_format}', timestamp), service, level, count(*)
+            FROM log
+            GROUP BY 1, 2, 3
+            """
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        "log_hourly_count",
+        sa.Column("bucket", sa.DateTime(), nullable=False),
+        sa.Column("service", sa.String(length=100), nullable=False),
+        sa.Column("level", sa.String(length=20), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("bucket", "service", "level"),
+    )
+    op.execute(
+        "INSERT INTO log_hourly_count (bucket, service, level, count) "
+        "SELECT bucket, service, level, count FROM log_rollup_hour"
+    )
+    for table_name in ROLLUP_BUCKETS:
+        op.drop_table(table_name)
@@ -1,34 +1,49 @@
+import asyncio
+import csv
+import io
 import json
 import logging
+import zlib
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import orjson
+from fastapi import (APIRouter, Depends, HTTPException, Query, Request,
+                     Response, status)
+from fastapi.responses import (FileResponse, PlainTextResponse,
+                               StreamingResponse)
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import get_db
-from app.core.security import create_access_token, get_current_user
-from app.crud.log_crud import (create_log, create_user, delete_old_logs,
-                               get_logs_filtered, get_logs_stats,
-                               get_user_by_username, verify_password_hash)
+from app.config import (LOG_BATCH_MAX_SIZE, METRICS_ENABLED, PROFILING_ENABLED,
+                        TAIL_HEARTBEAT, get_db, get_read_db)
+from app.core.ingest import ingest_queue
+from app.core.metrics import record_rows, registry
+from app.core.profiling import ProfilerBusy, profiler
+from app.core.retention import retention_manager
+from app.core.security import Principal, create_access_token, get_current_user
+from app.core.tail import TailBusy, TailSubscription, tail_broker
+from app.crud.log_crud import (create_log, create_logs_bulk, create_user,
+                               get_logs_filtered, get_logs_stats, get_snippets,
+                               get_user_by_username, hash_password,
+                               stream_logs, verify_password_hash)
+from app.crud.metadata_filters import parse_metadata_filter
+from app.crud.templates import get_patterns
 from app.models.log_models import LogShema, UserLogin, UserRegister
-from app.schemas.log_schemas import User
+from app.schemas.log_schemas import LogDB
+from app.utils.cache import naive, response_cache
+from app.utils.logger import SAMPLED
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.passwords import PasswordHasherBusy
+from app.utils.serialization import (ORJSONResponse, checked_metadata, dumps,
+                                     embed_json)
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
-@router.get("/logs")
-async def get_log(
-    level: str | None = None,
-    start_time: str | None = None,
-    end_time: str | None = None,
-    service: str | None = None,
-    limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
-    session: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
+def parse_time_range(start_time: str | None, end_time: str | None, route: str):
     start_date = None
     end_date = None
 
@@ -40,129 +55,591 @@ async def get_log(
             date = end_time.replace("Z", "+00:00")
             end_date = datetime.fromisoformat(date)
     except ValueError:
-        logger.error("Использован неверный формат даты в /logs")
+        logger.error(f"Использован неверный формат даты в {route}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный формат даты. Используйте ISO 8601 (например, '2025-05-14T12:00:00Z').",
         )
+    return start_date, end_date
 
-    logger.debug(f"Пользователь {current_user.username} запрашивает логи")
-    db_logs, total = await get_logs_filtered(
-        session,
-        level=level,
-        service=service,
-        start_time=start_date,
-        end_time=end_date,
-        limit=limit,
-        offset=offset,
+
+def parse_metadata_filters(meta: list[str] | None):
+    try:
+        return [parse_metadata_filter(expression) for expression in meta or []]
+    except ValueError as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный фильтр по метаданным. Используйте формат "
+            "'ключ<оператор>значение', например 'status>=500' или 'user.id=42'.",
+        )
+
+
+async def cached_json(request: Request, start, end, build) -> Response:
+    key = response_cache.make_key(request.url.path, request.query_params.multi_items())
+    entry = response_cache.get(key)
+    cache_status = "HIT"
+    if entry is None:
+        cache_status = "MISS"
+        entry = response_cache.put(key, ORJSONResponse(await build()).body, start, end)
+
+    headers = {"ETag": entry.etag, "X-Cache": cache_status}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etags = {etag.strip() for etag in if_none_match.split(",")}
+        if "*" in etags or entry.etag in etags or f"W/{entry.etag}" in etags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user: Principal = Depends(get_current_user)):
+    return response_cache.stats()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Метрики отключены"
+        )
+    return Response(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
 
-    logs = []
-    for log in db_logs:
-        metadata = None
-        if log.metadata_json:
+
+def log_entry(log: LogDB, **extra) -> bytes:
+    entry = dumps(
+        {
+            "id": log.id,
+            "timestamp": naive(log.timestamp),
+            "level": log.level,
+            "service": log.service,
+            "message": log.message,
+            "template_id": log.template_id,
+            **extra,
+        }
+    )
+    return embed_json(entry, "metadata", checked_metadata(log.id, log.metadata_json))
+
+
+@router.get("/logs")
+async def get_log(
+    request: Request,
+    level: str | None = None,
+    start_time: str | None = None,
+    end_time: str | None = None,
+    service: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    count: str = Query("exact", pattern="^(exact|estimate|none)$"),
+    q: str | None = None,
+    order: str = Query("time", pattern="^(time|rank)$"),
+    highlight: bool = False,
+    meta: list[str] | None = Query(None),
+    session: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    start_date, end_date = parse_time_range(start_time, end_time, "/logs")
+    metadata = parse_metadata_filters(meta)
+    after = None
+
+    if cursor:
+        if q and order == "rank":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Курсор не поддерживается при сортировке по релевантности",
+            )
+        if offset:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Параметры cursor и offset нельзя использовать вместе",
+            )
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            logger.error(f"Передан некорректный курсор в /logs: {cursor!r}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Некорректный курсор",
+            )
+
+    async def build():
+        logger.debug("Пользователь %s запрашивает логи", current_user.username)
+        try:
+            db_logs, total = await get_logs_filtered(
+                session,
+                level=level,
+                service=service,
+                start_time=start_date,
+                end_time=end_date,
+                limit=limit,
+                offset=offset,
+                cursor=after,
+                count=count,
+                q=q,
+                order=order,
+                metadata=metadata,
+            )
+            snippets = {}
+            if q and highlight:
+                snippets = await get_snippets(session, q, [log.id for log in db_logs])
+        except OperationalError as e:
+            if not q:
+                raise
+            logger.error(f"Некорректный поисковый запрос {q!r}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Некорректный поисковый запрос",
+            )
+
+        if q and highlight:
+            logs = [log_entry(log, snippet=snippets.get(log.id)) for log in db_logs]
+        else:
+            logs = [log_entry(log) for log in db_logs]
+
+        next_cursor = None
+        if len(db_logs) == limit and not (q and order == "rank"):
+            next_cursor = encode_cursor(db_logs[-1].timestamp, db_logs[-1].id)
+
+        record_rows(len(logs))
+        logger.info(
+            "Пользователь %s получил %d записей (всего по фильтру: %s)",
+            current_user.username,
+            len(logs),
+            total,
+            extra=SAMPLED,
+        )
+        page = dumps({"total": total, "next_cursor": next_cursor})
+        return embed_json(page, "logs", b"[%s]" % b",".join(logs))
+
+    return await cached_json(request, start_date, end_date, build)
+
+
+async def tail_events(request: Request, subscription: TailSubscription):
+    try:
+        while True:
             try:
-                metadata = json.loads(log.metadata_json)
-            except json.JSONDecodeError:
+                row = await asyncio.wait_for(subscription.queue.get(), TAIL_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+
+            dropped = subscription.take_dropped()
+            if dropped:
                 logger.warning(
-                    f"Некорректный JSON в логе ID={log.id}: {log.metadata_json!r}"
+                    f"Подписчик живого хвоста не успевает читать, пропущено {dropped} логов"
                 )
-                metadata = None
-        logs.append(
+                yield f"event: dropped\ndata: {json.dumps({'dropped': dropped})}\n\n"
+            entry = log_entry(LogDB(**row)).decode()
+            yield f"id: {row['id']}\nevent: log\ndata: {entry}\n\n"
+    finally:
+        tail_broker.unsubscribe(subscription)
+
+
+@router.get("/logs/tail")
+async def tail_logs(
+    request: Request,
+    level: str | None = None,
+    service: str | None = None,
+    q: str | None = None,
+    current_user: Principal = Depends(get_current_user),
+):
+    try:
+        subscription = tail_broker.subscribe(level, service, q)
+    except TailBusy:
+        logger.warning(
+            f"Пользователю {current_user.username} отказано в живом хвосте: "
+            f"достигнут лимит подписчиков"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Слишком много подписчиков живого хвоста, повторите позже",
+            headers={"Retry-After": "5"},
+        )
+
+    logger.debug("Пользователь %s подписался на живой хвост", current_user.username)
+    return StreamingResponse(
+        tail_events(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+EXPORT_COLUMNS = ["id", "timestamp", "level", "service", "message", "metadata"]
+
+
+def format_ndjson(rows) -> str:
+    lines = []
+    for row in rows:
+        line = json.dumps(
             {
-                "id": log.id,
-                "timestamp": log.timestamp.isoformat() + "Z",
-                "level": log.level,
-                "service": log.service,
-                "message": log.message,
-                "metadata": metadata,
-            }
+                "id": row.id,
+                "timestamp": row.timestamp.isoformat() + "Z",
+                "level": row.level,
+                "service": row.service,
+                "message": row.message,
+            },
+            ensure_ascii=False,
         )
+        metadata = checked_metadata(row.id, row.metadata_json)
+        lines.append(f'{line[:-1]}, "metadata": {metadata or "null"}}}\n')
+    return "".join(lines)
+
+
+def format_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [
+                row.id,
+                row.timestamp.isoformat() + "Z",
+                row.level,
+                row.service,
+                row.message,
+                row.metadata_json or "",
+            ]
+        )
+    return buffer.getvalue()
+
+
+async def export_text(chunks, export_format: str):
+    if export_format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\n"
+        async for rows in chunks:
+            record_rows(len(rows))
+            yield format_csv(rows)
+    else:
+        async for rows in chunks:
+            record_rows(len(rows))
+            yield format_ndjson(rows)
+
+
+async def export_chunks(chunks, export_format: str, compress: bool):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    async for text in export_text(chunks, export_format):
+        data = text.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@router.get("/logs/export")
+async def export_logs(
+    level: str | None = None,
+    start_time: str | None = None,
+    end_time: str | None = None,
+    service: str | None = None,
+    q: str | None = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    meta: list[str] | None = Query(None),
+    session: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    start_date, end_date = parse_time_range(start_time, end_time, "/logs/export")
+    metadata = parse_metadata_filters(meta)
+
+    chunks = stream_logs(
+        session.bind,
+        level=level,
+        service=service,
+        start_time=start_date,
+        end_time=end_date,
+        q=q,
+        metadata=metadata,
+    )
+    filename = f"logs.{format}" + (".gz" if gzip else "")
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    if gzip:
+        media_type = "application/gzip"
 
     logger.info(
-        f"Пользователь {current_user.username} получил {len(logs)} записей (всего по фильтру: {total})"
+        "Пользователь %s выгружает логи в формате %s "
+        "(gzip=%s, level=%s, service=%s, start=%s, end=%s)",
+        current_user.username,
+        format,
+        gzip,
+        level,
+        service,
+        start_time,
+        end_time,
+        extra=SAMPLED,
+    )
+    return StreamingResponse(
+        export_chunks(chunks, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    return {"logs": logs, "total": total}
 
 
 @router.get("/stats")
 async def get_stats(
-    session: AsyncSession = Depends(get_db),
+    request: Request,
+    session: AsyncSession = Depends(get_read_db),
     start_time: str | None = None,
     end_time: str | None = None,
+    level: str | None = None,
     service: str | None = None,
-    group_by: str | None = Query(None, pattern="^(hour|day|level|service)$"),
-    current_user: User = Depends(get_current_user),
+    group_by: str | None = Query(
+        None,
+        pattern="^(minute|hour|day|level|service|template)"
+        "(,(minute|hour|day|level|service|template))*$",
+    ),
+    interval: str | None = None,
+    fill: bool = False,
+    top: int | None = Query(None, ge=1),
+    meta: list[str] | None = Query(None),
+    current_user: Principal = Depends(get_current_user),
 ):
     logger.debug(
-        f"Пользователь '{current_user.username}' запрашивает статистику (group_by={group_by})"
+        "Пользователь '%s' запрашивает статистику (group_by=%s, interval=%s)",
+        current_user.username,
+        group_by,
+        interval,
     )
 
-    start_date = None
-    end_date = None
+    start_date, end_date = parse_time_range(start_time, end_time, "/stats")
+    metadata = parse_metadata_filters(meta)
 
-    try:
-        if start_time:
-            date = start_time.replace("Z", "+00:00")
-            start_date = datetime.fromisoformat(date)
-        if end_time:
-            date = end_time.replace("Z", "+00:00")
-            end_date = datetime.fromisoformat(date)
-    except ValueError:
-        logger.error("Использован неверный формат даты в /stats")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Неверный формат даты. Используйте ISO 8601.",
-        )
+    async def build():
+        try:
+            stats = await get_logs_stats(
+                session,
+                start_time=start_date,
+                end_time=end_date,
+                level=level,
+                service=service,
+                group_by=group_by,
+                metadata=metadata,
+                interval=interval,
+                fill=fill,
+                top=top,
+            )
+        except ValueError as e:
+            logger.error(f"Некорректные параметры статистики: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e),
+            )
+        record_rows(len(stats))
+        logger.info("Статистика получена: %d групп", len(stats), extra=SAMPLED)
+        return {"stats": stats}
 
-    try:
-        stats = await get_logs_stats(
+    return await cached_json(request, start_date, end_date, build)
+
+
+@router.get("/patterns")
+async def get_message_patterns(
+    request: Request,
+    session: AsyncSession = Depends(get_read_db),
+    start_time: str | None = None,
+    end_time: str | None = None,
+    level: str | None = None,
+    service: str | None = None,
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_user),
+):
+    logger.debug(
+        "Пользователь '%s' запрашивает шаблоны сообщений", current_user.username
+    )
+    start_date, end_date = parse_time_range(start_time, end_time, "/patterns")
+
+    async def build():
+        patterns = await get_patterns(
             session,
             start_time=start_date,
             end_time=end_date,
+            level=level,
             service=service,
-            group_by=group_by,
+            limit=limit,
         )
-    except ValueError as e:
-        logger.error(f"Ошибка парсинга даты: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Неверный формат даты. Используйте ISO 8601.",
-        )
-    logger.info(f"Статистика получена: {len(stats)} групп")
-    return {"stats": stats}
+        record_rows(len(patterns))
+        logger.info("Найдено %d шаблонов сообщений", len(patterns), extra=SAMPLED)
+        return {
+            "patterns": [
+                {
+                    **pattern,
+                    "first_seen": pattern["first_seen"].isoformat() + "Z",
+                    "last_seen": pattern["last_seen"].isoformat() + "Z",
+                }
+                for pattern in patterns
+            ]
+        }
+
+    return await cached_json(request, start_date, end_date, build)
 
 
 @router.post("/add_log")
 async def add_log(
     log: LogShema,
+    response: Response,
+    wait: bool = False,
     session: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
-    save_log = await create_log(session, log)
-    logger.debug(
-        f"Пользователь {current_user.username} добавил лог (ID: {save_log.id})"
-    )
-    return {"status": "Лог добавлен", "id": save_log.id}
+    if not ingest_queue.running:
+        save_log = await create_log(session, log)
+        logger.debug(
+            "Пользователь %s добавил лог (ID: %s)", current_user.username, save_log.id
+        )
+        return {"status": "Лог добавлен", "id": save_log.id}
 
+    try:
+        future = ingest_queue.put(log, wait=wait)
+    except asyncio.QueueFull:
+        logger.warning(
+            f"Очередь приёма переполнена, лог от {current_user.username} отклонён"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Очередь приёма логов переполнена, повторите позже",
+            headers={"Retry-After": "1"},
+        )
 
-@router.post("/auth/register")
-async def register_user(log: UserRegister, session: AsyncSession = Depends(get_db)):
-    user = await get_user_by_username(session, log.username)
-    if user:
+    if future is None:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"status": "Лог принят в очередь"}
+
+    try:
+        log_id = await future
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Не удалось сохранить лог",
+        )
+    logger.debug("Пользователь %s добавил лог (ID: %s)", current_user.username, log_id)
+    return {"status": "Лог добавлен", "id": log_id}
+
+
+def parse_batch_body(body: bytes, content_type: str):
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(orjson.loads(line))
+            except json.JSONDecodeError as e:
+                items.append(e)
+        return items
+
+    try:
+        items = orjson.loads(body)
+    except json.JSONDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Тело запроса должно быть JSON-массивом или NDJSON",
+        )
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Тело запроса должно быть JSON-массивом или NDJSON",
+        )
+    return items
+
+
+@router.post("/logs/batch")
+async def add_logs_batch(
+    request: Request,
+    session: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    items = parse_batch_body(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    if len(items) > LOG_BATCH_MAX_SIZE:
         logger.warning(
-            f"Попытка регистрации существующего пользователя: {log.username}"
+            f"Пользователь {current_user.username} прислал слишком большой пакет: {len(items)}"
         )
         raise HTTPException(
-            status_code=400, detail="Пользователь с таким именем уже существует"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Максимальный размер пакета: {LOG_BATCH_MAX_SIZE} записей",
         )
-    save_user = await create_user(session, log)
+
+    valid_logs = []
+    errors = []
+    for index, item in enumerate(items):
+        if isinstance(item, json.JSONDecodeError):
+            errors.append({"index": index, "errors": [{"msg": "Некорректный JSON"}]})
+            continue
+        try:
+            valid_logs.append(LogShema.model_validate(item))
+        except ValidationError as e:
+            errors.append(
+                {
+                    "index": index,
+                    "errors": [
+                        {"loc": list(err["loc"]), "msg": err["msg"]}
+                        for err in e.errors()
+                    ],
+                }
+            )
+
+    ids = await create_logs_bulk(session, valid_logs)
+
+    logger.info(
+        "Пользователь %s добавил пакет логов: %d принято, %d отклонено",
+        current_user.username,
+        len(ids),
+        len(errors),
+        extra=SAMPLED,
+    )
+    return {
+        "status": "Пакет обработан",
+        "inserted": len(ids),
+        "ids": ids,
+        "errors": errors,
+    }
+
+
+def password_hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Сервис аутентификации перегружен, повторите позже",
+        headers={"Retry-After": "1"},
+    )
+
+
+def existing_user(username: str) -> HTTPException:
+    logger.warning(f"Попытка регистрации существующего пользователя: {username}")
+    return HTTPException(
+        status_code=400, detail="Пользователь с таким именем уже существует"
+    )
+
+
+@router.post("/auth/register")
+async def register_user(
+    log: UserRegister,
+    read_session: AsyncSession = Depends(get_read_db),
+    session: AsyncSession = Depends(get_db),
+):
+    user = await get_user_by_username(read_session, log.username)
+    if user:
+        raise existing_user(log.username)
+    try:
+        hashed_password = await hash_password(log.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
+    # Соединение писателя берётся только на INSERT, а не на время хеширования
+    try:
+        save_user = await create_user(session, log, hashed_password)
+    except IntegrityError:
+        await session.rollback()
+        raise existing_user(log.username)
     logger.info(f"Пользователь {log.username} успешно зарегистрирован")
     return {"status": "Пользователь зарегистрирован", "id": save_user.id}
 
 
 @router.post("/auth/login")
-async def login_user(log: UserLogin, session: AsyncSession = Depends(get_db)):
+async def login_user(log: UserLogin, session: AsyncSession = Depends(get_read_db)):
     user = await get_user_by_username(session, log.username)
     if not user:
         logger.warning(f"Попытка входа несуществующего пользователя: {log.username}")
@@ -171,7 +648,11 @@ async def login_user(log: UserLogin, session: AsyncSession = Depends(get_db)):
             detail="Неверный логин или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    if not await verify_password_hash(log.password, user.password):
+    try:
+        password_valid = await verify_password_hash(log.password, user.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
+    if not password_valid:
         logger.warning(f"Неверный пароль для пользователя: {log.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -180,44 +661,177 @@ async def login_user(log: UserLogin, session: AsyncSession = Depends(get_db)):
         )
 
     access_token = create_access_token(user_id=user.id, username=user.username)
-    logger.debug(f"Сгенерирован токен для пользователя: {user.username}")
+    logger.debug("Сгенерирован токен для пользователя: %s", user.username)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@router.delete("/logs")
-async def delete_logs(
-    before: str,
-    session: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    if current_user.username != "admin":
+def require_admin(current_user: Principal, action: str):
+    if current_user.role != "admin":
         logger.warning(
-            f"Пользователь '{current_user.username}' попытался удалить логи без прав"
+            f"Пользователь '{current_user.username}' попытался {action} без прав"
         )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Только администратор может удалять логи",
+            detail=f"Только администратор может {action}",
+        )
+
+
+def get_retention_job(job_id: str):
+    job = retention_manager.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Задача удаления {job_id} не найдена",
         )
+    return job
 
+
+def parse_before(before: str) -> datetime:
     try:
         if before.endswith("Z"):
             date_str = before.replace("Z", "+00:00")
         else:
             date_str = before
-        before_date = datetime.fromisoformat(date_str)
+        return datetime.fromisoformat(date_str)
     except ValueError:
         logger.error(f"Неверный формат даты 'before': {before}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный формат даты 'before'. Используйте ISO 8601 (например, '2025-05-14T00:00:00Z').",
         )
+
+
+@router.delete("/logs")
+async def delete_logs(
+    before: str,
+    response: Response,
+    service: str | None = None,
+    wait: bool = False,
+    session: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    require_admin(current_user, "удалить логи")
+    before_date = parse_before(before)
     logger.debug(
         f"Администратор {current_user.username} запрашивает удаление логов до {before}"
     )
 
-    deleted_count = await delete_old_logs(session, before_date)
+    job = retention_manager.submit(session.bind, before_date, service)
+    if not wait:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return job.to_dict()
+
+    await asyncio.shield(job.task)
+    if job.status == "failed":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Не удалось удалить логи",
+        )
+
+    logger.info(
+        f"Удалено {job.deleted} логов по запросу администратора {current_user.username}"
+    )
+    return {"deleted": job.deleted, "job_id": job.id, "status": job.status}
+
+
+@router.post("/logs/archive")
+async def archive_logs(
+    before: str,
+    response: Response,
+    wait: bool = False,
+    session: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    require_admin(current_user, "архивировать логи")
+    before_date = parse_before(before)
+    logger.debug(
+        f"Администратор {current_user.username} запрашивает архивирование логов до {before}"
+    )
+
+    job = retention_manager.submit(session.bind, before_date, kind="archive")
+    if not wait:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return job.to_dict()
+
+    await asyncio.shield(job.task)
+    if job.status == "failed":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Не удалось архивировать логи",
+        )
 
     logger.info(
-        f"Удалено {deleted_count} логов по запросу администратора {current_user.username}"
+        f"В архив перенесено {job.deleted} логов по запросу администратора {current_user.username}"
     )
-    return {"deleted": deleted_count}
\ No newline at end of file
+    return {"archived": job.deleted, "job_id": job.id, "status": job.status}
+
+
+@router.get("/logs/retention/jobs")
+async def list_retention_jobs(current_user: Principal = Depends(get_current_user)):
+    require_admin(current_user, "просмотреть задачи удаления")
+    return [job.to_dict() for job in retention_manager.jobs.values()]
+
+
+@router.get("/logs/retention/jobs/{job_id}")
+async def get_retention_job_status(
+    job_id: str, current_user: Principal = Depends(get_current_user)
+):
+    require_admin(current_user, "просмотреть задачу удаления")
+    return get_retention_job(job_id).to_dict()
+
+
+@router.delete("/logs/retention/jobs/{job_id}")
+async def cancel_retention_job(
+    job_id: str, current_user: Principal = Depends(get_current_user)
+):
+    require_admin(current_user, "отменить задачу удаления")
+    get_retention_job(job_id)
+    return retention_manager.cancel(job_id).to_dict()
+
+
+def require_profiling():
+    if not PROFILING_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Профилирование отключено"
+        )
+
+
+@router.post("/profiles/sample")
+async def sample_process(
+    seconds: float = Query(5, gt=0),
+    current_user: Principal = Depends(get_current_user),
+):
+    require_profiling()
+    require_admin(current_user, "снять профиль процесса")
+    if seconds > profiler.max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Длительность профилирования не больше {profiler.max_seconds}с",
+        )
+    try:
+        name, session = await profiler.sample_process(seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(
+        session.sampler.collapsed(), headers={"X-Profile-Id": name}
+    )
+
+
+@router.get("/profiles")
+async def list_profiles(current_user: Principal = Depends(get_current_user)):
+    require_profiling()
+    require_admin(current_user, "просмотреть профили")
+    return await asyncio.to_thread(profiler.list)
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: Principal = Depends(get_current_user)):
+    require_profiling()
+    require_admin(current_user, "скачать профиль")
+    path = profiler.path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Профиль {profile_id} не найден",
+        )
+    return FileResponse(path, filename=profile_id)
@@ -1,23 +1,206 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
                                     create_async_engine)
 
 from app.schemas.log_schemas import Base
 
-ASYNC_DATABASE_URL = "sqlite+aiosqlite:///test.db"
+load_dotenv()
+
+ASYNC_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///test.db")
+
+SYNC_DRIVERS = {"sqlite+aiosqlite": "sqlite", "postgresql+asyncpg": "postgresql"}
+
+
+def sync_database_url(url: str) -> str:
+    url = make_url(url)
+    url = url.set(drivername=SYNC_DRIVERS.get(url.drivername, url.drivername))
+    return url.render_as_string(hide_password=False)
+
+
+SYNC_DATABASE_URL = os.getenv("SYNC_DATABASE_URL") or sync_database_url(
+    ASYNC_DATABASE_URL
+)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", "268435456")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+}
+SQLITE_MAINTENANCE_INTERVAL = float(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "3600"))
+SQLITE_VACUUM_PAGES = int(os.getenv("SQLITE_VACUUM_PAGES", "1000"))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "app/logs/app.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+LOG_BATCH_MAX_SIZE = int(os.getenv("LOG_BATCH_MAX_SIZE", "10000"))
+
+PROMOTED_METADATA_KEYS = [
+    key.strip()
+    for key in os.getenv("PROMOTED_METADATA_KEYS", "").split(",")
+    if key.strip()
+]
+
+INGEST_QUEUE_ENABLED = os.getenv("INGEST_QUEUE_ENABLED", "true").lower() == "true"
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.05"))
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+RESPONSE_CACHE_OPEN_TTL = float(os.getenv("RESPONSE_CACHE_OPEN_TTL", "5"))
+RESPONSE_CACHE_CLOSED_TTL = float(os.getenv("RESPONSE_CACHE_CLOSED_TTL", "3600"))
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))
+
+RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", "5000"))
+RETENTION_CHUNK_PAUSE = float(os.getenv("RETENTION_CHUNK_PAUSE", "0.05"))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_SERVICE_DAYS = {
+    service.strip(): int(days)
+    for service, _, days in (
+        item.partition(":")
+        for item in os.getenv("RETENTION_SERVICE_DAYS", "").split(",")
+        if item.strip()
+    )
+}
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_SEGMENT_ROWS = int(os.getenv("ARCHIVE_SEGMENT_ROWS", "50000"))
 
-SYNC_DATABASE_URL = "sqlite:///test.db"
+TEMPLATE_TREE_DEPTH = int(os.getenv("TEMPLATE_TREE_DEPTH", "4"))
+TEMPLATE_SIMILARITY = float(os.getenv("TEMPLATE_SIMILARITY", "0.4"))
+TEMPLATE_MAX_CHILDREN = int(os.getenv("TEMPLATE_MAX_CHILDREN", "100"))
 
-engine = create_async_engine(ASYNC_DATABASE_URL)
+TAIL_QUEUE_SIZE = int(os.getenv("TAIL_QUEUE_SIZE", "1000"))
+TAIL_MAX_SUBSCRIBERS = int(os.getenv("TAIL_MAX_SUBSCRIBERS", "100"))
+TAIL_HEARTBEAT = float(os.getenv("TAIL_HEARTBEAT", "15"))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "0"))
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+LOG_PARTITION_PERIOD = os.getenv("LOG_PARTITION_PERIOD", "").lower() or None
+
+
+def is_sqlite_file(url: str) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def engine_options(url: str, readonly: bool = False) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        if not is_sqlite_file(url):
+            return {}
+        # SQLite допускает одного писателя, поэтому запись идёт через одно
+        # соединение, а чтение — через отдельный пул
+        return {
+            "pool_size": DB_POOL_SIZE if readonly else 1,
+            "max_overflow": DB_MAX_OVERFLOW if readonly else 0,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "connect_args": {"cached_statements": DB_STATEMENT_CACHE_SIZE},
+        }
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+    }
+
+
+def sqlite_pragmas(readonly: bool):
+    def on_connect(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        if not readonly:
+            # Действует только для новой базы, существующей нужен VACUUM
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return on_connect
+
+
+def create_engine(url: str, readonly: bool = False):
+    db_engine = create_async_engine(url, **engine_options(url, readonly))
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", sqlite_pragmas(readonly))
+    return db_engine
+
+
+engine = create_engine(ASYNC_DATABASE_URL)
+read_engine = (
+    create_engine(ASYNC_DATABASE_URL, readonly=True)
+    if is_sqlite_file(ASYNC_DATABASE_URL)
+    else engine
+)
 async_session = async_sessionmaker(
     bind=engine, expire_on_commit=False, class_=AsyncSession
 )
+async_read_session = async_sessionmaker(
+    bind=read_engine, expire_on_commit=False, class_=AsyncSession
+)
+
 
+async def init_db(db_engine=engine):
+    from app.crud.archive import archive_catalog
+    from app.crud.metadata_filters import sync_promoted_columns
+    from app.crud.partitions import partition_router
+    from app.crud.services import load_services
+    from app.crud.templates import load_templates
 
-async def init_db():
-    async with engine.begin() as conn:
+    async with db_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(sync_promoted_columns)
+        await conn.run_sync(partition_router.sync)
+        await conn.run_sync(load_services)
+        await conn.run_sync(load_templates)
+    archive_catalog.load()
 
 
 async def get_db():
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+async def get_read_db():
+    async with async_read_session() as session:
+        yield session
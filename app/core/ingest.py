@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from app.config import (INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL,
+                        INGEST_QUEUE_SIZE, async_session)
+from app.crud.log_crud import create_logs_bulk
+from app.models.log_models import LogShema
+from app.utils.tasks import create_background_task
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        session_factory,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+    ):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._accepting = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._accepting = True
+        self._task = create_background_task(self._run())
+        logger.info(
+            f"Очередь приёма логов запущена (размер {self.max_size}, "
+            f"пакет {self.batch_size}, интервал {self.flush_interval}с)"
+        )
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._accepting = False
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("Очередь приёма логов остановлена, все записи сброшены в БД")
+
+    def put(self, log: LogShema, wait: bool = False) -> asyncio.Future | None:
+        if not self._accepting:
+            raise asyncio.QueueFull()
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._queue.put_nowait((log, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: list):
+        try:
+            async with self.session_factory() as session:
+                ids = await create_logs_bulk(session, [log for log, _ in batch])
+        except Exception as e:
+            logger.error(f"Не удалось записать пакет из {len(batch)} логов: {e}")
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), log_id in zip(batch, ids):
+            if future is not None and not future.done():
+                future.set_result(log_id)
+        logger.debug("Очередь записала пакет из %d логов", len(ids))
+
+
+ingest_queue = IngestQueue(
+    async_session,
+    max_size=INGEST_QUEUE_SIZE,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL,
+)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+
+from app.config import (SQLITE_MAINTENANCE_INTERVAL, SQLITE_VACUUM_PAGES,
+                        engine, is_sqlite_file)
+from app.utils.tasks import create_background_task
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_VACUUM = 2
+
+
+class SqliteMaintenance:
+    def __init__(self, interval: float = 3600, vacuum_pages: int = 1000):
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self._scheduler: asyncio.Task | None = None
+
+    async def run_once(self, bind=engine) -> dict:
+        async with bind.connect() as conn:
+            await conn.exec_driver_sql("ANALYZE")
+            freelist = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+            auto_vacuum = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+            await conn.commit()
+            if auto_vacuum == INCREMENTAL_VACUUM and freelist:
+                # Через обычный курсор прагма освобождает только одну страницу
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({self.vacuum_pages});"
+                )
+            # Контрольная точка последней, чтобы в неё попали ANALYZE и вакуум
+            busy, wal_pages, checkpointed = (
+                await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            ).one()
+
+        result = {
+            "checkpoint_busy": bool(busy),
+            "wal_pages": wal_pages,
+            "checkpointed_pages": checkpointed,
+            "free_pages": freelist,
+            "vacuumed": auto_vacuum == INCREMENTAL_VACUUM and bool(freelist),
+        }
+        logger.info(f"Обслуживание SQLite выполнено: {result}")
+        return result
+
+    async def _schedule(self, bind):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once(bind)
+            except Exception as e:
+                logger.error(f"Ошибка при обслуживании SQLite: {e}")
+
+    async def start(self, bind=engine):
+        if self._scheduler is not None or self.interval <= 0:
+            return
+        if not is_sqlite_file(str(bind.url)):
+            return
+        self._scheduler = create_background_task(self._schedule(bind))
+        logger.info(f"Обслуживание SQLite запущено, интервал {self.interval}с")
+
+    async def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            await asyncio.gather(self._scheduler, return_exceptions=True)
+            self._scheduler = None
+
+
+sqlite_maintenance = SqliteMaintenance(
+    interval=SQLITE_MAINTENANCE_INTERVAL, vacuum_pages=SQLITE_VACUUM_PAGES
+)
@@ -0,0 +1,229 @@
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+
+from app.config import SLOW_REQUEST_THRESHOLD, engine, read_engine
+from app.core.ingest import ingest_queue
+from app.core.tail import tail_broker
+from app.utils.metrics import (COUNT_BUCKETS, SIZE_BUCKETS, Counter, Gauge,
+                               Histogram, MetricsRegistry)
+
+logger = logging.getLogger(__name__)
+
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+MAX_SLOW_STATEMENTS = 5
+EXPLAINABLE = ("select", "with")
+LABELS = ("method", "route")
+# Без отдельного читающего движка у SQLite есть только соединение писателя
+EXPLAIN_ENGINE = (
+    None if read_engine is engine and engine.dialect.name == "sqlite" else read_engine
+)
+
+
+@dataclass
+class QueryRecord:
+    duration: float
+    statement: str
+    parameters: object
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_time: float = 0.0
+    rows: int = 0
+    statements: list[QueryRecord] | None = None
+
+
+current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_stats", default=None
+)
+
+registry = MetricsRegistry()
+requests_total = registry.register(
+    Counter("http_requests_total", "Число HTTP-запросов", LABELS + ("status",))
+)
+request_duration = registry.register(
+    Histogram("http_request_duration_seconds", "Время обработки запроса", LABELS)
+)
+request_queries = registry.register(
+    Histogram(
+        "http_request_db_queries", "Число SQL-запросов на запрос", LABELS, COUNT_BUCKETS
+    )
+)
+request_db_duration = registry.register(
+    Histogram(
+        "http_request_db_duration_seconds", "Время SQL-запросов на запрос", LABELS
+    )
+)
+response_rows = registry.register(
+    Histogram("http_response_rows", "Число строк в ответе", LABELS, ROW_BUCKETS)
+)
+request_size = registry.register(
+    Histogram("http_request_size_bytes", "Размер тела запроса", LABELS, SIZE_BUCKETS)
+)
+response_size = registry.register(
+    Histogram("http_response_size_bytes", "Размер тела ответа", LABELS, SIZE_BUCKETS)
+)
+registry.register(
+    Gauge(
+        "log_ingest_queue_depth", "Логов в очереди приёма", lambda: ingest_queue.qsize()
+    )
+)
+registry.register(
+    Gauge(
+        "log_tail_subscribers",
+        "Подписчиков живого хвоста логов",
+        lambda: len(tail_broker.subscribers),
+    )
+)
+
+
+def record_rows(count: int):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.rows += count
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        context.metrics_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    started = getattr(context, "metrics_started", None)
+    if stats is None or started is None:
+        return
+    duration = time.perf_counter() - started
+    stats.queries += 1
+    stats.db_time += duration
+    if stats.statements is not None:
+        stats.statements.append(
+            QueryRecord(
+                duration,
+                statement,
+                parameters[0] if executemany else parameters,
+            )
+        )
+
+
+def install_query_hooks():
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+async def explain(record: QueryRecord, engine: AsyncEngine | None) -> str | None:
+    if engine is None or not record.statement.lstrip().lower().startswith(EXPLAINABLE):
+        return None
+    sqlite = engine.dialect.name == "sqlite"
+    prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+    try:
+        # Планы снимаются только через читающий движок: единственное
+        # соединение писателя нельзя занимать ради диагностики
+        async with engine.connect() as conn:
+            result = await conn.exec_driver_sql(
+                prefix + record.statement, record.parameters
+            )
+            rows = result.all()
+    except Exception as e:
+        return f"план недоступен: {e}"
+    return "; ".join(str(row[-1] if sqlite else row[0]) for row in rows)
+
+
+async def log_slow_request(
+    method: str,
+    path: str,
+    elapsed: float,
+    stats: RequestStats,
+    engine: AsyncEngine | None,
+):
+    logger.warning(
+        f"Медленный запрос {method} {path}: {elapsed * 1000:.1f} мс, "
+        f"SQL-запросов {stats.queries}, в БД {stats.db_time * 1000:.1f} мс"
+    )
+    slowest = sorted(stats.statements, key=lambda record: -record.duration)
+    for record in slowest[:MAX_SLOW_STATEMENTS]:
+        plan = await explain(record, engine)
+        logger.warning(
+            f"SQL за {record.duration * 1000:.1f} мс: {record.statement}"
+            + (f"\nПлан: {plan}" if plan else "")
+        )
+
+
+class MetricsMiddleware:
+    def __init__(
+        self,
+        app,
+        slow_threshold: float = SLOW_REQUEST_THRESHOLD,
+        explain_engine: AsyncEngine | None = EXPLAIN_ENGINE,
+    ):
+        self.app = app
+        self.slow_threshold = slow_threshold
+        self.explain_engine = explain_engine
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        slow_log = self.slow_threshold > 0
+        stats = RequestStats(statements=[] if slow_log else None)
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        response_status = 500
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_status
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                db_ms = stats.db_time * 1000
+                total_ms = (time.perf_counter() - started) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Query-Time", f"{db_ms:.2f}")
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={db_ms:.2f};desc="{stats.queries} SQL", '
+                    f"total;dur={total_ms:.2f}",
+                )
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            # Непойманные пути сводятся в одну метку, чтобы не раздувать метрики
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            requests_total.inc(*labels, response_status)
+            request_duration.observe(elapsed, *labels)
+            request_queries.observe(stats.queries, *labels)
+            request_db_duration.observe(stats.db_time, *labels)
+            response_rows.observe(stats.rows, *labels)
+            request_size.observe(sizes["request"], *labels)
+            response_size.observe(sizes["response"], *labels)
+            if slow_log and elapsed * 1000 >= self.slow_threshold:
+                await log_slow_request(
+                    scope["method"],
+                    scope["path"],
+                    elapsed,
+                    stats,
+                    self.explain_engine,
+                )
@@ -0,0 +1,210 @@
+import asyncio
+import cProfile
+import logging
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from fastapi import HTTPException
+from starlette.datastructures import MutableHeaders
+
+from app.config import (PROFILE_DIR, PROFILE_INTERVAL, PROFILE_MAX_SECONDS,
+                        get_read_db)
+from app.core.security import Principal, get_current_user
+from app.utils.profiling import StackSampler
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+SUFFIXES = {"sample": ".collapsed.txt", "cprofile": ".prof"}
+NAME_PATTERN = re.compile(r"[\w-]+\.(collapsed\.txt|prof)")
+PROFILE_HEADER = b"x-profile"
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class ProfileSession:
+    def __init__(self, mode: str, interval: float, thread_id: int | None = None):
+        self.mode = mode
+        self.sampler: StackSampler | None = None
+        self.profile: cProfile.Profile | None = None
+        if mode == "cprofile":
+            self.profile = cProfile.Profile()
+        else:
+            self.sampler = StackSampler(interval, thread_id)
+
+    def start(self):
+        if self.profile is not None:
+            self.profile.enable()
+        else:
+            self.sampler.start()
+
+    async def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+        else:
+            await asyncio.to_thread(self.sampler.stop)
+
+    def write(self, path: Path):
+        if self.profile is not None:
+            self.profile.dump_stats(path)
+        else:
+            path.write_text(self.sampler.collapsed())
+
+
+class Profiler:
+    def __init__(self, directory: str, interval: float = 0.005, max_seconds=60):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.max_seconds = max_seconds
+        # Профилировщики одного процесса мешают друг другу, поэтому не больше одного
+        self.active = False
+
+    def new_name(self, mode: str) -> str:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        return f"{stamp}-{uuid.uuid4().hex[:8]}{SUFFIXES[mode]}"
+
+    def acquire(self):
+        if self.active:
+            raise ProfilerBusy("Профилирование уже выполняется")
+        self.active = True
+
+    def release(self):
+        self.active = False
+
+    async def save(self, name: str, session: ProfileSession):
+        def write():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            session.write(self.directory / name)
+
+        await asyncio.to_thread(write)
+
+    async def sample_process(self, seconds: float) -> tuple[str, ProfileSession]:
+        self.acquire()
+        session = ProfileSession("sample", self.interval)
+        try:
+            session.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                await session.stop()
+        finally:
+            self.release()
+
+        name = self.new_name("sample")
+        await self.save(name, session)
+        logger.info(
+            f"Профиль процесса за {seconds}с сохранён: {name} "
+            f"({session.sampler.samples} срезов)"
+        )
+        return name, session
+
+    def path(self, name: str) -> Path | None:
+        if not NAME_PATTERN.fullmatch(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+    def list(self) -> list[dict]:
+        if not self.directory.is_dir():
+            return []
+        profiles = []
+        for path in sorted(self.directory.iterdir(), reverse=True):
+            if not NAME_PATTERN.fullmatch(path.name):
+                continue
+            stat = path.stat()
+            profiles.append(
+                {
+                    "id": path.name,
+                    "size": stat.st_size,
+                    "created_at": datetime.fromtimestamp(
+                        stat.st_mtime, timezone.utc
+                    ).isoformat(),
+                }
+            )
+        return profiles
+
+
+def header(scope, name: bytes) -> str | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def current_principal(scope) -> Principal | None:
+    authorization = header(scope, b"authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    # Middleware выполняется до зависимостей FastAPI, поэтому сессию берёт сам,
+    # учитывая переопределения get_read_db в приложении
+    overrides = getattr(scope.get("app"), "dependency_overrides", {})
+    sessions = overrides.get(get_read_db, get_read_db)()
+    try:
+        return await get_current_user(token, await anext(sessions))
+    except HTTPException:
+        return None
+    finally:
+        await sessions.aclose()
+
+
+async def is_admin(scope) -> bool:
+    # То же правило, что и у require_admin: роль пользователя, а не имя из токена
+    principal = await current_principal(scope)
+    return principal is not None and principal.role == "admin"
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        # Без заголовка X-Profile запрос проходит мимо профилировщика
+        mode = header(scope, PROFILE_HEADER) if scope["type"] == "http" else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        mode = mode.lower()
+        if mode not in PROFILE_MODES:
+            mode = "sample"
+        if not await is_admin(scope):
+            logger.warning(f"Профилирование {scope['path']} запрошено без прав")
+            await self.app(scope, receive, send)
+            return
+        try:
+            self.profiler.acquire()
+        except ProfilerBusy:
+            logger.warning(f"Профилирование {scope['path']} пропущено: уже выполняется")
+            await self.app(scope, receive, send)
+            return
+
+        name = self.profiler.new_name(mode)
+        session = ProfileSession(mode, self.profiler.interval, threading.get_ident())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", name)
+            await send(message)
+
+        session.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await session.stop()
+            self.profiler.release()
+            await self.profiler.save(name, session)
+            logger.info(
+                f"Профиль запроса {scope['method']} {scope['path']} сохранён: {name}"
+            )
+
+
+profiler = Profiler(
+    PROFILE_DIR, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS
+)
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import uuid
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (ARCHIVE_AFTER_DAYS, ARCHIVE_SEGMENT_ROWS,
+                        RETENTION_CHUNK_PAUSE, RETENTION_CHUNK_SIZE,
+                        RETENTION_DAYS, RETENTION_INTERVAL,
+                        RETENTION_SERVICE_DAYS, engine)
+from app.crud.archive import archive_catalog
+from app.crud.log_crud import iter_archive_logs, iter_delete_old_logs
+from app.crud.rollups import aggregate_counts
+from app.utils.tasks import create_background_task
+
+logger = logging.getLogger(__name__)
+
+MAX_FINISHED_JOBS = 100
+
+JOB_KINDS = {"delete": "удаления", "archive": "архивирования"}
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class RetentionJob:
+    id: str
+    before: datetime
+    kind: str = "delete"
+    service: str | None = None
+    exclude_services: list[str] = field(default_factory=list)
+    status: str = "pending"
+    deleted: int = 0
+    estimated_total: int | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    error: str | None = None
+    cancel_requested: bool = False
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "cancelled", "failed")
+
+    def to_dict(self) -> dict:
+        rate = None
+        eta = None
+        if self.started_at is not None:
+            elapsed = (
+                (self.finished_at or utc_now()) - self.started_at
+            ).total_seconds()
+            if elapsed > 0:
+                rate = self.deleted / elapsed
+        if self.status == "running" and rate and self.estimated_total is not None:
+            eta = max(self.estimated_total - self.deleted, 0) / rate
+
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "before": self.before.isoformat(),
+            "service": self.service,
+            "exclude_services": self.exclude_services,
+            "deleted": self.deleted,
+            "estimated_total": self.estimated_total,
+            "rate_per_second": round(rate, 1) if rate is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+
+class RetentionManager:
+    def __init__(
+        self,
+        chunk_size: int = 5000,
+        chunk_pause: float = 0.05,
+        default_days: int = 0,
+        service_days: dict[str, int] | None = None,
+        interval: float = 3600,
+        archive_after_days: int = 0,
+        archive_chunk_size: int = 50000,
+    ):
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self.default_days = default_days
+        self.service_days = service_days or {}
+        self.interval = interval
+        self.archive_after_days = archive_after_days
+        self.archive_chunk_size = archive_chunk_size
+        self.jobs: dict[str, RetentionJob] = {}
+        self._scheduler: asyncio.Task | None = None
+
+    @property
+    def has_policy(self) -> bool:
+        return bool(self.default_days or self.service_days or self.archive_after_days)
+
+    def submit(
+        self,
+        bind,
+        before: datetime,
+        service: str | None = None,
+        exclude_services: list[str] = (),
+        kind: str = "delete",
+    ) -> RetentionJob:
+        self._forget_finished()
+        job = RetentionJob(
+            id=uuid.uuid4().hex,
+            before=before,
+            kind=kind,
+            service=service,
+            exclude_services=list(exclude_services),
+        )
+        self.jobs[job.id] = job
+        job.task = create_background_task(self._run(job, bind))
+        logger.info(
+            f"Создана задача {JOB_KINDS[kind]} логов {job.id} до {before.isoformat()}"
+            + (f" для сервиса {service}" if service else "")
+        )
+        return job
+
+    def get(self, job_id: str) -> RetentionJob | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> RetentionJob | None:
+        job = self.jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel_requested = True
+            logger.info(f"Запрошена отмена задачи {JOB_KINDS[job.kind]} логов {job_id}")
+        return job
+
+    async def estimate(self, session: AsyncSession, job: RetentionJob) -> int:
+        totals = await aggregate_counts(
+            session, end_time=job.before, dimensions=["service"], service=job.service
+        )
+        total = sum(
+            count
+            for (_, service), count in totals.items()
+            if service not in job.exclude_services
+        )
+        if job.kind == "archive":
+            total -= sum(
+                segment.rows for segment in archive_catalog.older_than(job.before)
+            )
+        return max(total, 0)
+
+    async def _run(self, job: RetentionJob, bind):
+        job.status = "running"
+        job.started_at = utc_now()
+        try:
+            async with AsyncSession(bind=bind, expire_on_commit=False) as session:
+                job.estimated_total = await self.estimate(session, job)
+                if job.kind == "archive":
+                    chunks = iter_archive_logs(
+                        session, job.before, self.archive_chunk_size
+                    )
+                else:
+                    chunks = iter_delete_old_logs(
+                        session,
+                        job.before,
+                        job.service,
+                        job.exclude_services,
+                        self.chunk_size,
+                    )
+                async with aclosing(chunks):
+                    async for count in chunks:
+                        job.deleted += count
+                        if job.cancel_requested:
+                            break
+                        # Пауза между пакетами отдаёт блокировку записи приёму логов
+                        await asyncio.sleep(self.chunk_pause)
+            job.status = "cancelled" if job.cancel_requested else "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(
+                f"Задача {JOB_KINDS[job.kind]} логов {job.id} завершилась ошибкой: {e}"
+            )
+        finally:
+            job.finished_at = utc_now()
+
+        logger.info(
+            f"Задача {JOB_KINDS[job.kind]} логов {job.id}: {job.status}, "
+            f"обработано {job.deleted} логов"
+        )
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(len(finished) - MAX_FINISHED_JOBS + 1, 0)]:
+            del self.jobs[job_id]
+
+    async def run_policy(self, bind) -> list[RetentionJob]:
+        now = utc_now()
+        targets = [
+            (now - timedelta(days=days), service, [], "delete")
+            for service, days in self.service_days.items()
+        ]
+        if self.default_days:
+            targets.append(
+                (
+                    now - timedelta(days=self.default_days),
+                    None,
+                    list(self.service_days),
+                    "delete",
+                )
+            )
+        if self.archive_after_days:
+            # Архивируются только закрытые сутки
+            before = (now - timedelta(days=self.archive_after_days)).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            targets.insert(0, (before, None, [], "archive"))
+
+        jobs = []
+        for before, service, exclude_services, kind in targets:
+            job = self.submit(bind, before, service, exclude_services, kind)
+            await asyncio.wait([job.task])
+            jobs.append(job)
+        return jobs
+
+    async def _schedule(self, bind):
+        while True:
+            await self.run_policy(bind)
+            await asyncio.sleep(self.interval)
+
+    async def start(self, bind=engine):
+        if not self.has_policy or self._scheduler is not None:
+            return
+        self._scheduler = create_background_task(self._schedule(bind))
+        logger.info(
+            f"Политика хранения логов запущена: по умолчанию {self.default_days} дней, "
+            f"по сервисам {self.service_days}, архивирование через "
+            f"{self.archive_after_days} дней, интервал {self.interval}с"
+        )
+
+    async def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            await asyncio.gather(self._scheduler, return_exceptions=True)
+            self._scheduler = None
+
+        active = [job for job in self.jobs.values() if not job.finished]
+        for job in active:
+            job.cancel_requested = True
+        if active:
+            await asyncio.wait([job.task for job in active])
+
+
+retention_manager = RetentionManager(
+    chunk_size=RETENTION_CHUNK_SIZE,
+    chunk_pause=RETENTION_CHUNK_PAUSE,
+    default_days=RETENTION_DAYS,
+    service_days=RETENTION_SERVICE_DAYS,
+    interval=RETENTION_INTERVAL,
+    archive_after_days=ARCHIVE_AFTER_DAYS,
+    archive_chunk_size=ARCHIVE_SEGMENT_ROWS,
+)
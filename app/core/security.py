@@ -1,6 +1,7 @@
 import logging
 import os
 import time
+from dataclasses import dataclass
 
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
@@ -8,8 +9,10 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import ExpiredSignatureError, JWTError, jwt
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.config import get_db
+from app.config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, get_read_db
 from app.crud.log_crud import get_user_by_id
+from app.utils.cache import TTLCache
+from app.utils.logger import SAMPLED
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +25,35 @@ if not SECRET_KEY:
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE)
+token_cache = TTLCache(PRINCIPAL_CACHE_SIZE)
+
+
+def token_ttl(payload: dict) -> float:
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)):
+        return PRINCIPAL_CACHE_TTL
+    return min(PRINCIPAL_CACHE_TTL, exp - time.time())
+
+
+def invalidate_principal(user_id: int):
+    principal_cache.pop(user_id)
+    token_cache.discard_where(lambda payload: payload.get("user_id") == user_id)
+    logger.info(f"Сброшен кэш аутентификации пользователя {user_id}")
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    role: str
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        # В кэше не хранятся ORM-объекты, привязанные к чужой сессии
+        role = "admin" if user.username == "admin" else "user"
+        return cls(id=user.id, username=user.username, role=role)
+
 
 def create_access_token(user_id: int, username: str, expires_delta: int = 3600) -> str:
     payload = {
@@ -32,14 +64,24 @@ def create_access_token(user_id: int, username: str, expires_delta: int = 3600)
 
     encoded_jwt = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
-    logger.info(f"Сгенерирован токен для пользователя {username} (id: {user_id})")
+    logger.info(
+        "Сгенерирован токен для пользователя %s (id: %s)",
+        username,
+        user_id,
+        extra=SAMPLED,
+    )
     return encoded_jwt
 
 
 async def decode_access_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         logger.debug("Токен успешно декодирован")
+        token_cache.set(token, payload, token_ttl(payload))
         return payload
 
     except ExpiredSignatureError:
@@ -60,7 +102,7 @@ async def decode_access_token(token: str) -> dict:
 
 
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_db)
+    token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_read_db)
 ):
     payload = await decode_access_token(token)
 
@@ -73,13 +115,22 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = await get_user_by_id(session, user_id)
-    if user is None:
-        logger.error(f"Пользователь с ID {user_id} не найден")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Недействительный токен",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    logger.info(f"Аутентифицирован пользователь: {user.username} (ID: {user_id})")
-    return user
\ No newline at end of file
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = await get_user_by_id(session, user_id)
+        if user is None:
+            logger.error(f"Пользователь с ID {user_id} не найден")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Недействительный токен",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        principal = Principal.from_user(user)
+        principal_cache.set(user_id, principal, token_ttl(payload))
+    logger.info(
+        "Аутентифицирован пользователь: %s (ID: %s)",
+        principal.username,
+        user_id,
+        extra=SAMPLED,
+    )
+    return principal
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import re
+
+from app.config import TAIL_MAX_SUBSCRIBERS, TAIL_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+FTS_OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def search_terms(q: str) -> list[str]:
+    return [
+        term.lower() for term in TOKEN_PATTERN.findall(q) if term not in FTS_OPERATORS
+    ]
+
+
+class TailBusy(Exception):
+    pass
+
+
+class TailSubscription:
+    def __init__(
+        self,
+        level: str | None = None,
+        service: str | None = None,
+        q: str | None = None,
+        queue_size: int = 1000,
+    ):
+        self.level = level
+        self.service = service
+        self.terms = search_terms(q) if q else []
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def matches(self, row: dict) -> bool:
+        if self.level is not None and row["level"] != self.level:
+            return False
+        if self.service is not None and row["service"] != self.service:
+            return False
+        if self.terms:
+            tokens = TOKEN_PATTERN.findall(row["message"].lower())
+            return all(
+                any(token.startswith(term) for token in tokens) for term in self.terms
+            )
+        return True
+
+    def offer(self, row: dict):
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Медленный подписчик теряет новые строки, приём логов не ждёт
+            self.dropped += 1
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class TailBroker:
+    def __init__(self, queue_size: int = 1000, max_subscribers: int = 100):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers: set[TailSubscription] = set()
+
+    def subscribe(
+        self,
+        level: str | None = None,
+        service: str | None = None,
+        q: str | None = None,
+    ) -> TailSubscription:
+        if len(self.subscribers) >= self.max_subscribers:
+            raise TailBusy()
+        subscription = TailSubscription(level, service, q, self.queue_size)
+        self.subscribers.add(subscription)
+        logger.info(
+            f"Новый подписчик живого хвоста логов (level={level}, service={service}, "
+            f"q={q}), всего {len(self.subscribers)}"
+        )
+        return subscription
+
+    def unsubscribe(self, subscription: TailSubscription):
+        self.subscribers.discard(subscription)
+        logger.info(
+            f"Подписчик живого хвоста логов отключился, всего {len(self.subscribers)}"
+        )
+
+    def publish(self, rows: list[dict]):
+        for subscription in self.subscribers:
+            for row in rows:
+                if subscription.matches(row):
+                    subscription.offer(row)
+
+
+tail_broker = TailBroker(
+    queue_size=TAIL_QUEUE_SIZE, max_subscribers=TAIL_MAX_SUBSCRIBERS
+)
@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import json
+import logging
+import operator
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from app.config import ARCHIVE_DIR
+from app.schemas.log_schemas import LogDB
+from app.utils.cache import naive
+from app.utils.search import SearchQuery
+from app.utils.segments import (COLUMNS, Segment, read_segment_columns,
+                                read_segment_footer, write_segment)
+
+logger = logging.getLogger(__name__)
+
+COMPARATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+def sql_order(value):
+    # SQLite сравнивает числа и строки разных типов как «число < строка»
+    if isinstance(value, (bool, int, float)):
+        return 0, value
+    return 1, str(value)
+
+
+def metadata_value(metadata_json: str | None, key: str):
+    if metadata_json is None:
+        return None
+    value = json.loads(metadata_json)
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+@dataclass
+class ArchiveFilter:
+    start_time: datetime | None = None
+    end_time: datetime | None = None
+    end_inclusive: bool = True
+    level: str | None = None
+    service: str | None = None
+    q: str | None = None
+    metadata: list | None = None
+    cursor: tuple[datetime, int] | None = None
+
+    def __post_init__(self):
+        self.start_time = naive(self.start_time)
+        self.end_time = naive(self.end_time)
+        self.search = SearchQuery(self.q) if self.q else None
+
+    def overlaps(self, segment: Segment) -> bool:
+        if self.start_time is not None and segment.max_time < self.start_time:
+            return False
+        if self.end_time is not None and (
+            segment.min_time > self.end_time
+            or (not self.end_inclusive and segment.min_time == self.end_time)
+        ):
+            return False
+        if self.cursor is not None and segment.max_time < naive(self.cursor[0]):
+            return False
+        return any(
+            (self.level is None or level == self.level)
+            and (self.service is None or service == self.service)
+            for level, service in segment.counts
+        )
+
+    def covers(self, segment: Segment) -> bool:
+        return (
+            self.search is None
+            and not self.metadata
+            and self.cursor is None
+            and (self.start_time is None or segment.min_time >= self.start_time)
+            and (
+                self.end_time is None
+                or segment.max_time < self.end_time
+                or (self.end_inclusive and segment.max_time == self.end_time)
+            )
+        )
+
+    def footer_counts(self, segment: Segment) -> list[tuple[str, str, int]]:
+        return [
+            (level, service, count)
+            for (level, service), count in segment.counts.items()
+            if (self.level is None or level == self.level)
+            and (self.service is None or service == self.service)
+        ]
+
+    def columns(self) -> list[str]:
+        names = ["id", "timestamp", "level", "service"]
+        if self.search is not None:
+            names.append("message")
+        if self.metadata:
+            names.append("metadata_json")
+        return names
+
+    def matches(self, columns: dict[str, list], index: int) -> bool:
+        timestamp = columns["timestamp"][index]
+        if self.start_time is not None and timestamp < self.start_time:
+            return False
+        if self.end_time is not None and (
+            timestamp > self.end_time
+            or (not self.end_inclusive and timestamp == self.end_time)
+        ):
+            return False
+        if self.cursor is not None and (timestamp, columns["id"][index]) <= (
+            naive(self.cursor[0]),
+            self.cursor[1],
+        ):
+            return False
+        if self.level is not None and columns["level"][index] != self.level:
+            return False
+        if self.service is not None and columns["service"][index] != self.service:
+            return False
+        if self.search is not None and not self.search.matches(
+            columns["message"][index]
+        ):
+            return False
+        for key, op, expected in self.metadata or ():
+            actual = metadata_value(columns["metadata_json"][index], key)
+            if expected is None:
+                if (actual is None) != (op == "="):
+                    return False
+            elif actual is None or not COMPARATORS[op](
+                sql_order(actual), sql_order(expected)
+            ):
+                return False
+        return True
+
+
+def log_order(log) -> tuple[datetime, int]:
+    if isinstance(log, dict):
+        return log["timestamp"], log["id"]
+    return log.timestamp, log.id
+
+
+async def merge_chunks(first, second):
+    # Слияние двух упорядоченных потоков пачек: в памяти только текущие пачки
+    left, right = [], []
+    first_done = second_done = False
+    while True:
+        if not left and not first_done:
+            left = await anext(first, None) or []
+            first_done = not left
+        if not right and not second_done:
+            right = await anext(second, None) or []
+            second_done = not right
+        if not left or not right:
+            break
+        bound = min(log_order(left[-1]), log_order(right[-1]))
+        left_end = bisect_right(left, bound, key=log_order)
+        right_end = bisect_right(right, bound, key=log_order)
+        yield list(heapq.merge(left[:left_end], right[:right_end], key=log_order))
+        left, right = left[left_end:], right[right_end:]
+
+    if left or right:
+        yield left or right
+    async for rows in second if first_done else first:
+        yield rows
+
+
+async def chain_chunks(first, second):
+    async for rows in first:
+        yield rows
+    async for rows in second:
+        yield rows
+
+
+class ArchiveCatalog:
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.segments: dict[Path, Segment] = {}
+
+    def load(self):
+        self.segments.clear()
+        if not self.directory.exists():
+            return
+        for path in sorted(self.directory.glob("*.seg")):
+            try:
+                self.segments[path] = read_segment_footer(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Не удалось прочитать сегмент архива {path}: {e}")
+        logger.info(f"Загружено {len(self.segments)} сегментов архива логов")
+
+    def select(self, archive_filter: ArchiveFilter) -> list[Segment]:
+        return sorted(
+            (
+                segment
+                for segment in self.segments.values()
+                if archive_filter.overlaps(segment)
+            ),
+            key=lambda segment: (segment.min_time, segment.path.name),
+        )
+
+    def older_than(self, before: datetime) -> list[Segment]:
+        return self.select(ArchiveFilter(end_time=before, end_inclusive=False))
+
+    def write(self, rows: list[dict]) -> Segment:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        first = rows[0]
+        path = self.directory / (
+            f"{first['timestamp']:%Y%m%dT%H%M%S%f}_{first['id']}.seg"
+        )
+        segment = write_segment(path, rows)
+        self.segments[path] = segment
+        logger.info(f"Записан сегмент архива {path.name} ({len(rows)} логов)")
+        return segment
+
+    def remove(self, segment: Segment):
+        self.segments.pop(segment.path, None)
+        segment.path.unlink(missing_ok=True)
+        logger.info(f"Удалён сегмент архива {segment.path.name}")
+
+    @staticmethod
+    def match(segment: Segment, archive_filter: ArchiveFilter, names=None):
+        columns = read_segment_columns(segment, names or archive_filter.columns())
+        indexes = [
+            index
+            for index in range(segment.rows)
+            if archive_filter.matches(columns, index)
+        ]
+        return columns, indexes
+
+    def read_rows(self, segment: Segment, archive_filter: ArchiveFilter):
+        columns, indexes = self.match(segment, archive_filter, COLUMNS)
+        return [
+            {name: values[index] for name, values in columns.items()}
+            for index in indexes
+        ]
+
+    async def iter_logs(self, archive_filter: ArchiveFilter):
+        # Сегменты могут пересекаться по времени, поэтому строка отдаётся,
+        # только когда ни один непрочитанный сегмент не начнётся раньше неё
+        segments = self.select(archive_filter)
+        pending = []
+        for index, segment in enumerate(segments):
+            rows = await asyncio.to_thread(self.read_rows, segment, archive_filter)
+            for row in rows:
+                heapq.heappush(pending, (log_order(row), row))
+            bound = segments[index + 1].min_time if index + 1 < len(segments) else None
+            ready = []
+            while pending and (bound is None or pending[0][0][0] < bound):
+                ready.append(LogDB(**heapq.heappop(pending)[1]))
+            if ready:
+                yield ready
+
+    async def count(self, archive_filter: ArchiveFilter) -> int:
+        total = 0
+        for segment in self.select(archive_filter):
+            if archive_filter.covers(segment):
+                total += sum(
+                    count for _, _, count in archive_filter.footer_counts(segment)
+                )
+            else:
+                _, indexes = await asyncio.to_thread(
+                    self.match, segment, archive_filter
+                )
+                total += len(indexes)
+        return total
+
+    async def grouped_counts(
+        self,
+        archive_filter: ArchiveFilter,
+        dimensions: list[str],
+        bucketed: bool,
+        columns: dict[str, str] | None = None,
+    ) -> Counter:
+        names = [(columns or {}).get(dimension, dimension) for dimension in dimensions]
+        extra = [name for name in names if name not in archive_filter.columns()]
+        totals = Counter()
+        for segment in self.select(archive_filter):
+            if archive_filter.covers(segment) and not bucketed and not extra:
+                for level, service, count in archive_filter.footer_counts(segment):
+                    values = {"level": level, "service": service}
+                    totals[(None, *(values[name] for name in names))] += count
+                continue
+
+            values, indexes = await asyncio.to_thread(
+                self.match, segment, archive_filter, archive_filter.columns() + extra
+            )
+            for index in indexes:
+                bucket = None
+                if bucketed:
+                    bucket = values["timestamp"][index].replace(second=0, microsecond=0)
+                totals[(bucket, *(values[name][index] for name in names))] += 1
+        return totals
+
+
+archive_catalog = ArchiveCatalog(ARCHIVE_DIR)
@@ -0,0 +1,119 @@
+import logging
+
+from sqlalchemy import cast, func, literal, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.log_schemas import (LEVEL_CODES, SEARCH_CONFIG, UNKNOWN_CODE,
+                                     LogDB)
+from app.utils.cache import naive
+
+logger = logging.getLogger(__name__)
+
+SQLITE = "sqlite"
+POSTGRESQL = "postgresql"
+
+HEADLINE_OPTIONS = (
+    "StartSel=<mark>, StopSel=</mark>, MaxWords=16, MinWords=5, "
+    "MaxFragments=1, FragmentDelimiter=…"
+)
+COPY_COLUMNS = (
+    "id",
+    "timestamp",
+    "level",
+    "service",
+    "message",
+    "metadata_json",
+    "template_id",
+)
+
+
+def dialect_name(bind) -> str:
+    if isinstance(bind, AsyncSession):
+        bind = bind.get_bind()
+    return bind.dialect.name
+
+
+def upsert(dialect: str, table):
+    if dialect == POSTGRESQL:
+        return postgresql_insert(table)
+    return sqlite_insert(table)
+
+
+def least(dialect: str, *values):
+    if dialect == POSTGRESQL:
+        return func.least(*values)
+    return func.min(*values)
+
+
+def greatest(dialect: str, *values):
+    if dialect == POSTGRESQL:
+        return func.greatest(*values)
+    return func.max(*values)
+
+
+def minute_bucket(dialect: str, timestamp):
+    if dialect == POSTGRESQL:
+        return func.date_trunc("minute", timestamp)
+    return func.strftime("%Y-%m-%d %H:%M:00", timestamp)
+
+
+def search_query(q: str):
+    return func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+
+def text_match(message, q: str):
+    return func.to_tsvector(SEARCH_CONFIG, message).op("@@")(search_query(q))
+
+
+def text_rank(message, q: str):
+    # Как и rank в FTS5: чем меньше значение, тем релевантнее строка
+    return -func.ts_rank(func.to_tsvector(SEARCH_CONFIG, message), search_query(q))
+
+
+def text_headline(message, q: str):
+    return func.ts_headline(SEARCH_CONFIG, message, search_query(q), HEADLINE_OPTIONS)
+
+
+def json_extract(dialect: str, document, key: str):
+    if dialect == POSTGRESQL:
+        path = cast(document, JSONB)[tuple(key.split("."))]
+        # JSON null, как и в SQLite, считается отсутствующим значением
+        return func.nullif(path, cast(literal("null"), JSONB), type_=JSONB)
+    return func.json_extract(document, f"$.{key}")
+
+
+def json_value(dialect: str, value):
+    if dialect == POSTGRESQL:
+        return literal(value, JSONB)
+    return value
+
+
+async def copy_log_rows(session: AsyncSession, rows: list[dict]) -> list[int]:
+    connection = await session.connection()
+    sequence = func.pg_get_serial_sequence(LogDB.__tablename__, "id")
+    result = await connection.execute(
+        select(func.nextval(sequence)).select_from(func.generate_series(1, len(rows)))
+    )
+    ids = sorted(result.scalars())
+
+    records = [
+        (
+            log_id,
+            naive(row["timestamp"]),
+            LEVEL_CODES.get(row["level"], UNKNOWN_CODE),
+            row["service"],
+            row["message"],
+            row["metadata_json"],
+            row.get("template_id"),
+        )
+        for log_id, row in zip(ids, rows)
+    ]
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        LogDB.__tablename__, records=records, columns=COPY_COLUMNS
+    )
+    logger.debug(f"Через COPY загружено {len(records)} логов")
+    return ids
@@ -1,144 +1,517 @@
-import json
+import asyncio
 import logging
-from datetime import datetime
+from collections import Counter
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from functools import partial
 
 from passlib.context import CryptContext
-from sqlalchemy import delete, func, select
-
-from app.config import AsyncSession
+from sqlalchemy import delete, func, insert, literal_column, select, tuple_
+
+from app.config import ARCHIVE_SEGMENT_ROWS, RETENTION_CHUNK_SIZE, AsyncSession
+from app.core.tail import tail_broker
+from app.crud.archive import (ArchiveFilter, archive_catalog, chain_chunks,
+                              merge_chunks)
+from app.crud.backend import (POSTGRESQL, copy_log_rows, dialect_name,
+                              minute_bucket, text_headline, text_match)
+from app.crud.metadata_filters import apply_metadata_filters
+from app.crud.partitions import LogSource, Partition, partition_router
+from app.crud.rollups import (OTHER_GROUP, TIME_LABELS, aggregate_counts,
+                              decrement_rollups, fill_buckets,
+                              increment_rollups, limit_top, parse_grouping,
+                              subtract_rollups)
+from app.crud.services import (read_with_services, refresh_services,
+                               register_services, resolve_service_ids,
+                               service_id, service_ids)
+from app.crud.templates import (assign_templates, register_templates,
+                                template_texts)
 from app.models.log_models import LogShema, UserRegister
-from app.schemas.log_schemas import LogDB, User
+from app.schemas.log_schemas import (LogDB, UnknownService, User, fts_table,
+                                     log_fts)
+from app.utils.cache import naive, response_cache
+from app.utils.logger import SAMPLED
+from app.utils.passwords import password_hasher
+from app.utils.segments import Segment
+from app.utils.serialization import dump_metadata
 
 logger = logging.getLogger(__name__)
 
+DELETE_BATCH_SIZE = 5000
+MERGE_CHUNK_SIZE = 1000
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 async def hash_password(password: str) -> str:
-    return pwd_context.hash(password[:72])
+    return await password_hasher.run(pwd_context.hash, password[:72])
 
 
 async def verify_password_hash(password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password, hashed_password)
+    return await password_hasher.run(pwd_context.verify, password, hashed_password)
 
 
-async def create_log(session: AsyncSession, log_schema: LogShema):
-    new_log = LogDB(
-        timestamp=log_schema.timestamp,
-        level=log_schema.level,
-        service=log_schema.service,
-        message=log_schema.message,
-        metadata_json=json.dumps(log_schema.metadata) if log_schema.metadata else None,
-    )
+def log_to_row(log_schema: LogShema) -> dict:
+    return {
+        "timestamp": log_schema.timestamp,
+        "level": log_schema.level,
+        "service": log_schema.service,
+        "message": log_schema.message,
+        "metadata_json": dump_metadata(log_schema.metadata),
+    }
 
-    session.add(new_log)
-    await session.commit()
-    await session.refresh(new_log)
+
+async def create_log(session: AsyncSession, log_schema: LogShema):
+    row = log_to_row(log_schema)
+    [log_id] = await create_log_rows(session, [row])
+    new_log = LogDB(id=log_id, **row)
     logger.debug(
-        f"В {new_log.timestamp} был создан новый лог с уровнем {new_log.level}"
+        "В %s был создан новый лог с уровнем %s", new_log.timestamp, new_log.level
     )
     return new_log
 
 
-async def get_logs_filtered(
-    session: AsyncSession,
+async def insert_log_rows(session: AsyncSession, rows: list[dict]):
+    service_ids, created = await resolve_service_ids(
+        session, {row["service"] for row in rows}
+    )
+    rows = [{**row, "service": service_ids[row["service"]]} for row in rows]
+    if dialect_name(session) == POSTGRESQL:
+        return await copy_log_rows(session, rows), [], created
+    if not partition_router.enabled:
+        stmt = insert(LogDB).returning(LogDB.id, sort_by_parameter_order=True)
+        result = await session.execute(stmt, rows)
+        return list(result.scalars()), [], created
+
+    partitions = await session.run_sync(
+        lambda sync_session: partition_router.ensure(
+            sync_session.connection(), [row["timestamp"] for row in rows]
+        )
+    )
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(partition_router.period_start(row["timestamp"]), []).append(
+            index
+        )
+
+    ids = [None] * len(rows)
+    for start, indexes in groups.items():
+        table = partitions[start].table
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        result = await session.execute(stmt, [rows[index] for index in indexes])
+        for index, log_id in zip(indexes, result.scalars()):
+            ids[index] = log_id
+    return ids, list(partitions.values()), created
+
+
+async def create_logs_bulk(session: AsyncSession, log_schemas: list[LogShema]):
+    return await create_log_rows(session, [log_to_row(log) for log in log_schemas])
+
+
+async def create_log_rows(session: AsyncSession, rows: list[dict]):
+    if not rows:
+        return []
+
+    templates = await assign_templates(session, rows)
+    ids, partitions, services = await insert_log_rows(session, rows)
+    await increment_rollups(session, rows)
+    await session.commit()
+    partition_router.register(partitions)
+    register_services(services)
+    register_templates(templates)
+    if tail_broker.subscribers:
+        tail_broker.publish([{**row, "id": log_id} for row, log_id in zip(rows, ids)])
+    timestamps = [naive(row["timestamp"]) for row in rows]
+    response_cache.invalidate(min(timestamps), max(timestamps))
+    logger.debug("Пакетно добавлено %d логов", len(ids))
+    return ids
+
+
+def apply_log_filters(
+    query,
+    source: LogSource,
     level: str | None = None,
     service: str | None = None,
     start_time: datetime | None = None,
     end_time: datetime | None = None,
-    limit: int = 100,
-    offset: int = 0,
+    q: str | None = None,
+    metadata: list | None = None,
 ):
-    count_query = select(func.count(LogDB.id))
-    query = select(LogDB)
-
+    model = source.model
+    if q and source.dialect == POSTGRESQL:
+        query = query.where(text_match(model.message, q))
+    elif q and not source.searched:
+        query = query.join_from(LogDB, log_fts, log_fts.c.rowid == LogDB.id)
+        query = query.where(literal_column("log_fts").match(q))
+    if metadata:
+        query = apply_metadata_filters(query, metadata, model, source.dialect)
     if level is not None:
-        count_query = count_query.where(LogDB.level == level)
-        query = query.where(LogDB.level == level)
+        query = query.where(model.level == level)
     if service is not None:
-        count_query = count_query.where(LogDB.service == service)
-        query = query.where(LogDB.service == service)
+        query = query.where(model.service == service_id(service))
     if start_time is not None:
-        count_query = count_query.where(LogDB.timestamp >= start_time)
-        query = query.where(LogDB.timestamp >= start_time)
+        query = query.where(model.timestamp >= start_time)
+    if end_time is not None:
+        query = query.where(model.timestamp <= end_time)
+    return query
+
+
+def can_read_in_parallel(session: AsyncSession) -> bool:
+    url = session.bind.url
+    return url.get_backend_name() != "sqlite" or url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+async def estimate_logs_count(
+    session: AsyncSession,
+    level: str | None = None,
+    service: str | None = None,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+):
     if end_time is not None:
-        count_query = count_query.where(LogDB.timestamp <= end_time)
-        query = query.where(LogDB.timestamp <= end_time)
+        end_time += timedelta(microseconds=1)
+    totals = await aggregate_counts(
+        session, start_time=start_time, end_time=end_time, level=level, service=service
+    )
+    return sum(totals.values())
+
+
+async def count_logs(session: AsyncSession, source: LogSource, **filters):
+    query = apply_log_filters(select(func.count(source.model.id)), source, **filters)
+    return await session.scalar(query)
+
+
+async def fetch_logs(session: AsyncSession, query):
+    async def read():
+        result = await session.execute(query)
+        return result.scalars().all()
+
+    return await read_with_services(session, read)
 
-    total_result = await session.execute(count_query)
-    total = total_result.scalar()
 
-    query = query.offset(offset).limit(limit)
-    result = await session.execute(query)
-    logs = result.scalars().all()
+async def read_page(chunks, offset: int, limit: int) -> list:
+    page = []
+    async for rows in chunks:
+        if offset >= len(rows):
+            offset -= len(rows)
+            continue
+        page += rows[offset : offset + limit - len(page)]
+        offset = 0
+        if len(page) >= limit:
+            break
+    return page
+
+
+async def fetch_merged_logs(
+    session: AsyncSession,
+    query,
+    archive_filter: ArchiveFilter,
+    offset: int,
+    limit: int,
+    ranked: bool = False,
+):
+    # Горячие и архивные строки сливаются потоком: для дальней страницы
+    # в памяти держатся только текущие пачки, а не offset + limit строк
+    async def read():
+        result = await session.stream_scalars(
+            query.execution_options(yield_per=MERGE_CHUNK_SIZE)
+        )
+        hot = result.partitions()
+        archived = archive_catalog.iter_logs(archive_filter)
+        if ranked:
+            chunks = chain_chunks(hot, archived)
+        else:
+            chunks = merge_chunks(hot, archived)
+        try:
+            return await read_page(chunks, offset, limit)
+        finally:
+            await chunks.aclose()
+            await archived.aclose()
+            await result.close()
+
+    return await read_with_services(session, read)
+
+
+async def get_logs_filtered(
+    session: AsyncSession,
+    level: str | None = None,
+    service: str | None = None,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: tuple[datetime, int] | None = None,
+    count: str = "exact",
+    q: str | None = None,
+    order: str = "time",
+    metadata: list | None = None,
+):
+    filters = dict(
+        level=level,
+        service=service,
+        start_time=start_time,
+        end_time=end_time,
+        q=q,
+        metadata=metadata,
+    )
+    source = partition_router.source(start_time, end_time, q, dialect_name(session))
+    model = source.model
+    query = apply_log_filters(select(model), source, **filters)
+    if q and order == "rank":
+        query = query.order_by(source.rank, model.id)
+    else:
+        query = query.order_by(model.timestamp, model.id)
+    if cursor is not None:
+        query = query.where(tuple_(model.timestamp, model.id) > tuple_(*cursor))
+
+    archive_filter = ArchiveFilter(cursor=cursor, **filters)
+    archived = bool(archive_catalog.select(archive_filter))
+    if archived:
+        # Горячая таблица не знает, сколько архивных строк попадёт перед
+        # страницей, поэтому offset отсчитывается уже после слияния
+        query = query.limit(limit if cursor is not None else offset + limit)
+        read = partial(
+            fetch_merged_logs,
+            session,
+            query,
+            archive_filter,
+            0 if cursor is not None else offset,
+            limit,
+            ranked=bool(q) and order == "rank",
+        )
+    else:
+        if cursor is None:
+            query = query.offset(offset)
+        read = partial(fetch_logs, session, query.limit(limit))
+
+    if count == "estimate" and (q or metadata):
+        count = "exact"
+
+    total = None
+    if count == "exact" and can_read_in_parallel(session):
+        async with AsyncSession(bind=session.bind) as count_session:
+            total, logs = await asyncio.gather(
+                count_logs(count_session, source, **filters), read()
+            )
+    else:
+        if count == "exact":
+            total = await count_logs(session, source, **filters)
+        elif count == "estimate":
+            total = await estimate_logs_count(
+                session,
+                level=level,
+                service=service,
+                start_time=start_time,
+                end_time=end_time,
+            )
+        logs = await read()
+
+    if archived and count == "exact":
+        total += await archive_catalog.count(ArchiveFilter(**filters))
 
     logger.info(
-        f"Передано {len(logs)} логов (всего по фильтру: {total}). "
-        f"Фильтры: level={level}, service={service}, "
-        f"start={start_time.isoformat() if start_time else 'None'}, "
-        f"end={end_time.isoformat() if end_time else 'None'}, "
-        f"limit={limit}, offset={offset}"
+        "Передано %d логов (всего по фильтру: %s, режим подсчёта: %s). "
+        "Фильтры: level=%s, service=%s, start=%s, end=%s, limit=%s, offset=%s, "
+        "cursor=%s, q=%r, order=%s, metadata=%s",
+        len(logs),
+        total,
+        count,
+        level,
+        service,
+        start_time,
+        end_time,
+        limit,
+        offset,
+        cursor,
+        q,
+        order,
+        metadata,
+        extra=SAMPLED,
     )
 
     return logs, total
 
 
+async def get_snippets(session: AsyncSession, q: str, log_ids: list[int]):
+    if dialect_name(session) == POSTGRESQL:
+        result = await session.execute(
+            select(LogDB.id, text_headline(LogDB.message, q)).where(
+                LogDB.id.in_(log_ids)
+            )
+        )
+        return dict(result.all())
+
+    snippets = {}
+    for table_name, ids in partition_router.tables_for_ids(log_ids).items():
+        fts = fts_table(table_name)
+        match = literal_column(fts.name)
+        snippet = func.snippet(match, 0, "<mark>", "</mark>", "…", 16)
+        query = (
+            select(fts.c.rowid, snippet.label("snippet"))
+            .where(match.match(q))
+            .where(fts.c.rowid.in_(ids))
+        )
+        result = await session.execute(query)
+        snippets.update({row.rowid: row.snippet for row in result})
+    return snippets
+
+
+async def stream_logs(
+    engine,
+    level: str | None = None,
+    service: str | None = None,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    q: str | None = None,
+    metadata: list | None = None,
+    chunk_size: int = 1000,
+):
+    filters = dict(
+        level=level,
+        service=service,
+        start_time=start_time,
+        end_time=end_time,
+        q=q,
+        metadata=metadata,
+    )
+    chunks = stream_hot_logs(engine, chunk_size=chunk_size, **filters)
+    archive_filter = ArchiveFilter(**filters)
+    if archive_catalog.select(archive_filter):
+        # Архивные логи выгружаются вместе с горячими в общем порядке (timestamp, id)
+        chunks = merge_chunks(chunks, archive_catalog.iter_logs(archive_filter))
+    async with aclosing(chunks):
+        async for rows in chunks:
+            yield rows
+
+
+async def stream_hot_logs(
+    engine,
+    level: str | None = None,
+    service: str | None = None,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    q: str | None = None,
+    metadata: list | None = None,
+    chunk_size: int = 1000,
+):
+    source = partition_router.source(start_time, end_time, q, dialect_name(engine))
+    model = source.model
+    query = select(
+        model.id,
+        model.timestamp,
+        model.level,
+        model.service,
+        model.message,
+        model.metadata_json,
+    )
+    query = apply_log_filters(
+        query,
+        source,
+        level=level,
+        service=service,
+        start_time=start_time,
+        end_time=end_time,
+        q=q,
+        metadata=metadata,
+    )
+    query = query.order_by(model.timestamp, model.id)
+
+    last, refreshed_at = None, ()
+    while True:
+        resumed = query
+        if last is not None:
+            resumed = query.where(tuple_(model.timestamp, model.id) > tuple_(*last))
+        try:
+            async with AsyncSession(bind=engine) as session:
+                result = await session.stream(
+                    resumed.execution_options(yield_per=chunk_size)
+                )
+                async for rows in result.partitions(chunk_size):
+                    yield rows
+                    last = rows[-1].timestamp, rows[-1].id
+            return
+        except UnknownService:
+            # Перечитываем словарь и продолжаем с последней отданной строки;
+            # повторная ошибка без продвижения означает битую ссылку на сервис
+            if refreshed_at == last:
+                raise
+            refreshed_at = last
+            async with AsyncSession(bind=engine) as session:
+                await refresh_services(session)
+
+
+def stats_order(key: tuple):
+    # В ключах могут встречаться None и __other__ рядом с id шаблонов
+    return tuple((value is None, str(type(value)), value) for value in key)
+
+
 async def get_logs_stats(
     session: AsyncSession,
     start_time: datetime | None = None,
     end_time: datetime | None = None,
     service: str | None = None,
     group_by: str | None = None,
+    metadata: list | None = None,
+    interval: str | None = None,
+    fill: bool = False,
+    top: int | None = None,
+    level: str | None = None,
 ):
-    query = select()
-    query = query.add_columns(func.count().label("count"))
-
-    filters = []
-    if start_time:
-        filters.append(LogDB.timestamp >= start_time)
-    if end_time:
-        filters.append(LogDB.timestamp <= end_time)
-    if service:
-        filters.append(LogDB.service == service)
-    if filters:
-        query = query.where(*filters)
-
-    if group_by == "hour":
-        time_interval = func.strftime("%Y-%m-%dT%H:00:00Z", LogDB.timestamp)
-        query = query.add_columns(time_interval.label("time_interval"))
-        query = query.group_by(time_interval)
-    elif group_by == "day":
-        time_interval = func.strftime("%Y-%m-%dT00:00Z", LogDB.timestamp)
-        query = query.add_columns(time_interval.label("time_interval"))
-        query = query.group_by(time_interval)
-    elif group_by == "level":
-        query = query.add_columns(LogDB.level)
-        query = query.group_by(LogDB.level)
-    elif group_by == "service":
-        query = query.add_columns(LogDB.service)
-        query = query.group_by(LogDB.service)
-
-    result = await session.execute(query)
-    rows = result.fetchall()
-
+    dimensions, width, unit = parse_grouping(group_by, interval)
+    if end_time is not None:
+        end_time += timedelta(microseconds=1)
+
+    totals = await aggregate_counts(
+        session,
+        start_time=start_time,
+        end_time=end_time,
+        dimensions=dimensions,
+        width=width,
+        level=level,
+        service=service,
+        metadata=metadata,
+    )
+    # top ограничивает шаблоны, если группировка по ним, иначе сервисы
+    for dimension in ("template", "service"):
+        if top is not None and dimension in dimensions:
+            totals = limit_top(totals, dimensions, dimension, top)
+            break
+    if fill and width is not None:
+        totals = fill_buckets(totals, width, start_time, end_time)
+
+    texts = {}
+    if "template" in dimensions:
+        position = dimensions.index("template") + 1
+        texts = await template_texts(
+            session,
+            {key[position] for key in totals if isinstance(key[position], int)},
+        )
     stats = []
-    for row in rows:
-        entry = {"count": row.count}
-
-        if group_by == "hour" or group_by == "day":
-            entry["time_interval"] = row.time_interval
-        elif group_by == "level":
-            entry["level"] = row.level
-        elif group_by == "service":
-            entry["service"] = row.service
-
+    for key in sorted(totals, key=stats_order):
+        bucket, *values = key
+        entry = {"count": totals[key]}
+        if bucket is not None:
+            entry["time_interval"] = bucket.strftime(TIME_LABELS[unit])
+        entry.update(zip(dimensions, values))
+        if "template" in entry:
+            template_id = entry.pop("template")
+            if template_id == OTHER_GROUP:
+                entry["template_id"] = None
+                entry["template"] = OTHER_GROUP
+            else:
+                entry["template_id"] = template_id
+                entry["template"] = texts.get(template_id)
         stats.append(entry)
 
     return stats
 
 
-async def create_user(session: AsyncSession, user_data: UserRegister):
-    hashed_password = await hash_password(user_data.password)
+async def create_user(
+    session: AsyncSession, user_data: UserRegister, hashed_password: str
+):
     new_user = User(username=user_data.username, password=hashed_password)
     session.add(new_user)
     await session.commit()
@@ -152,9 +525,9 @@ async def get_user_by_username(session: AsyncSession, username: str):
     result = await session.execute(sel)
     user = result.scalars().first()
     if user:
-        logger.debug(f"Пользователь '{username}' был успешно найден (id: {user.id})")
+        logger.debug("Пользователь '%s' был успешно найден (id: %s)", username, user.id)
     else:
-        logger.debug(f"Пользователь '{username}' не найден в базе данных")
+        logger.debug("Пользователь '%s' не найден в базе данных", username)
     return user
 
 
@@ -163,18 +536,191 @@ async def get_user_by_id(session: AsyncSession, user_id: int):
     result = await session.execute(sel)
     user = result.scalars().first()
     if user:
-        logger.debug(f"Пользователь {user_id} был успешно найден")
+        logger.debug("Пользователь %s был успешно найден", user_id)
     else:
-        logger.debug(f"Пользователь {user_id} не найден в базе данных")
+        logger.debug("Пользователь %s не найден в базе данных", user_id)
     return user
 
 
-async def delete_old_logs(session: AsyncSession, before: datetime):
-    sel = delete(LogDB).where(LogDB.timestamp < before)
+async def delete_chunks(
+    session: AsyncSession,
+    table,
+    before: datetime,
+    service: str | None,
+    exclude_services: list[str],
+    chunk_size: int,
+):
+    query = select(table.c.id, table.c.timestamp, table.c.service, table.c.level)
+    query = query.where(table.c.timestamp < before)
+    if service is not None:
+        query = query.where(table.c.service == service_id(service))
+    if exclude_services:
+        query = query.where(table.c.service.not_in(service_ids(exclude_services)))
+    query = query.order_by(table.c.timestamp, table.c.id).limit(chunk_size)
+
+    async def read():
+        return [row._asdict() for row in await session.execute(query)]
+
+    while True:
+        rows = await read_with_services(session, read)
+        if not rows:
+            return
+
+        await decrement_rollups(session, rows)
+        await delete_by_ids(session, table, [row["id"] for row in rows])
+        await session.commit()
+        response_cache.invalidate(
+            rows[0]["timestamp"], rows[-1]["timestamp"], include_open=True
+        )
+        yield len(rows)
+
+        if len(rows) < chunk_size:
+            return
+
+
+async def drop_partition(session: AsyncSession, partition: Partition) -> int:
+    table = partition.table
+    bucket = minute_bucket(dialect_name(session), table.c.timestamp)
+    query = select(bucket, table.c.service, table.c.level, func.count()).group_by(
+        bucket, table.c.service, table.c.level
+    )
 
-    result = await session.execute(sel)
+    async def read():
+        return list(await session.execute(query))
+
+    # Роллапы диапазона учитывают и архивные логи, поэтому вычитается
+    # и считается только содержимое самой секции
+    totals = Counter()
+    for minute, service, level, count in await read_with_services(session, read):
+        if isinstance(minute, str):
+            minute = datetime.fromisoformat(minute)
+        totals[(minute, service, level)] += count
+    await subtract_rollups(session, totals)
+    await session.run_sync(
+        lambda sync_session: partition_router.drop(sync_session.connection(), partition)
+    )
     await session.commit()
+    response_cache.invalidate(partition.start, partition.end, include_open=True)
+    return sum(totals.values())
+
+
+async def delete_by_ids(session: AsyncSession, table, ids: list[int]):
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        batch = ids[start : start + DELETE_BATCH_SIZE]
+        await session.execute(delete(table).where(table.c.id.in_(batch)))
+
+
+async def prune_segment(
+    session: AsyncSession,
+    segment: Segment,
+    before: datetime,
+    service: str | None,
+    exclude_services: list[str],
+) -> int:
+    rows = await asyncio.to_thread(archive_catalog.read_rows, segment, ArchiveFilter())
+    deleted, kept = [], []
+    for row in rows:
+        expired = (
+            row["timestamp"] < naive(before)
+            and (service is None or row["service"] == service)
+            and row["service"] not in exclude_services
+        )
+        (deleted if expired else kept).append(row)
+    if not deleted:
+        return 0
+
+    if kept:
+        rewritten = await asyncio.to_thread(archive_catalog.write, kept)
+        if rewritten.path != segment.path:
+            archive_catalog.remove(segment)
+    else:
+        archive_catalog.remove(segment)
+    await decrement_rollups(session, deleted)
+    await session.commit()
+    response_cache.invalidate(
+        deleted[0]["timestamp"], deleted[-1]["timestamp"], include_open=True
+    )
+    return len(deleted)
+
+
+async def iter_archive_logs(
+    session: AsyncSession, before: datetime, chunk_size: int = ARCHIVE_SEGMENT_ROWS
+):
+    before = naive(before)
+    for partition in partition_router.retention_targets(before):
+        table = LogDB.__table__ if partition is None else partition.table
+        query = (
+            select(*(table.c[column.name] for column in LogDB.__table__.columns))
+            .where(table.c.timestamp < before)
+            .order_by(table.c.timestamp, table.c.id)
+            .limit(chunk_size)
+        )
+
+        async def read():
+            return [row._asdict() for row in await session.execute(query)]
+
+        while True:
+            rows = await read_with_services(session, read)
+            if not rows:
+                break
+
+            # Роллапы не уменьшаются: архивные логи по-прежнему учитываются в /stats
+            segment = await asyncio.to_thread(archive_catalog.write, rows)
+            try:
+                await delete_by_ids(session, table, [row["id"] for row in rows])
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                archive_catalog.remove(segment)
+                raise
+            yield len(rows)
+
+            if len(rows) < chunk_size:
+                break
+
+        if partition is not None and partition.end <= before:
+            await session.run_sync(
+                lambda sync_session: partition_router.drop(
+                    sync_session.connection(), partition
+                )
+            )
+            await session.commit()
+
+
+async def iter_delete_old_logs(
+    session: AsyncSession,
+    before: datetime,
+    service: str | None = None,
+    exclude_services: list[str] = (),
+    chunk_size: int = RETENTION_CHUNK_SIZE,
+):
+    whole_partitions = service is None and not exclude_services
+    for partition in partition_router.retention_targets(before):
+        if partition is None:
+            table = LogDB.__table__
+        elif whole_partitions and partition.end <= naive(before):
+            yield await drop_partition(session, partition)
+            continue
+        else:
+            table = partition.table
+
+        async for count in delete_chunks(
+            session, table, before, service, exclude_services, chunk_size
+        ):
+            yield count
+
+    for segment in archive_catalog.older_than(before):
+        count = await prune_segment(session, segment, before, service, exclude_services)
+        if count:
+            yield count
+
+
+async def delete_old_logs(
+    session: AsyncSession, before: datetime, service: str | None = None
+):
+    deleted_count = 0
+    async for count in iter_delete_old_logs(session, before, service):
+        deleted_count += count
 
-    deleted_count = result.rowcount
     logger.info(f"Удалено {deleted_count} логов, созданных до {before.isoformat()}")
-    return deleted_count
\ No newline at end of file
+    return deleted_count
@@ -0,0 +1,100 @@
+import json
+import logging
+import re
+
+from sqlalchemy import inspect, literal_column, text
+
+from app.config import PROMOTED_METADATA_KEYS
+from app.crud.backend import SQLITE, json_extract, json_value
+from app.schemas.log_schemas import LogDB
+
+logger = logging.getLogger(__name__)
+
+KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+FILTER_PATTERN = re.compile(
+    r"^(?P<key>[A-Za-z0-9_.]+)(?P<op>>=|<=|!=|=|>|<)(?P<value>.*)$"
+)
+
+OPERATORS = {
+    "=": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+}
+
+promoted_columns: dict[str, str] = {}
+
+
+def promoted_column_name(key: str) -> str:
+    return "meta_" + key.replace(".", "__")
+
+
+def parse_metadata_filter(expression: str) -> tuple[str, str, object]:
+    match = FILTER_PATTERN.match(expression)
+    if not match or not KEY_PATTERN.match(match["key"]):
+        raise ValueError(f"Некорректный фильтр по метаданным: {expression!r}")
+
+    raw_value = match["value"]
+    try:
+        value = json.loads(raw_value)
+    except json.JSONDecodeError:
+        value = raw_value
+    if isinstance(value, (dict, list)):
+        raise ValueError(
+            f"Фильтр по метаданным должен сравнивать скаляр: {expression!r}"
+        )
+    return match["key"], match["op"], value
+
+
+def metadata_expression(key: str, model=LogDB, dialect: str = SQLITE):
+    column_name = promoted_column_name(key)
+    if column_name in promoted_columns:
+        return literal_column(f"log.{column_name}")
+    return json_extract(dialect, model.metadata_json, key)
+
+
+def apply_metadata_filters(
+    query,
+    filters: list[tuple[str, str, object]],
+    model=LogDB,
+    dialect: str = SQLITE,
+):
+    for key, op, value in filters:
+        column = metadata_expression(key, model, dialect)
+        if value is None:
+            query = query.where(column.is_(None) if op == "=" else column.is_not(None))
+        else:
+            query = query.where(OPERATORS[op](column, json_value(dialect, value)))
+    return query
+
+
+def sync_promoted_columns(
+    connection, keys: list[str] = PROMOTED_METADATA_KEYS, table_name: str = "log"
+):
+    if connection.dialect.name != "sqlite":
+        return
+    existing = {
+        column["name"] for column in inspect(connection).get_columns(table_name)
+    }
+    for key in keys:
+        if not KEY_PATTERN.match(key):
+            logger.error(f"Некорректный ключ метаданных для индексации: {key!r}")
+            continue
+        column_name = promoted_column_name(key)
+        if column_name not in existing:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table_name} ADD COLUMN {column_name} "
+                    f"GENERATED ALWAYS AS (json_extract(metadata_json, '$.{key}')) VIRTUAL"
+                )
+            )
+            logger.info(f"Добавлена генерируемая колонка {column_name} для ключа {key}")
+        connection.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{column_name} "
+                f"ON {table_name} ({column_name})"
+            )
+        )
+        promoted_columns[column_name] = key
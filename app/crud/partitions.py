@@ -0,0 +1,231 @@
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import (MetaData, Table, func, inspect, literal_column, select,
+                        text, union_all)
+from sqlalchemy.orm import aliased
+
+from app.config import LOG_PARTITION_PERIOD
+from app.crud.backend import SQLITE, text_rank
+from app.crud.metadata_filters import promoted_columns, sync_promoted_columns
+from app.schemas.log_schemas import (LogDB, fts_ddl, fts_table, log_fts,
+                                     log_partition_table)
+from app.utils.cache import naive
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"day": timedelta(days=1), "week": timedelta(weeks=1)}
+PARTITION_PATTERN = re.compile(r"^log_(day|week)_(\d{8})$")
+EPOCH = datetime(1970, 1, 1)
+
+# Старшие биты id хранят номер дня начала партиции, поэтому id уникальны
+# между партициями и по id можно найти партицию без запроса к БД.
+ID_SHIFT = 37
+
+
+@dataclass
+class Partition:
+    period: str
+    start: datetime
+    table: Table
+
+    @property
+    def end(self) -> datetime:
+        return self.start + PERIODS[self.period]
+
+    @property
+    def fts(self):
+        return fts_table(self.table.name)
+
+
+@dataclass
+class LogSource:
+    model: object
+    rank: object = None
+    searched: bool = False
+    dialect: str = SQLITE
+
+
+class PartitionRouter:
+    def __init__(self, period: str | None = None):
+        self.period = period
+        self.dialect = SQLITE
+        self.metadata = MetaData()
+        self.partitions: dict[str, Partition] = {}
+        self.legacy_range: tuple[datetime, datetime] | None = None
+
+    @property
+    def enabled(self) -> bool:
+        # Партиции на отдельных таблицах поддерживаются только для SQLite
+        return self.period in PERIODS and self.dialect == SQLITE
+
+    def period_start(self, timestamp: datetime) -> datetime:
+        day = naive(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.period == "week":
+            day -= timedelta(days=day.weekday())
+        return day
+
+    def build(self, period: str, start: datetime) -> Partition:
+        name = f"log_{period}_{start:%Y%m%d}"
+        table = self.metadata.tables.get(name)
+        if table is None:
+            table = log_partition_table(name, self.metadata)
+        return Partition(period, start, table)
+
+    @staticmethod
+    def id_base(start: datetime) -> int:
+        return max((start - EPOCH).days + 1, 1) << ID_SHIFT
+
+    def sync(self, connection):
+        self.partitions.clear()
+        self.legacy_range = None
+        self.dialect = connection.dialect.name
+        if self.period in PERIODS and not self.enabled:
+            logger.warning(
+                f"Партиционирование логов не поддерживается для {self.dialect}, "
+                f"LOG_PARTITION_PERIOD={self.period} игнорируется"
+            )
+        if not self.enabled:
+            return
+
+        for name in inspect(connection).get_table_names():
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                partition = self.build(match[1], datetime.strptime(match[2], "%Y%m%d"))
+                sync_promoted_columns(connection, list(promoted_columns.values()), name)
+                self.partitions[name] = partition
+
+        low, high = connection.execute(
+            select(func.min(LogDB.timestamp), func.max(LogDB.timestamp))
+        ).one()
+        if low is not None:
+            self.legacy_range = (low, high)
+        logger.info(
+            f"Найдено {len(self.partitions)} партиций логов (период {self.period})"
+        )
+
+    def ensure(self, connection, timestamps) -> dict[datetime, Partition]:
+        partitions = {}
+        for start in {self.period_start(timestamp) for timestamp in timestamps}:
+            partition = self.build(self.period, start)
+            name = partition.table.name
+            if name not in self.partitions:
+                partition.table.create(connection, checkfirst=True)
+                for ddl in fts_ddl(name):
+                    connection.execute(text(ddl))
+                sync_promoted_columns(connection, list(promoted_columns.values()), name)
+                connection.execute(
+                    text(
+                        "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                        "WHERE NOT EXISTS "
+                        "(SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+                    ),
+                    {"name": name, "seq": self.id_base(start)},
+                )
+            partitions[start] = partition
+        return partitions
+
+    def register(self, partitions):
+        for partition in partitions:
+            if partition.table.name not in self.partitions:
+                self.partitions[partition.table.name] = partition
+                logger.info(f"Создана партиция логов {partition.table.name}")
+
+    def drop(self, connection, partition: Partition):
+        self.partitions.pop(partition.table.name, None)
+        connection.execute(text(f"DROP TABLE IF EXISTS {partition.fts.name}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {partition.table.name}"))
+        logger.info(f"Удалена партиция логов {partition.table.name}")
+
+    def select_partitions(
+        self, start_time: datetime | None, end_time: datetime | None
+    ) -> list[Partition]:
+        start_time, end_time = naive(start_time), naive(end_time)
+        return sorted(
+            (
+                partition
+                for partition in self.partitions.values()
+                if (start_time is None or partition.end > start_time)
+                and (end_time is None or partition.start <= end_time)
+            ),
+            key=lambda partition: partition.start,
+        )
+
+    def legacy_overlaps(
+        self, start_time: datetime | None, end_time: datetime | None
+    ) -> bool:
+        if self.legacy_range is None:
+            return False
+        low, high = self.legacy_range
+        return (start_time is None or high >= naive(start_time)) and (
+            end_time is None or low <= naive(end_time)
+        )
+
+    @staticmethod
+    def branch(table, fts, q: str | None):
+        columns = [table.c[column.name] for column in LogDB.__table__.columns]
+        columns += [
+            literal_column(f"{table.name}.{name}").label(name)
+            for name in promoted_columns
+        ]
+        query = select(*columns)
+        if q:
+            query = (
+                query.add_columns(fts.c.rank.label("rank"))
+                .join_from(table, fts, fts.c.rowid == table.c.id)
+                .where(literal_column(fts.name).match(q))
+            )
+        return query
+
+    def source(
+        self,
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
+        q: str | None = None,
+        dialect: str = SQLITE,
+    ) -> LogSource:
+        if dialect != SQLITE:
+            return LogSource(
+                LogDB, text_rank(LogDB.message, q) if q else None, dialect=dialect
+            )
+        if not self.enabled:
+            return LogSource(LogDB, log_fts.c.rank if q else None)
+
+        branches = [
+            self.branch(partition.table, partition.fts, q)
+            for partition in self.select_partitions(start_time, end_time)
+        ]
+        if self.legacy_overlaps(start_time, end_time) or not branches:
+            branches.insert(0, self.branch(LogDB.__table__, log_fts, q))
+
+        subquery = (
+            union_all(*branches) if len(branches) > 1 else branches[0]
+        ).subquery("log")
+        model = aliased(LogDB, subquery, adapt_on_names=True)
+        return LogSource(model, subquery.c.rank if q else None, searched=True)
+
+    def tables_for_ids(self, log_ids: list[int]) -> dict[str, list[int]]:
+        if not self.enabled:
+            return {"log": log_ids}
+
+        groups = {}
+        for log_id in log_ids:
+            index = log_id >> ID_SHIFT
+            if not index:
+                groups.setdefault("log", []).append(log_id)
+                continue
+            start = EPOCH + timedelta(days=index - 1)
+            for name, partition in self.partitions.items():
+                if partition.start == start:
+                    groups.setdefault(name, []).append(log_id)
+        return groups
+
+    def retention_targets(self, before: datetime) -> list[Partition | None]:
+        if not self.enabled:
+            return [None]
+        return [None] + self.select_partitions(None, naive(before))
+
+
+partition_router = PartitionRouter(LOG_PARTITION_PERIOD)
@@ -0,0 +1,363 @@
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.archive import ArchiveFilter, archive_catalog
+from app.crud.backend import SQLITE, dialect_name, minute_bucket, upsert
+from app.crud.metadata_filters import apply_metadata_filters
+from app.crud.partitions import partition_router
+from app.crud.services import read_with_services, service_id
+from app.schemas.log_schemas import (LogDB, LogRollupDay, LogRollupHour,
+                                     LogRollupMinute)
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = {
+    "minute": LogRollupMinute,
+    "hour": LogRollupHour,
+    "day": LogRollupDay,
+}
+
+STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+TIME_LABELS = {
+    "minute": "%Y-%m-%dT%H:%M:00Z",
+    "hour": "%Y-%m-%dT%H:00:00Z",
+    "day": "%Y-%m-%dT00:00Z",
+}
+
+DIMENSION_COLUMNS = {"level": "level", "service": "service", "template": "template_id"}
+DIMENSIONS = tuple(DIMENSION_COLUMNS)
+# Шаблоны не хранятся в роллапах, такие группировки считаются по сырым логам
+RAW_DIMENSIONS = ("template",)
+
+INTERVAL_PATTERN = re.compile(r"^(\d+)([mhd])$")
+INTERVAL_UNITS = {"m": "minute", "h": "hour", "d": "day"}
+
+EPOCH = datetime(1970, 1, 1)
+OTHER_GROUP = "__other__"
+MAX_FILL_BUCKETS = 10000
+
+
+def truncate(timestamp: datetime, granularity: str) -> datetime:
+    timestamp = timestamp.replace(second=0, microsecond=0, tzinfo=None)
+    if granularity in ("hour", "day"):
+        timestamp = timestamp.replace(minute=0)
+    if granularity == "day":
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def ceil(timestamp: datetime, granularity: str) -> datetime:
+    floor = truncate(timestamp, granularity)
+    if floor == timestamp.replace(tzinfo=None):
+        return floor
+    return floor + STEPS[granularity]
+
+
+def plan_segments(
+    start: datetime | None, end: datetime | None, granularities: list[str]
+) -> list[tuple[str | None, datetime | None, datetime | None]]:
+    if not granularities:
+        return [(None, start, end)]
+
+    granularity, finer = granularities[0], granularities[1:]
+    inner_start = ceil(start, granularity) if start is not None else None
+    inner_end = truncate(end, granularity) if end is not None else None
+    if inner_start is not None and inner_end is not None and inner_start >= inner_end:
+        return plan_segments(start, end, finer)
+
+    segments = []
+    if start is not None and start.replace(tzinfo=None) < inner_start:
+        segments += plan_segments(start, inner_start, finer)
+    segments.append((granularity, inner_start, inner_end))
+    if end is not None and inner_end < end.replace(tzinfo=None):
+        segments += plan_segments(inner_end, end, finer)
+    return segments
+
+
+async def increment_rollups(session: AsyncSession, rows: list[dict]):
+    dialect = dialect_name(session)
+    for granularity, model in ROLLUPS.items():
+        counts = Counter(
+            (truncate(row["timestamp"], granularity), row["service"], row["level"])
+            for row in rows
+        )
+        if not counts:
+            continue
+
+        table = model.__table__
+        stmt = upsert(dialect, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.bucket, table.c.service, table.c.level],
+            set_={"count": table.c.count + stmt.excluded.count},
+        )
+        await session.execute(
+            stmt,
+            [
+                {"bucket": bucket, "service": service, "level": level, "count": count}
+                for (bucket, service, level), count in counts.items()
+            ],
+        )
+
+
+async def decrement_rollups(session: AsyncSession, rows: list[dict]):
+    await subtract_rollups(
+        session,
+        Counter((row["timestamp"], row["service"], row["level"]) for row in rows),
+    )
+
+
+async def subtract_rollups(session: AsyncSession, totals: Counter):
+    for granularity, model in ROLLUPS.items():
+        counts = Counter()
+        for (timestamp, service, level), count in totals.items():
+            counts[(truncate(timestamp, granularity), service, level)] += count
+        if not counts:
+            continue
+
+        table = model.__table__
+        await session.execute(
+            update(table)
+            .where(
+                table.c.bucket == bindparam("b_bucket"),
+                table.c.service == bindparam("b_service"),
+                table.c.level == bindparam("b_level"),
+            )
+            .values(count=table.c.count - bindparam("b_count")),
+            [
+                {
+                    "b_bucket": bucket,
+                    "b_service": service,
+                    "b_level": level,
+                    "b_count": count,
+                }
+                for (bucket, service, level), count in counts.items()
+            ],
+        )
+        buckets = [bucket for bucket, _, _ in counts]
+        await session.execute(
+            delete(table).where(
+                table.c.bucket.between(min(buckets), max(buckets)),
+                table.c.count <= 0,
+            )
+        )
+
+
+def segment_query(
+    granularity,
+    start,
+    end,
+    dimensions,
+    bucketed,
+    level,
+    service,
+    source=LogDB,
+    dialect=SQLITE,
+):
+    if granularity is None:
+        model = source
+        column = source.timestamp
+        value = func.count()
+        bucket = minute_bucket(dialect, source.timestamp)
+    else:
+        model = ROLLUPS[granularity]
+        column = model.bucket
+        value = func.sum(model.count)
+        bucket = model.bucket
+
+    keys = [bucket.label("bucket")] if bucketed else []
+    keys += [getattr(model, DIMENSION_COLUMNS[dimension]) for dimension in dimensions]
+    query = select(value.label("count"), *keys).select_from(model)
+    if start is not None:
+        query = query.where(column >= start)
+    if end is not None:
+        query = query.where(column < end)
+    if level is not None:
+        query = query.where(model.level == level)
+    if service is not None and granularity is None:
+        query = query.where(model.service == service_id(service))
+    elif service is not None:
+        # Роллапы хранят имя сервиса, а не id из словаря
+        query = query.where(model.service == service)
+    if keys:
+        query = query.group_by(*keys)
+    return query
+
+
+async def aggregate_counts(
+    session: AsyncSession,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    dimensions: list[str] = (),
+    width: timedelta | None = None,
+    level: str | None = None,
+    service: str | None = None,
+    metadata: list | None = None,
+    use_rollups: bool = True,
+) -> Counter:
+    raw_dimensions = any(dimension in RAW_DIMENSIONS for dimension in dimensions)
+    if metadata or raw_dimensions or not use_rollups:
+        segments = [(None, start_time, end_time)]
+    else:
+        segments = plan_segments(start_time, end_time, rollup_granularities(width))
+
+    dialect = dialect_name(session)
+    totals = Counter()
+    for granularity, start, end in segments:
+        model = (
+            partition_router.source(start, end).model if granularity is None else LogDB
+        )
+        query = segment_query(
+            granularity,
+            start,
+            end,
+            dimensions,
+            width is not None,
+            level,
+            service,
+            model,
+            dialect,
+        )
+        if metadata:
+            query = apply_metadata_filters(query, metadata, model, dialect)
+
+        async def read():
+            return list(await session.execute(query))
+
+        rows = await read_with_services(session, read)
+        if granularity is None:
+            archive_filter = ArchiveFilter(
+                start_time=start,
+                end_time=end,
+                end_inclusive=False,
+                level=level,
+                service=service,
+                metadata=metadata,
+            )
+            archived = await archive_catalog.grouped_counts(
+                archive_filter, dimensions, width is not None, DIMENSION_COLUMNS
+            )
+            rows += [
+                (count, *(key if width is not None else key[1:]))
+                for key, count in archived.items()
+            ]
+
+        for count, *keys in rows:
+            if not count:
+                continue
+            if width is not None:
+                bucket = keys.pop(0)
+                if isinstance(bucket, str):
+                    bucket = datetime.fromisoformat(bucket)
+                keys.insert(0, floor_bucket(bucket, width))
+            else:
+                keys.insert(0, None)
+            totals[tuple(keys)] += count
+
+    logger.debug(
+        f"Статистика собрана из {len(segments)} сегментов: "
+        f"{[granularity or 'raw' for granularity, _, _ in segments]}"
+    )
+    return totals
+
+
+def parse_grouping(group_by: str | None, interval: str | None):
+    parts = [part.strip() for part in (group_by or "").split(",") if part.strip()]
+    unknown = [
+        part for part in parts if part not in TIME_LABELS and part not in DIMENSIONS
+    ]
+    if unknown:
+        raise ValueError(f"Неизвестные измерения группировки: {', '.join(unknown)}")
+    if len(set(parts)) != len(parts):
+        raise ValueError("Измерения группировки не должны повторяться")
+
+    time_parts = [part for part in parts if part in TIME_LABELS]
+    if len(time_parts) > 1:
+        raise ValueError("Можно группировать только по одному временному измерению")
+    dimensions = [part for part in parts if part in DIMENSIONS]
+    unit = time_parts[0] if time_parts else None
+    width = STEPS[unit] if unit else None
+
+    if interval:
+        match = INTERVAL_PATTERN.match(interval)
+        if not match or int(match[1]) == 0:
+            raise ValueError(
+                f"Некорректный интервал {interval!r}. Используйте, например, 5m, 2h или 1d"
+            )
+        interval_unit = INTERVAL_UNITS[match[2]]
+        width = int(match[1]) * STEPS[interval_unit]
+        if unit is None:
+            unit = interval_unit
+        elif width % STEPS[unit]:
+            raise ValueError(
+                f"Интервал {interval!r} должен быть кратен измерению {unit}"
+            )
+    return dimensions, width, unit
+
+
+def rollup_granularities(width: timedelta | None) -> list[str]:
+    granularities = ["day", "hour", "minute"]
+    if width is None:
+        return granularities
+    for index, granularity in enumerate(granularities):
+        if not width % STEPS[granularity]:
+            return granularities[index:]
+    return []
+
+
+def floor_bucket(timestamp: datetime, width: timedelta) -> datetime:
+    return EPOCH + (timestamp - EPOCH) // width * width
+
+
+def limit_top(
+    totals: Counter, dimensions: list[str], dimension: str, top: int
+) -> Counter:
+    position = dimensions.index(dimension) + 1
+    by_value = Counter()
+    for key, count in totals.items():
+        by_value[key[position]] += count
+    keep = {value for value, _ in by_value.most_common(top)}
+
+    limited = Counter()
+    for key, count in totals.items():
+        if key[position] not in keep:
+            key = key[:position] + (OTHER_GROUP,) + key[position + 1 :]
+        limited[key] += count
+    return limited
+
+
+def fill_buckets(
+    totals: Counter,
+    width: timedelta,
+    start_time: datetime | None,
+    end_time: datetime | None,
+) -> Counter:
+    buckets = [key[0] for key in totals]
+    first = floor_bucket(start_time.replace(tzinfo=None), width) if start_time else None
+    last = floor_bucket(end_time.replace(tzinfo=None), width) if end_time else None
+    first = first or (min(buckets) if buckets else None)
+    last = last or (max(buckets) if buckets else None)
+    if first is None or last is None or first > last:
+        return totals
+    if (last - first) // width >= MAX_FILL_BUCKETS:
+        raise ValueError(
+            f"Слишком много интервалов для заполнения (больше {MAX_FILL_BUCKETS})"
+        )
+
+    groups = {key[1:] for key in totals} or {()}
+    filled = Counter(totals)
+    bucket = first
+    while bucket <= last:
+        for group in groups:
+            filled.setdefault((bucket, *group), 0)
+        bucket += width
+    return filled
@@ -0,0 +1,73 @@
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.backend import dialect_name, upsert
+from app.schemas.log_schemas import Service, UnknownService, service_names
+
+logger = logging.getLogger(__name__)
+
+
+def load_services(connection):
+    service_names.clear()
+    service_names.register(
+        {
+            name: service_id
+            for service_id, name in connection.execute(select(Service.id, Service.name))
+        }
+    )
+    logger.info(f"Загружено {len(service_names.ids)} сервисов в словарь")
+
+
+async def refresh_services(session: AsyncSession):
+    result = await session.execute(select(Service.name, Service.id))
+    service_names.register(dict(result.all()))
+    logger.info(f"Словарь сервисов перечитан: {len(service_names.ids)} сервисов")
+
+
+async def read_with_services(session: AsyncSession, read):
+    # Сервис мог создать другой процесс уже после загрузки словаря
+    try:
+        return await read()
+    except UnknownService:
+        await refresh_services(session)
+        return await read()
+
+
+def service_id(name: str):
+    # Имя переводится в id самой базой, поэтому фильтр не зависит от словаря процесса
+    return select(Service.id).where(Service.name == name).scalar_subquery()
+
+
+def service_ids(names: list[str]):
+    return select(Service.id).where(Service.name.in_(names))
+
+
+async def resolve_service_ids(
+    session: AsyncSession, names
+) -> tuple[dict[str, int], dict[str, int]]:
+    ids = {name: service_names.ids[name] for name in names if name in service_names.ids}
+    missing = [name for name in set(names) if name not in ids]
+    if not missing:
+        return ids, {}
+
+    await session.execute(
+        upsert(dialect_name(session), Service).on_conflict_do_nothing(
+            index_elements=[Service.name]
+        ),
+        [{"name": name} for name in missing],
+    )
+    result = await session.execute(
+        select(Service.name, Service.id).where(Service.name.in_(missing))
+    )
+    # В кэш новые сервисы попадают только после коммита транзакции
+    created = dict(result.all())
+    ids.update(created)
+    return ids, created
+
+
+def register_services(created: dict[str, int]):
+    if created:
+        service_names.register(created)
+        logger.info(f"Добавлены сервисы в словарь: {sorted(created)}")
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.backend import dialect_name, greatest, least, upsert
+from app.crud.rollups import aggregate_counts
+from app.schemas.log_schemas import LogTemplate
+from app.utils.cache import naive
+from app.utils.templates import Template, template_miner
+
+logger = logging.getLogger(__name__)
+
+
+def load_templates(connection):
+    template_miner.clear()
+    template_miner.load(
+        connection.execute(select(LogTemplate.id, LogTemplate.template)).all()
+    )
+    logger.info(f"Загружено {len(template_miner.templates)} шаблонов сообщений")
+
+
+async def allocate_templates(session: AsyncSession, templates, timestamp):
+    texts = {template.text for template in templates}
+    if not texts:
+        return
+    # id выдаёт база: одинаковый шаблон из разных процессов получает один id
+    stmt = upsert(dialect_name(session), LogTemplate).on_conflict_do_nothing(
+        index_elements=[LogTemplate.template]
+    )
+    await session.execute(
+        stmt,
+        [
+            {
+                "template": text,
+                "count": 0,
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+            }
+            for text in texts
+        ],
+    )
+    result = await session.execute(
+        select(LogTemplate.template, LogTemplate.id).where(
+            LogTemplate.template.in_(texts)
+        )
+    )
+    ids = dict(result.all())
+    for template in templates:
+        template.id = ids[template.text]
+
+
+async def assign_templates(session: AsyncSession, rows: list[dict]) -> list[Template]:
+    templates = await asyncio.to_thread(
+        template_miner.add_messages, [row["message"] for row in rows]
+    )
+    await allocate_templates(
+        session,
+        [template for template in templates if template.id is None],
+        naive(rows[0]["timestamp"]),
+    )
+    seen = {}
+    for row, template in zip(rows, templates):
+        row["template_id"] = template.id
+        timestamp = naive(row["timestamp"])
+        entry = seen.setdefault(
+            template.id,
+            {
+                "template_id": template.id,
+                "text": template.text,
+                "added": 0,
+                "first": timestamp,
+                "last": timestamp,
+            },
+        )
+        entry["added"] += 1
+        entry["first"] = min(entry["first"], timestamp)
+        entry["last"] = max(entry["last"], timestamp)
+
+    dialect = dialect_name(session)
+    table = LogTemplate.__table__
+    other = table.alias("other")
+    # Обобщённый текст может совпасть с другим шаблоном, тогда текст не меняется
+    taken = (
+        select(other.c.id)
+        .where(other.c.template == bindparam("text"), other.c.id != table.c.id)
+        .exists()
+    )
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("template_id"))
+        .values(
+            template=case((taken, table.c.template), else_=bindparam("text")),
+            count=table.c.count + bindparam("added"),
+            first_seen=least(dialect, table.c.first_seen, bindparam("first")),
+            last_seen=greatest(dialect, table.c.last_seen, bindparam("last")),
+        )
+    )
+    await session.execute(stmt, list(seen.values()))
+    # В дерево шаблоны попадают только после коммита, как и сервисы
+    return list({id(template): template for template in templates}.values())
+
+
+def register_templates(templates: list[Template]):
+    if templates:
+        template_miner.register(templates)
+
+
+async def template_texts(session: AsyncSession, template_ids) -> dict[int, str]:
+    templates = template_miner.templates
+    missing = [
+        template_id for template_id in template_ids if template_id not in templates
+    ]
+    if missing:
+        # Шаблон мог найти другой процесс: берём его из базы и добавляем в дерево
+        result = await session.execute(
+            select(LogTemplate.id, LogTemplate.template).where(
+                LogTemplate.id.in_(missing)
+            )
+        )
+        template_miner.load(result.all())
+    return {
+        template_id: templates[template_id].text
+        for template_id in template_ids
+        if template_id in templates
+    }
+
+
+async def get_patterns(
+    session: AsyncSession,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    level: str | None = None,
+    service: str | None = None,
+    limit: int = 50,
+):
+    if end_time is not None:
+        end_time += timedelta(microseconds=1)
+    totals = await aggregate_counts(
+        session,
+        start_time=start_time,
+        end_time=end_time,
+        dimensions=["template"],
+        level=level,
+        service=service,
+    )
+    counts = {
+        template_id: count
+        for (_, template_id), count in totals.items()
+        if template_id is not None
+    }
+    top = sorted(counts, key=lambda template_id: (-counts[template_id], template_id))
+    top = top[:limit]
+    result = await session.execute(select(LogTemplate).where(LogTemplate.id.in_(top)))
+    templates = {template.id: template for template in result.scalars()}
+
+    return [
+        {
+            "template_id": template_id,
+            "template": templates[template_id].template,
+            "count": counts[template_id],
+            "first_seen": templates[template_id].first_seen,
+            "last_seen": templates[template_id].last_seen,
+        }
+        for template_id in top
+        if template_id in templates
+    ]
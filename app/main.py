@@ -6,7 +6,13 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 
 from app.api import logs
-from app.config import init_db
+from app.config import (INGEST_QUEUE_ENABLED, METRICS_ENABLED,
+                        PROFILING_ENABLED, engine, init_db, read_engine)
+from app.core.ingest import ingest_queue
+from app.core.maintenance import sqlite_maintenance
+from app.core.metrics import MetricsMiddleware, install_query_hooks
+from app.core.profiling import ProfilingMiddleware
+from app.core.retention import retention_manager
 from app.utils.logger import setup_logger
 
 setup_logger()
@@ -20,12 +26,26 @@ async def lifespan(_app: FastAPI):
     logger.info("Началась инициализация базы данных")
     await init_db()
     logger.info("База данных успешно инициализирована")
+    if INGEST_QUEUE_ENABLED:
+        await ingest_queue.start()
+    await retention_manager.start()
+    await sqlite_maintenance.start()
     yield
 
     logger.info("Приложение завершает работу")
+    await sqlite_maintenance.stop()
+    await retention_manager.stop()
+    await ingest_queue.stop()
+    await read_engine.dispose()
+    await engine.dispose()
 
 
 app = FastAPI(title="Log Analyzer", lifespan=lifespan)
+if METRICS_ENABLED:
+    install_query_hooks()
+    app.add_middleware(MetricsMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 app.include_router(logs.router)
 
 logger.info("Приложение Log Analyzer запущено и готово принимать запросы")
@@ -1,8 +1,16 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, Index, String, Text
+from sqlalchemy import (DDL, Column, DateTime, ForeignKey, Index, Integer,
+                        MetaData, SmallInteger, String, Table, Text, column,
+                        event, table)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.types import TypeDecorator
+
+LEVEL_CODES = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LEVEL_NAMES = {code: level for level, code in LEVEL_CODES.items()}
+UNKNOWN_CODE = -1
+SEARCH_CONFIG = "simple"
 
 
 class Base(DeclarativeBase):
@@ -20,20 +28,99 @@ class User(Base):
         return f"id = {self.id!r}, login= {self.username!r}"
 
 
+class ServiceNames:
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.names: dict[int, str] = {}
+
+    def register(self, ids: dict[str, int]):
+        self.ids.update(ids)
+        self.names.update((service_id, name) for name, service_id in ids.items())
+
+    def clear(self):
+        self.ids.clear()
+        self.names.clear()
+
+
+service_names = ServiceNames()
+
+
+class UnknownService(LookupError):
+    pass
+
+
+class LevelCode(TypeDecorator):
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return LEVEL_CODES.get(value, UNKNOWN_CODE)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else LEVEL_NAMES[value]
+
+
+class ServiceRef(TypeDecorator):
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        service_id = service_names.ids.get(value)
+        if service_id is None:
+            raise UnknownService(f"Сервис {value!r} отсутствует в словаре сервисов")
+        return service_id
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        name = service_names.names.get(value)
+        if name is None:
+            raise UnknownService(f"Сервис с id={value} отсутствует в словаре сервисов")
+        return name
+
+
+class Service(Base):
+    __tablename__ = "service"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(100), unique=True)
+
+    def __repr__(self):
+        return f"id = {self.id!r}, name = {self.name!r}"
+
+
+class LogTemplate(Base):
+    __tablename__ = "log_template"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    template: Mapped[str] = mapped_column(Text(), unique=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    first_seen: Mapped[datetime] = mapped_column(DateTime)
+    last_seen: Mapped[datetime] = mapped_column(DateTime)
+
+    def __repr__(self):
+        return f"id = {self.id!r}, template = {self.template!r}, count = {self.count!r}"
+
+
 class LogDB(Base):
     __tablename__ = "log"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
-    level: Mapped[str] = mapped_column(String(20))
-    service: Mapped[str] = mapped_column(String(100))
+    level: Mapped[str] = mapped_column(LevelCode)
+    service: Mapped[str] = mapped_column(ServiceRef, ForeignKey("service.id"))
     message: Mapped[str] = mapped_column(String())
     metadata_json: Mapped[Optional[str]] = mapped_column(Text(), nullable=True)
+    template_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     __table_args__ = (
         Index("index_log_timestamp", "timestamp"),
-        Index("index_log_level", "level"),
         Index("index_log_service", "service"),
+        Index("index_log_template", "template_id"),
         Index("idx_log_level_service", "level", "service"),
     )
 
@@ -41,4 +128,87 @@ class LogDB(Base):
         return (
             f"id = {self.id!r}, timestamp = {self.timestamp!r},"
             f" level = {self.level!r}, service = {self.service!r}, message = {self.message!r}"
-        )
\ No newline at end of file
+        )
+
+
+def fts_ddl(table_name: str) -> list[str]:
+    fts = f"{table_name}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+        f"USING fts5(message, content='{table_name}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts}(rowid, message) VALUES (new.id, new.message); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, message) "
+        f"VALUES ('delete', old.id, old.message); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au "
+        f"AFTER UPDATE OF message ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, message) "
+        f"VALUES ('delete', old.id, old.message); "
+        f"INSERT INTO {fts}(rowid, message) VALUES (new.id, new.message); END",
+    ]
+
+
+def fts_table(table_name: str):
+    return table(f"{table_name}_fts", column("rowid"), column("rank"))
+
+
+LOG_FTS_DDL = fts_ddl("log")
+
+for ddl in LOG_FTS_DDL:
+    event.listen(LogDB.__table__, "after_create", DDL(ddl).execute_if(dialect="sqlite"))
+
+event.listen(
+    LogDB.__table__,
+    "after_create",
+    DDL(
+        f"CREATE INDEX IF NOT EXISTS idx_log_message_tsv ON log "
+        f"USING gin (to_tsvector('{SEARCH_CONFIG}', message))"
+    ).execute_if(dialect="postgresql"),
+)
+
+log_fts = fts_table("log")
+
+
+def log_partition_table(name: str, metadata: MetaData) -> Table:
+    return Table(
+        name,
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("timestamp", DateTime),
+        Column("level", LevelCode),
+        Column("service", ServiceRef, ForeignKey(Service.id)),
+        Column("message", String()),
+        Column("metadata_json", Text(), nullable=True),
+        Column("template_id", Integer, nullable=True),
+        Index(f"index_{name}_timestamp", "timestamp"),
+        Index(f"index_{name}_service", "service"),
+        Index(f"index_{name}_template", "template_id"),
+        Index(f"idx_{name}_level_service", "level", "service"),
+        sqlite_autoincrement=True,
+    )
+
+
+class RollupMixin:
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    service: Mapped[str] = mapped_column(String(100), primary_key=True)
+    level: Mapped[str] = mapped_column(String(20), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self):
+        return (
+            f"bucket = {self.bucket!r}, service = {self.service!r},"
+            f" level = {self.level!r}, count = {self.count!r}"
+        )
+
+
+class LogRollupMinute(RollupMixin, Base):
+    __tablename__ = "log_rollup_minute"
+
+
+class LogRollupHour(RollupMixin, Base):
+    __tablename__ = "log_rollup_hour"
+
+
+class LogRollupDay(RollupMixin, Base):
+    __tablename__ = "log_rollup_day"
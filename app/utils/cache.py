@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from app.config import (RESPONSE_CACHE_CLOSED_TTL, RESPONSE_CACHE_MAX_BYTES,
+                        RESPONSE_CACHE_OPEN_TTL, RESPONSE_CACHE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+CLOSED_WINDOW_GRACE = timedelta(minutes=1)
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    expires_at: float
+    start: datetime | None
+    end: datetime | None
+    closed: bool
+
+
+class TTLCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float):
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        item = self._entries.pop(key, None)
+        return item[0] if item is not None else None
+
+    def discard_where(self, predicate):
+        stale = [key for key, (value, _) in self._entries.items() if predicate(value)]
+        for key in stale:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def naive(timestamp: datetime | None) -> datetime | None:
+    return timestamp.replace(tzinfo=None) if timestamp is not None else None
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_size: int,
+        open_ttl: float,
+        closed_ttl: float,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+    ):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl
+        self.closed_ttl = closed_ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+
+    @staticmethod
+    def make_key(path: str, params) -> tuple:
+        return path, tuple(sorted((key, value) for key, value in params if value != ""))
+
+    def get(self, key: tuple) -> CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self.discard(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(
+        self,
+        key: tuple,
+        body: bytes,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> CacheEntry:
+        start, end = naive(start), naive(end)
+        closed = end is not None and end + CLOSED_WINDOW_GRACE < naive(
+            datetime.now(timezone.utc)
+        )
+        ttl = self.closed_ttl if closed else self.open_ttl
+        entry = CacheEntry(
+            body=body,
+            etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            expires_at=time.monotonic() + ttl,
+            start=start,
+            end=end,
+            closed=closed,
+        )
+        self.discard(key)
+        # Тело больше всего бюджета не кэшируется, иначе вытеснило бы остальные
+        if self.max_size > 0 and len(body) <= self.max_bytes:
+            self._entries[key] = entry
+            self.bytes += len(body)
+            while len(self._entries) > self.max_size or self.bytes > self.max_bytes:
+                self.discard(next(iter(self._entries)))
+        return entry
+
+    def discard(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry.body)
+
+    def invalidate(
+        self,
+        start: datetime | None,
+        end: datetime | None,
+        include_open: bool = False,
+    ):
+        start, end = naive(start), naive(end)
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if (entry.closed or include_open)
+            and (start is None or entry.end is None or entry.end >= start)
+            and (end is None or entry.start is None or entry.start <= end)
+        ]
+        for key in stale:
+            self.discard(key)
+        if stale:
+            self.invalidations += len(stale)
+            logger.debug(f"Из кэша ответов удалено {len(stale)} записей")
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_OPEN_TTL, RESPONSE_CACHE_CLOSED_TTL
+)
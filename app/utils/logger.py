@@ -1,16 +1,80 @@
+import atexit
 import logging
 import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+from app.config import (LOG_BACKUP_COUNT, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES,
+                        LOG_SAMPLE_RATE)
 
-def setup_logger():
-    log_dir = "app/logs"
-    os.makedirs(log_dir, exist_ok=True)
+LOG_FORMAT = "%(asctime)s - %(filename)s - %(levelname)s - %(message)s"
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(filename)s - %(levelname)s - %(message)s",
-        filename=os.path.join(log_dir, "app.log"),
-        encoding="utf-8",
-        filemode="a",
-        force=True,
+# Помечает строки, которые пишутся на каждый запрос и могут прореживаться
+SAMPLED = {"sampled": True}
+
+listener: QueueListener | None = None
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or not getattr(record, "sampled", False):
+            return True
+        # Предупреждения и ошибки не прореживаются
+        if record.levelno > logging.INFO:
+            return True
+        return random.random() < self.rate
+
+
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Очередь живёт в том же процессе, поэтому запись не нужно готовить
+        # к сериализации: сообщение отформатирует поток записи, а не event loop
+        return record
+
+
+def stop_logger():
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+def setup_logger(
+    filename: str = LOG_FILE,
+    level: str = LOG_LEVEL,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+    sample_rate: float = LOG_SAMPLE_RATE,
+):
+    global listener
+    stop_logger()
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
     )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+
+
+atexit.register(stop_logger)
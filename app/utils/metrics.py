@@ -0,0 +1,120 @@
+import bisect
+import math
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values: dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] += amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, "", self.callback()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts: dict[tuple, list[int]] = {}
+        self.sums: dict[tuple, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels):
+        counts = self.counts.setdefault(labels, [0] * len(self.buckets))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self):
+        for labels, counts in sorted(self.counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                le = f'le="{format_value(bound)}"'
+                yield (
+                    f"{self.name}_bucket",
+                    format_labels(self.labels, labels, le),
+                    total,
+                )
+            label_text = format_labels(self.labels, labels)
+            yield f"{self.name}_sum", label_text, self.sums[labels]
+            yield f"{self.name}_count", label_text, total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self.metrics:
+            if isinstance(metric, Counter):
+                metric.values.clear()
+            elif isinstance(metric, Histogram):
+                metric.counts.clear()
+                metric.sums.clear()
+
+    def render(self) -> str:
+        # Текстовый формат Prometheus 0.0.4
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,17 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), log_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, log_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, TypeError):
+        raise ValueError(f"Некорректный курсор: {cursor!r}")
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import (PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_TIMEOUT,
+                        PASSWORD_HASH_WORKERS)
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hasher"
+        )
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, func, *args):
+        if self._pending >= self.max_pending:
+            logger.warning(
+                f"Очередь хеширования паролей переполнена ({self._pending} задач)"
+            )
+            raise PasswordHasherBusy()
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, func, *args), self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Хеширование пароля не уложилось в {self.timeout}с")
+            raise PasswordHasherBusy()
+        finally:
+            self._pending -= 1
+
+
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_TIMEOUT
+)
@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(self, interval: float = 0.005, thread_id: int | None = None):
+        self.interval = interval
+        # None — снимать стеки всех потоков процесса
+        self.thread_id = thread_id
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if self.thread_id is not None and thread_id != self.thread_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if self.thread_id is None:
+                stack.append(f"thread {names.get(thread_id, thread_id)}")
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        # Формат collapsed stacks: открывается в speedscope и flamegraph.pl
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
@@ -0,0 +1,211 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import product
+
+# Разбор повторяет синтаксис запросов FTS5, чтобы поиск по архиву находил
+# те же строки, что и MATCH по горячей таблице
+KEYWORDS = {"AND", "OR", "NOT", "NEAR"}
+WORD_PATTERN = re.compile(r"[^\W_]+")
+BAREWORD_PATTERN = re.compile(r"[\w\x1a]+")
+NEAR_DISTANCE = 10
+
+
+@lru_cache(maxsize=4096)
+def fold(char: str) -> str:
+    # unicode61 снимает диакритику только с латиницы: é → e, но й остаётся й
+    base = unicodedata.normalize("NFD", char)[0]
+    return base if base.isascii() else char
+
+
+def words(text: str) -> list[str]:
+    # Как токенизатор unicode61: буквы и цифры, без учёта регистра
+    text = text.lower()
+    if not text.isascii():
+        text = "".join(map(fold, text))
+    return WORD_PATTERN.findall(text)
+
+
+@dataclass
+class Phrase:
+    words: list[str]
+    prefix: bool = False
+    initial: bool = False
+
+    def positions(self, tokens: list[str]) -> list[int]:
+        if not self.words:
+            return []
+        size = len(self.words)
+        starts = range(1) if self.initial else range(len(tokens) - size + 1)
+        return [
+            start
+            for start in starts
+            if start + size <= len(tokens) and self.matches_at(tokens, start)
+        ]
+
+    def matches_at(self, tokens: list[str], start: int) -> bool:
+        *head, last = self.words
+        token = tokens[start + len(head)]
+        if not (token.startswith(last) if self.prefix else token == last):
+            return False
+        return all(tokens[start + index] == word for index, word in enumerate(head))
+
+    def evaluate(self, tokens: list[str]) -> bool:
+        return bool(self.positions(tokens))
+
+
+@dataclass
+class Near:
+    phrases: list[Phrase]
+    distance: int = NEAR_DISTANCE
+
+    def evaluate(self, tokens: list[str]) -> bool:
+        if not self.phrases:
+            return False
+        found = [phrase.positions(tokens) for phrase in self.phrases]
+        for starts in product(*found):
+            spans = sorted(
+                (start, start + len(phrase.words))
+                for start, phrase in zip(starts, self.phrases)
+            )
+            if spans[-1][0] - spans[0][1] <= self.distance:
+                return True
+        return False
+
+
+@dataclass
+class Operator:
+    name: str
+    left: object
+    right: object
+
+    def evaluate(self, tokens: list[str]) -> bool:
+        if self.name == "OR":
+            return self.left.evaluate(tokens) or self.right.evaluate(tokens)
+        if self.name == "AND":
+            return self.left.evaluate(tokens) and self.right.evaluate(tokens)
+        return self.left.evaluate(tokens) and not self.right.evaluate(tokens)
+
+
+def lex(q: str) -> list[tuple[str, str]]:
+    tokens = []
+    index = 0
+    while index < len(q):
+        char = q[index]
+        if char == '"':
+            end = index + 1
+            text = []
+            while end < len(q):
+                if q[end] == '"':
+                    if q[end + 1 : end + 2] != '"':
+                        break
+                    end += 1
+                text.append(q[end])
+                end += 1
+            tokens.append(("string", "".join(text)))
+            index = end + 1
+        elif char in "()*^+,":
+            tokens.append((char, char))
+            index += 1
+        elif match := BAREWORD_PATTERN.match(q, index):
+            value = match.group()
+            kind = "keyword" if value in KEYWORDS else "string"
+            if value == "NEAR" and q[match.end() : match.end() + 1] != "(":
+                kind = "string"
+            tokens.append((kind, value))
+            index = match.end()
+        else:
+            # FTS5 отверг бы такой символ, но до архива доходят уже проверенные
+            # базой запросы, поэтому здесь он просто разделяет слова
+            index += 1
+    return tokens
+
+
+class Parser:
+    def __init__(self, q: str):
+        self.tokens = lex(q)
+        self.index = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def accept(self, kind: str, value: str | None = None) -> bool:
+        token = self.peek()
+        if token is None or token[0] != kind or value not in (None, token[1]):
+            return False
+        self.index += 1
+        return True
+
+    def starts_primary(self) -> bool:
+        token = self.peek()
+        return token is not None and (
+            token[0] in ("string", "(", "^") or token == ("keyword", "NEAR")
+        )
+
+    def parse(self):
+        return self.parse_or()
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.accept("keyword", "OR"):
+            node = Operator("OR", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.accept("keyword", "AND") or self.starts_primary():
+            node = Operator("AND", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        node = self.parse_primary()
+        while self.accept("keyword", "NOT"):
+            node = Operator("NOT", node, self.parse_primary())
+        return node
+
+    def parse_primary(self):
+        if self.accept("("):
+            node = self.parse_or()
+            self.accept(")")
+            return node
+        if self.accept("keyword", "NEAR"):
+            self.accept("(")
+            phrases = []
+            distance = NEAR_DISTANCE
+            while self.peek() is not None and not self.accept(")"):
+                if self.accept(","):
+                    token = self.peek()
+                    if token is not None and token[1].isdigit():
+                        distance = int(token[1])
+                        self.index += 1
+                    continue
+                if self.peek()[0] != "string":
+                    self.index += 1
+                    continue
+                phrases.append(self.parse_phrase())
+            return Near(phrases, distance)
+        initial = self.accept("^")
+        if self.peek() is None or self.peek()[0] != "string":
+            return Phrase([])
+        phrase = self.parse_phrase()
+        phrase.initial = initial
+        return phrase
+
+    def parse_phrase(self) -> Phrase:
+        phrase = Phrase([])
+        while True:
+            phrase.words += words(self.tokens[self.index][1])
+            self.index += 1
+            phrase.prefix = self.accept("*")
+            if not (self.accept("+") and self.peek() and self.peek()[0] == "string"):
+                return phrase
+
+
+class SearchQuery:
+    def __init__(self, q: str):
+        self.q = q
+        self.root = Parser(q).parse()
+
+    def matches(self, message: str | None) -> bool:
+        return self.root.evaluate(words(message or ""))
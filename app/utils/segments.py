@@ -0,0 +1,167 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+MAGIC = b"LOGSEG1\n"
+FOOTER_SIZE = struct.Struct("<I")
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+COLUMNS = (
+    "id",
+    "timestamp",
+    "level",
+    "service",
+    "message",
+    "metadata_json",
+    "template_id",
+)
+INTEGER_COLUMNS = ("id", "timestamp")
+DICTIONARY_COLUMNS = ("level", "service")
+
+
+@dataclass
+class Segment:
+    path: Path
+    rows: int
+    min_time: datetime
+    max_time: datetime
+    counts: dict[tuple[str, str], int] = field(default_factory=dict)
+    footer: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def levels(self) -> set[str]:
+        return {level for level, _ in self.counts}
+
+    @property
+    def services(self) -> set[str]:
+        return {service for _, service in self.counts}
+
+
+def to_micros(timestamp: datetime) -> int:
+    return (timestamp.replace(tzinfo=None) - EPOCH) // MICROSECOND
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + value * MICROSECOND
+
+
+def pack_integers(values: list[int]) -> bytes:
+    packed = array("q", values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_integers(data: bytes) -> list[int]:
+    packed = array("q")
+    packed.frombytes(data)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tolist()
+
+
+def encode_column(name: str, values: list, footer: dict) -> bytes:
+    if name == "timestamp":
+        raw = pack_integers([to_micros(value) for value in values])
+    elif name in INTEGER_COLUMNS:
+        raw = pack_integers(values)
+    elif name in DICTIONARY_COLUMNS:
+        dictionary = sorted(set(values))
+        codes = {value: code for code, value in enumerate(dictionary)}
+        footer["dictionaries"][name] = dictionary
+        raw = pack_integers([codes[value] for value in values])
+    else:
+        raw = json.dumps(values, ensure_ascii=False).encode()
+    return zlib.compress(raw, 6)
+
+
+def decode_column(name: str, data: bytes, footer: dict) -> list:
+    raw = zlib.decompress(data)
+    if name == "timestamp":
+        return [from_micros(value) for value in unpack_integers(raw)]
+    if name in INTEGER_COLUMNS:
+        return unpack_integers(raw)
+    if name in DICTIONARY_COLUMNS:
+        dictionary = footer["dictionaries"][name]
+        return [dictionary[code] for code in unpack_integers(raw)]
+    return json.loads(raw)
+
+
+def write_segment(path: Path, rows: list[dict]) -> Segment:
+    counts = {}
+    for row in rows:
+        key = f"{row['level']}|{row['service']}"
+        counts[key] = counts.get(key, 0) + 1
+    footer = {
+        "version": 2,
+        "rows": len(rows),
+        "min_time": min(row["timestamp"] for row in rows).isoformat(),
+        "max_time": max(row["timestamp"] for row in rows).isoformat(),
+        "counts": counts,
+        "dictionaries": {},
+        "columns": {},
+    }
+
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "wb") as file:
+        file.write(MAGIC)
+        for name in COLUMNS:
+            data = encode_column(name, [row.get(name) for row in rows], footer)
+            footer["columns"][name] = {"offset": file.tell(), "length": len(data)}
+            file.write(data)
+        encoded = json.dumps(footer, ensure_ascii=False).encode()
+        file.write(encoded)
+        file.write(FOOTER_SIZE.pack(len(encoded)))
+        file.write(MAGIC)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return segment_from_footer(path, footer)
+
+
+def segment_from_footer(path: Path, footer: dict) -> Segment:
+    return Segment(
+        path=path,
+        rows=footer["rows"],
+        min_time=datetime.fromisoformat(footer["min_time"]),
+        max_time=datetime.fromisoformat(footer["max_time"]),
+        counts={
+            tuple(key.split("|", 1)): count for key, count in footer["counts"].items()
+        },
+        footer=footer,
+    )
+
+
+def read_segment_footer(path: Path) -> Segment:
+    with open(path, "rb") as file:
+        file.seek(-(FOOTER_SIZE.size + len(MAGIC)), os.SEEK_END)
+        tail = file.read()
+        if tail[FOOTER_SIZE.size :] != MAGIC:
+            raise ValueError(f"Файл {path} не является сегментом архива")
+        (length,) = FOOTER_SIZE.unpack(tail[: FOOTER_SIZE.size])
+        file.seek(-(FOOTER_SIZE.size + len(MAGIC) + length), os.SEEK_END)
+        footer = json.loads(file.read(length))
+    return segment_from_footer(path, footer)
+
+
+def read_segment_columns(segment: Segment, names=COLUMNS) -> dict[str, list]:
+    columns = {}
+    with open(segment.path, "rb") as file:
+        for name in names:
+            location = segment.footer["columns"].get(name)
+            if location is None:
+                # Колонки, добавленные после записи сегмента
+                columns[name] = [None] * segment.rows
+                continue
+            file.seek(location["offset"])
+            columns[name] = decode_column(
+                name, file.read(location["length"]), segment.footer
+            )
+    return columns
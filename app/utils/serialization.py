@@ -0,0 +1,53 @@
+import json
+import logging
+
+import orjson
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Наивные даты в базе хранятся в UTC и отдаются с суффиксом Z
+DUMPS_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=DUMPS_OPTIONS)
+
+
+def dump_metadata(metadata: dict | None) -> str | None:
+    if not metadata:
+        return None
+    try:
+        return orjson.dumps(metadata).decode()
+    except orjson.JSONEncodeError:
+        # orjson не сериализует целые длиннее 64 бит
+        return json.dumps(metadata)
+
+
+def checked_metadata(log_id: int, raw: str | None) -> str | None:
+    # Сохранённый JSON вставляется в ответ без разбора, поэтому сначала
+    # проверяется: одна битая строка (или NaN от старого json.dumps) сломала бы
+    # весь ответ
+    if not raw:
+        return None
+    try:
+        orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        logger.warning(f"Некорректный JSON в логе ID={log_id}: {raw!r}")
+        return None
+    return raw
+
+
+def embed_json(document: bytes, key: str, raw: bytes | str | None) -> bytes:
+    # Готовый JSON вставляется в объект как есть, без разбора и повторной сериализации
+    if isinstance(raw, str):
+        raw = raw.encode()
+    separator = b"" if document == b"{}" else b","
+    return b"%s%s%s:%s}" % (document[:-1], separator, dumps(key), raw or b"null")
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
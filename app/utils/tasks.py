@@ -0,0 +1,8 @@
+import asyncio
+import contextvars
+
+
+def create_background_task(coro) -> asyncio.Task:
+    # Задача получает пустой контекст, а не копию контекста запроса,
+    # из которого её запустили: иначе она продолжит писать в его ContextVar
+    return asyncio.create_task(coro, context=contextvars.Context())
@@ -0,0 +1,148 @@
+import re
+import threading
+from dataclasses import dataclass
+
+from app.config import (TEMPLATE_MAX_CHILDREN, TEMPLATE_SIMILARITY,
+                        TEMPLATE_TREE_DEPTH)
+
+WILDCARD = "<*>"
+VARIABLE_PATTERN = re.compile(
+    r"^("
+    r"[-+]?\d+([.,:]\d+)*[a-zA-Z%]*"
+    r"|0x[0-9a-fA-F]+"
+    r"|[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}"
+    r"|\d{1,3}(\.\d{1,3}){3}(:\d+)?"
+    r")$"
+)
+
+
+def tokenize(message: str) -> list[str]:
+    return [
+        WILDCARD if VARIABLE_PATTERN.match(token) else token
+        for token in message.split()
+    ]
+
+
+@dataclass
+class Template:
+    id: int | None
+    tokens: list[str]
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: list[str]) -> tuple[float, int]:
+        equal = sum(
+            1
+            for own, token in zip(self.tokens, tokens)
+            if own != WILDCARD and own == token
+        )
+        wildcards = self.tokens.count(WILDCARD)
+        return equal / max(len(tokens), 1), wildcards
+
+    def merge(self, tokens: list[str]) -> bool:
+        changed = False
+        for index, token in enumerate(tokens):
+            if self.tokens[index] != token and self.tokens[index] != WILDCARD:
+                self.tokens[index] = WILDCARD
+                changed = True
+        return changed
+
+
+class TemplateMiner:
+    # Дерево в духе Drain: длина сообщения, затем первые токены, в листьях шаблоны
+    def __init__(
+        self, depth: int = 4, similarity: float = 0.4, max_children: int = 100
+    ):
+        self.depth = depth
+        self.threshold = similarity
+        self.max_children = max_children
+        self.lock = threading.Lock()
+        self.root: dict = {}
+        self.templates: dict[int, Template] = {}
+
+    def clear(self):
+        with self.lock:
+            self.root.clear()
+            self.templates.clear()
+
+    def path(self, tokens: list[str]) -> tuple:
+        path = [len(tokens)]
+        node = self.root.get(len(tokens), {})
+        for token in tokens[: max(self.depth - 2, 0)]:
+            if any(char.isdigit() for char in token):
+                token = WILDCARD
+            if token not in node and len(node) >= self.max_children:
+                token = WILDCARD
+            path.append(token)
+            node = node.get(token, {})
+        return tuple(path)
+
+    def leaf(self, path: tuple) -> list[Template]:
+        node = self.root
+        for key in path:
+            node = node.get(key)
+            if node is None:
+                return []
+        return node.get(None, [])
+
+    def insert(self, template: Template):
+        node = self.root
+        for key in self.path(template.tokens):
+            node = node.setdefault(key, {})
+        node.setdefault(None, []).append(template)
+
+    def load(self, templates: list[tuple[int, str]]):
+        self.register(
+            Template(template_id, text.split()) for template_id, text in templates
+        )
+
+    def register(self, templates):
+        with self.lock:
+            for template in templates:
+                known = self.templates.get(template.id)
+                if known is not None:
+                    known.merge(template.tokens)
+                    continue
+                template = Template(template.id, list(template.tokens))
+                self.insert(template)
+                self.templates[template.id] = template
+
+    def match(
+        self, tokens: list[str], staged: dict[int, Template], pending: dict
+    ) -> Template:
+        path = self.path(tokens)
+        candidates = self.leaf(path)
+        pending = pending.setdefault(path, [])
+        best, best_score = None, (-1.0, 0)
+        for template in candidates + pending:
+            template = staged.get(template.id, template)
+            score = template.similarity(tokens)
+            if score > best_score:
+                best, best_score = template, score
+        if best is not None and best_score[0] >= self.threshold:
+            if best.id is not None and best.id not in staged:
+                best = staged[best.id] = Template(best.id, list(best.tokens))
+            best.merge(tokens)
+            return best
+
+        template = Template(None, list(tokens))
+        pending.append(template)
+        return template
+
+    def add_messages(self, messages: list[str]) -> list[Template]:
+        # Поиск идёт через get и не создаёт узлов: новые шаблоны (id=None) и
+        # обобщённые копии известных попадают в дерево через register после коммита
+        staged, pending = {}, {}
+        with self.lock:
+            return [
+                self.match(tokenize(message), staged, pending) for message in messages
+            ]
+
+
+template_miner = TemplateMiner(
+    depth=TEMPLATE_TREE_DEPTH,
+    similarity=TEMPLATE_SIMILARITY,
+    max_children=TEMPLATE_MAX_CHILDREN,
+)
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from httpx import AsyncClient
+
+from app.crud.log_crud import create_log_rows
+from app.crud.rollups import DIMENSIONS, TIME_LABELS
+from app.utils.cache import response_cache
+from benchmarks.common import bench_client, summary
+from benchmarks.dataset import START, SyntheticLogs
+
+STATS_GROUPINGS = [*DIMENSIONS, *TIME_LABELS, "day,level,service"]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed(session_factory, dataset: SyntheticLogs, rows: int, batch: int):
+    started = time.perf_counter()
+    chunk = []
+    for row in dataset.rows(rows):
+        chunk.append(row)
+        if len(chunk) == batch:
+            async with session_factory() as session:
+                await create_log_rows(session, chunk)
+            chunk = []
+    if chunk:
+        async with session_factory() as session:
+            await create_log_rows(session, chunk)
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(rows / elapsed, 2),
+    }
+
+
+async def run_scenario(
+    name: str, requests: int, concurrency: int, send, use_cache: bool = False
+) -> dict:
+    latencies = []
+    statuses = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            if not use_cache:
+                response_cache.clear()
+            started = time.perf_counter()
+            response = await send(index)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    result = summary(latencies, time.perf_counter() - started)
+    result["errors"] = sum(1 for code in statuses if code >= 400)
+    print(f"{name}: {result}", file=sys.stderr)
+    return result
+
+
+async def read_scenarios(client: AsyncClient, headers: dict, args, total: int) -> dict:
+    results = {}
+    deep_offset = max(total - total // 10, 0)
+    services = ["auth", "billing", "payments"]
+    pages = {
+        "logs_shallow": lambda index: {"limit": 100},
+        "logs_shallow_estimate": lambda index: {"limit": 100, "count": "estimate"},
+        "logs_deep_offset": lambda index: {
+            "limit": 100,
+            "offset": deep_offset,
+            "count": "none",
+        },
+        "logs_filtered": lambda index: {
+            "limit": 100,
+            "level": "ERROR",
+            "service": services[index % len(services)],
+        },
+        "logs_metadata": lambda index: {"limit": 100, "meta": "status>=500"},
+        "logs_search": lambda index: {"limit": 100, "q": "payment"},
+    }
+    for name, params in pages.items():
+        results[name] = await run_scenario(
+            name,
+            args.requests,
+            args.concurrency,
+            lambda index, params=params: client.get(
+                "/logs", params=params(index), headers=headers
+            ),
+            args.cache,
+        )
+
+    cursor = None
+
+    async def next_page(index: int):
+        nonlocal cursor
+        params = {"limit": 100, "count": "none"}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/logs", params=params, headers=headers)
+        cursor = response.json().get("next_cursor")
+        return response
+
+    results["logs_cursor_walk"] = await run_scenario(
+        "logs_cursor_walk", args.requests, 1, next_page, args.cache
+    )
+
+    for group_by in STATS_GROUPINGS:
+        name = f"stats_{group_by.replace(',', '_')}"
+        results[name] = await run_scenario(
+            name,
+            args.requests,
+            args.concurrency,
+            lambda index, group_by=group_by: client.get(
+                "/stats", params={"group_by": group_by}, headers=headers
+            ),
+            args.cache,
+        )
+    return results
+
+
+async def main(args):
+    dataset = SyntheticLogs(seed=args.seed, days=args.days)
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{directory}/bench.db"
+        async with bench_client(database_url) as (client, headers, session_factory):
+            seeded = await seed(session_factory, dataset, args.rows, args.batch)
+            print(f"seed: {seeded}", file=sys.stderr)
+
+            scenarios = {}
+            end = START + dataset.span
+            scenarios["add_log"] = await run_scenario(
+                "add_log",
+                args.requests,
+                args.concurrency,
+                lambda index: client.post(
+                    "/add_log", json=dataset.payload(end), headers=headers
+                ),
+            )
+            scenarios.update(
+                await read_scenarios(client, headers, args, args.rows + args.requests)
+            )
+
+            # Удаление идёт последним: каждый шаг срезает следующую часть
+            # самых старых логов, всего args.delete_fraction от периода
+            deleted = []
+            step = dataset.span * args.delete_fraction / args.delete_steps
+
+            async def delete_slice(index: int):
+                before = START + step * (index + 1)
+                response = await client.delete(
+                    "/logs",
+                    params={
+                        "before": before.isoformat().replace("+00:00", "Z"),
+                        "wait": "true",
+                    },
+                    headers=headers,
+                )
+                deleted.append(response.json().get("deleted", 0))
+                return response
+
+            scenarios["delete_logs"] = await run_scenario(
+                "delete_logs", args.delete_steps, 1, delete_slice
+            )
+            scenarios["delete_logs"]["deleted_rows"] = sum(deleted)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "database": "custom" if args.database_url else "sqlite-file",
+            "rows": args.rows,
+            "seed": args.seed,
+            "days": args.days,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+        },
+        "seed": seeded,
+        "scenarios": scenarios,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Пропускная способность и задержки API на синтетических логах"
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delete-steps", type=int, default=5)
+    parser.add_argument("--delete-fraction", type=float, default=0.1)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="не сбрасывать кэш ответов перед запросами на чтение",
+    )
+    parser.add_argument(
+        "--database-url", help="база для прогона вместо временного файла SQLite"
+    )
+    parser.add_argument("--output", help="куда дополнительно сохранить JSON-отчёт")
+    asyncio.run(main(parser.parse_args()))
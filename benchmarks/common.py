@@ -0,0 +1,75 @@
+import os
+import statistics
+from contextlib import asynccontextmanager
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret")
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import (create_engine, get_db, get_read_db, init_db,
+                        is_sqlite_file)
+from app.crud.log_crud import hash_password
+from app.main import app
+from app.schemas.log_schemas import User
+
+USERNAME = "admin"
+PASSWORD = "benchpass123"
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summary(latencies: list[float], elapsed: float | None = None) -> dict:
+    result = {
+        "requests": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+    if elapsed:
+        result["throughput_rps"] = round(len(latencies) / elapsed, 2)
+    return result
+
+
+@asynccontextmanager
+async def bench_client(database_url: str):
+    engine = create_engine(database_url)
+    read_engine = (
+        create_engine(database_url, readonly=True)
+        if is_sqlite_file(database_url)
+        else engine
+    )
+    await init_db(engine)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    read_session_factory = async_sessionmaker(read_engine, expire_on_commit=False)
+    async with session_factory() as session:
+        session.add(User(username=USERNAME, password=await hash_password(PASSWORD)))
+        await session.commit()
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+
+    async def override_get_read_db():
+        async with read_session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    try:
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post(
+                "/auth/login", json={"username": USERNAME, "password": PASSWORD}
+            )
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            yield client, headers, session_factory
+    finally:
+        app.dependency_overrides.clear()
+        if read_engine is not engine:
+            await read_engine.dispose()
+        await engine.dispose()
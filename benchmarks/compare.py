@@ -0,0 +1,54 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps"]
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(baseline: dict, current: dict, threshold: float | None) -> list[str]:
+    regressions = []
+    print(f"{'сценарий':<28}" + "".join(f"{metric:>26}" for metric in METRICS))
+    for name, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(name)
+        if after is None:
+            continue
+        cells = []
+        for metric in METRICS:
+            if metric not in before or metric not in after:
+                cells.append(f"{'-':>26}")
+                continue
+            delta = change(before[metric], after[metric])
+            cells.append(f"{before[metric]:>9} → {after[metric]:>9} {delta:+5.0f}%")
+            # Для задержек рост плохо, для пропускной способности — падение
+            worse = -delta if metric == "throughput_rps" else delta
+            if threshold is not None and worse > threshold:
+                regressions.append(f"{name}.{metric} {delta:+.1f}%")
+        print(f"{name:<28}" + "".join(cells))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Сравнение двух JSON-отчётов benchmarks/api_load.py"
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="процент ухудшения, при котором сравнение завершается с ошибкой",
+    )
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    print(f"{baseline['meta']['commit']} → {current['meta']['commit']}")
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"Ухудшения больше {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,100 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+SERVICES = [
+    "api-gateway",
+    "auth",
+    "billing",
+    "orders",
+    "search",
+    "inventory",
+    "notifications",
+    "payments",
+    "recommendations",
+    "shipping",
+    "reports",
+    "profile",
+]
+LEVELS = {"INFO": 70, "DEBUG": 15, "WARNING": 10, "ERROR": 5}
+MESSAGES = {
+    "DEBUG": [
+        "sql query took {ms}ms rows={n}",
+        "cache miss for key session:{user}",
+        "retrying connection attempt {n}",
+    ],
+    "INFO": [
+        "user {user} logged in from {ip}",
+        "request {request} completed in {ms}ms",
+        "GET /api/v1/orders/{n} 200",
+        "order {n} created for user {user}",
+    ],
+    "WARNING": [
+        "slow response from upstream {service} after {ms}ms",
+        "rate limit almost reached for user {user}",
+    ],
+    "ERROR": [
+        "payment {request} failed: card declined",
+        "timeout after {ms}ms calling {service}",
+        "unhandled exception in worker {n}",
+    ],
+}
+STATUSES = {200: 80, 201: 5, 404: 8, 429: 2, 500: 4, 503: 1}
+REGIONS = ["eu-west", "eu-central", "us-east", "ap-south"]
+START = datetime(2025, 5, 1, tzinfo=timezone.utc)
+
+
+class SyntheticLogs:
+    # Сервисы распределены по закону Ципфа, уровни и статусы — по весам
+    def __init__(self, seed: int = 42, days: int = 7):
+        self.random = random.Random(seed)
+        self.span = timedelta(days=days)
+        self.service_weights = [1 / (rank + 1) for rank in range(len(SERVICES))]
+
+    def choice(self, weights: dict):
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def message(self, level: str) -> str:
+        template = self.random.choice(MESSAGES[level])
+        return template.format(
+            ms=int(self.random.lognormvariate(4, 1)),
+            n=self.random.randrange(100000),
+            user=self.random.randrange(10000),
+            ip=f"10.0.{self.random.randrange(256)}.{self.random.randrange(256)}",
+            request=f"req-{self.random.getrandbits(32):08x}",
+            service=self.random.choice(SERVICES),
+        )
+
+    def metadata(self) -> dict | None:
+        if self.random.random() < 0.2:
+            return None
+        return {
+            "status": self.choice(STATUSES),
+            "duration_ms": int(self.random.lognormvariate(4, 1)),
+            "user": {"id": self.random.randrange(10000)},
+            "region": self.random.choice(REGIONS),
+        }
+
+    def log(self, timestamp: datetime) -> dict:
+        level = self.choice(LEVELS)
+        return {
+            "timestamp": timestamp,
+            "level": level,
+            "service": self.random.choices(SERVICES, weights=self.service_weights)[0],
+            "message": self.message(level),
+            "metadata": self.metadata(),
+        }
+
+    def rows(self, count: int, start: datetime = START):
+        # Строки в формате log_to_row, время равномерно растёт по всему периоду
+        step = self.span / max(count, 1)
+        for index in range(count):
+            log = self.log(start + step * index)
+            metadata = log.pop("metadata")
+            log["metadata_json"] = json.dumps(metadata) if metadata else None
+            yield log
+
+    def payload(self, timestamp: datetime) -> dict:
+        log = self.log(timestamp)
+        log["timestamp"] = timestamp.isoformat().replace("+00:00", "Z")
+        return log
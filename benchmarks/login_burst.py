@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from httpx import AsyncClient
+
+from benchmarks.common import PASSWORD, USERNAME, bench_client, summary
+
+
+async def measure_add_log(client: AsyncClient, headers: dict, requests: int):
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        response = await client.post(
+            "/add_log",
+            json={
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "level": "INFO",
+                "message": f"bench {i}",
+                "service": "bench",
+            },
+            headers=headers,
+        )
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return latencies
+
+
+async def login_loop(client: AsyncClient, stop: asyncio.Event, statuses: list):
+    while not stop.is_set():
+        response = await client.post(
+            "/auth/login", json={"username": USERNAME, "password": PASSWORD}
+        )
+        statuses.append(response.status_code)
+
+
+async def main(requests: int, logins: int):
+    with tempfile.TemporaryDirectory() as directory:
+        async with bench_client(f"sqlite+aiosqlite:///{directory}/bench.db") as (
+            client,
+            headers,
+            _,
+        ):
+            baseline = await measure_add_log(client, headers, requests)
+
+            stop = asyncio.Event()
+            statuses = []
+            workers = [
+                asyncio.create_task(login_loop(client, stop, statuses))
+                for _ in range(logins)
+            ]
+            under_load = await measure_add_log(client, headers, requests)
+            stop.set()
+            await asyncio.gather(*workers)
+
+    print(
+        json.dumps(
+            {
+                "baseline": summary(baseline),
+                "login_burst": summary(under_load),
+                "concurrent_logins": logins,
+                "login_statuses": {
+                    str(code): statuses.count(code) for code in sorted(set(statuses))
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Задержка /add_log без нагрузки и во время волны логинов"
+    )
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.logins))
@@ -1,18 +1,53 @@
+import os
+
 import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy import text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
                                     create_async_engine)
 from sqlalchemy.pool import StaticPool
 
-from app.config import get_db
+from app.config import get_db, get_read_db
+from app.core.profiling import profiler
+from app.core.security import principal_cache, token_cache
+from app.crud.archive import archive_catalog
 from app.crud.log_crud import hash_password
+from app.crud.partitions import partition_router
 from app.main import app
 from app.schemas.log_schemas import Base
 from app.schemas.log_schemas import User as DBUser
+from app.schemas.log_schemas import service_names
+from app.utils.cache import response_cache
+from app.utils.templates import template_miner
+
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "TEST_DATABASE_URL", "sqlite+aiosqlite:///:memory:"
+)
+TEST_BACKEND = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "sqlite_only: тест проверяет возможности, которые есть только в SQLite"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_BACKEND == "sqlite":
+        return
+    skip = pytest.mark.skip(reason=f"не поддерживается для {TEST_BACKEND}")
+    for item in items:
+        if "sqlite_only" in item.keywords:
+            item.add_marker(skip)
+
 
-SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+async def clear_tables(session):
+    for table in reversed(Base.metadata.sorted_tables):
+        await session.execute(table.delete())
+    await session.commit()
+    service_names.clear()
+    template_miner.clear()
 
 
 @pytest.fixture(scope="session")
@@ -22,30 +57,39 @@ def anyio_backend():
 
 @pytest_asyncio.fixture(scope="session")
 async def db_engine():
-    engine = create_async_engine(
-        SQLALCHEMY_DATABASE_URL,
-        poolclass=StaticPool,
-        connect_args={"check_same_thread": False},
-    )
+    if TEST_BACKEND == "sqlite":
+        engine = create_async_engine(
+            SQLALCHEMY_DATABASE_URL,
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_async_engine(SQLALCHEMY_DATABASE_URL)
     async with engine.begin() as conn:
+        if TEST_BACKEND != "sqlite":
+            await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(partition_router.sync)
     yield engine
     await engine.dispose()
 
 
+@pytest_asyncio.fixture
+async def session_factory(db_engine):
+    return async_sessionmaker(
+        bind=db_engine, expire_on_commit=False, class_=AsyncSession
+    )
+
+
 @pytest_asyncio.fixture
 async def db_session(db_engine):
     testing_session_local = async_sessionmaker(
         bind=db_engine, expire_on_commit=False, class_=AsyncSession
     )
     async with testing_session_local() as session:
-        await session.execute(text("DELETE FROM log"))
-        await session.execute(text("DELETE FROM user"))
-        await session.commit()
+        await clear_tables(session)
         yield session
-        await session.execute(text("DELETE FROM log"))
-        await session.execute(text("DELETE FROM user"))
-        await session.commit()
+        await clear_tables(session)
 
 
 @pytest_asyncio.fixture
@@ -54,6 +98,10 @@ async def client(db_session):
         yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    response_cache.clear()
+    principal_cache.clear()
+    token_cache.clear()
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as ac:
@@ -69,3 +117,47 @@ async def admin_user(db_session):
     await db_session.commit()
     await db_session.refresh(user)
     return user
+
+
+@pytest_asyncio.fixture
+async def admin_headers(client, admin_user):
+    login_resp = await client.post(
+        "/auth/login",
+        json={
+            "username": admin_user.username,
+            "password": "adminpass123",
+        },
+    )
+    token = login_resp.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest_asyncio.fixture
+async def partitioned(db_session, monkeypatch):
+    monkeypatch.setattr(partition_router, "period", "day")
+    await db_session.run_sync(
+        lambda session: partition_router.sync(session.connection())
+    )
+    await db_session.commit()
+    yield partition_router
+
+    def drop_partitions(session):
+        for partition in list(partition_router.partitions.values()):
+            partition_router.drop(session.connection(), partition)
+
+    await db_session.run_sync(drop_partitions)
+    await db_session.commit()
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_catalog, "directory", tmp_path / "archive")
+    monkeypatch.setattr(archive_catalog, "segments", {})
+    return archive_catalog
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "directory", tmp_path / "profiles")
+    monkeypatch.setattr(profiler, "interval", 0.001)
+    return profiler
@@ -1,5 +1,59 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import pstats
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+import orjson
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.exc import OperationalError
+
+import app.api.logs as logs_api
+from app.api.logs import tail_events
+from app.config import create_engine, get_db
+from app.core.ingest import IngestQueue
+from app.core.maintenance import SqliteMaintenance
+from app.core.metrics import MetricsMiddleware, RequestStats, current_stats
+from app.core.retention import retention_manager
+from app.core.security import (Principal, create_access_token,
+                               invalidate_principal, principal_cache,
+                               token_cache)
+from app.core.tail import TailBroker, tail_broker
+from app.crud.archive import ArchiveFilter
+from app.crud.log_crud import (create_logs_bulk, delete_old_logs,
+                               get_logs_filtered, get_logs_stats,
+                               get_user_by_id, hash_password,
+                               iter_delete_old_logs, log_to_row)
+from app.crud.metadata_filters import sync_promoted_columns
+from app.crud.rollups import TIME_LABELS, aggregate_counts, parse_grouping
+from app.crud.services import resolve_service_ids
+from app.crud.templates import assign_templates
+from app.main import app
+from app.models.log_models import LogShema
+from app.schemas.log_schemas import (LEVEL_CODES, LogDB, LogRollupDay,
+                                     LogRollupHour, LogRollupMinute,
+                                     LogTemplate, Service, ServiceRef,
+                                     UnknownService, service_names)
+from app.utils.cache import ResponseCache, response_cache
+from app.utils.logger import SAMPLED, setup_logger, stop_logger
+from app.utils.passwords import (PasswordHasher, PasswordHasherBusy,
+                                 password_hasher)
+from app.utils.search import SearchQuery
+from app.utils.segments import (read_segment_columns, read_segment_footer,
+                                write_segment)
+from app.utils.templates import TemplateMiner, template_miner
 
 
 class TestAuth:
@@ -36,6 +90,39 @@ class TestAuth:
         assert response.status_code == 400
         assert "уже существует" in response.json()["detail"]
 
+    @pytest.mark.asyncio
+    async def test_register_hashes_before_taking_writer(
+        self, client: AsyncClient, session_factory, monkeypatch
+    ):
+        async with session_factory() as writer:
+
+            async def override_get_db():
+                yield writer
+
+            app.dependency_overrides[get_db] = override_get_db
+            states = []
+
+            async def tracked_hash(password: str) -> str:
+                states.append(writer.in_transaction())
+                return await hash_password(password)
+
+            monkeypatch.setattr(logs_api, "hash_password", tracked_hash)
+            response = await client.post(
+                "/auth/register", json={"username": "writer", "password": "pass123"}
+            )
+            assert response.status_code == 200
+            assert states == [False]
+
+            # Гонка двух регистраций: имя заняли уже после проверки
+            monkeypatch.setattr(
+                logs_api, "get_user_by_username", AsyncMock(return_value=None)
+            )
+            response = await client.post(
+                "/auth/register", json={"username": "writer", "password": "pass123"}
+            )
+            assert response.status_code == 400
+            assert "уже существует" in response.json()["detail"]
+
     @pytest.mark.asyncio
     async def test_login_success(self, client: AsyncClient):
         await client.post(
@@ -164,3 +251,1932 @@ class TestLogs:
         data = resp.json()
         assert data["total"] == 1
         assert data["logs"][0]["service"] == "service_a"
+
+
+class TestBatch:
+    @pytest.mark.asyncio
+    async def test_batch_json_array(self, client: AsyncClient, admin_headers):
+        batch = [
+            {
+                "timestamp": "2025-05-14T10:00:00Z",
+                "level": "INFO",
+                "service": "service_a",
+                "message": "first",
+            },
+            {
+                "timestamp": "2025-05-14T10:00:01Z",
+                "level": "FATAL",
+                "service": "service_a",
+                "message": "bad level",
+            },
+            {
+                "timestamp": "2025-05-14T10:00:02Z",
+                "level": "ERROR",
+                "service": "service_b",
+                "message": "second",
+                "metadata": {"code": 500},
+            },
+        ]
+        resp = await client.post("/logs/batch", headers=admin_headers, json=batch)
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["inserted"] == 2
+        assert len(data["ids"]) == 2
+        assert [e["index"] for e in data["errors"]] == [1]
+
+        resp = await client.get("/logs", headers=admin_headers)
+        assert resp.json()["total"] == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_ndjson(self, client: AsyncClient, admin_headers):
+        body = "\n".join(
+            [
+                '{"timestamp": "2025-05-14T10:00:00Z", "level": "INFO", "service": "a", "message": "one"}',
+                "{not json",
+                '{"timestamp": "2025-05-14T10:00:01Z", "level": "DEBUG", "service": "a", "message": "two"}',
+            ]
+        )
+        resp = await client.post(
+            "/logs/batch",
+            headers={**admin_headers, "Content-Type": "application/x-ndjson"},
+            content=body,
+        )
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["inserted"] == 2
+        assert data["errors"][0]["index"] == 1
+
+    @pytest.mark.asyncio
+    async def test_batch_rejects_non_array(self, client: AsyncClient, admin_headers):
+        resp = await client.post(
+            "/logs/batch", headers=admin_headers, json={"level": "INFO"}
+        )
+        assert resp.status_code == 400
+
+
+class TestIngestQueue:
+    @staticmethod
+    def make_log(message: str) -> LogShema:
+        return LogShema(
+            timestamp="2025-05-14T12:00:00Z",
+            level="INFO",
+            service="queue_service",
+            message=message,
+        )
+
+    @pytest.mark.asyncio
+    async def test_group_commit_and_wait(self, db_session, session_factory):
+        queue = IngestQueue(session_factory, max_size=10, flush_interval=0.01)
+        await queue.start()
+        futures = [queue.put(self.make_log(f"msg {i}"), wait=True) for i in range(3)]
+        ids = await asyncio.gather(*futures)
+        await queue.stop()
+
+        assert len(set(ids)) == 3
+        total = await db_session.scalar(select(func.count(LogDB.id)))
+        assert total == 3
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects(self, session_factory):
+        queue = IngestQueue(session_factory, max_size=1, flush_interval=1)
+        with pytest.raises(asyncio.QueueFull):
+            queue.put(self.make_log("not started"))
+
+        await queue.start()
+        queue.put(self.make_log("one"))
+        with pytest.raises(asyncio.QueueFull):
+            queue.put(self.make_log("two"))
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_pending(self, db_session, session_factory):
+        queue = IngestQueue(session_factory, max_size=100, flush_interval=10)
+        await queue.start()
+        for i in range(5):
+            queue.put(self.make_log(f"pending {i}"))
+        await queue.stop()
+
+        total = await db_session.scalar(select(func.count(LogDB.id)))
+        assert total == 5
+
+    @pytest.mark.asyncio
+    async def test_add_log_enqueues(
+        self, client: AsyncClient, admin_headers, session_factory, monkeypatch
+    ):
+        queue = IngestQueue(session_factory, flush_interval=0.01)
+        monkeypatch.setattr("app.api.logs.ingest_queue", queue)
+        await queue.start()
+        log_data = {
+            "timestamp": "2025-05-14T12:00:00Z",
+            "level": "INFO",
+            "service": "queue_service",
+            "message": "queued",
+        }
+        resp = await client.post("/add_log", headers=admin_headers, json=log_data)
+        assert resp.status_code == 202
+
+        resp = await client.post(
+            "/add_log?wait=true", headers=admin_headers, json=log_data
+        )
+        assert resp.status_code == 200
+        assert "id" in resp.json()
+        await queue.stop()
+
+        resp = await client.get("/logs", headers=admin_headers)
+        assert resp.json()["total"] == 2
+
+
+class TestPagination:
+    @staticmethod
+    async def seed(client: AsyncClient, headers, count: int):
+        batch = [
+            {
+                "timestamp": f"2025-05-14T10:00:{i % 3:02d}Z",
+                "level": "INFO",
+                "service": "pager",
+                "message": f"message {i}",
+            }
+            for i in range(count)
+        ]
+        resp = await client.post("/logs/batch", headers=headers, json=batch)
+        assert resp.json()["inserted"] == count
+
+    @pytest.mark.asyncio
+    async def test_cursor_walks_all_pages(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers, 7)
+
+        seen = []
+        cursor = None
+        while True:
+            url = "/logs?limit=3" + (f"&cursor={cursor}" if cursor else "")
+            resp = await client.get(url, headers=admin_headers)
+            assert resp.status_code == 200
+            data = resp.json()
+            seen.extend(log["id"] for log in data["logs"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        assert len(seen) == 7
+        assert len(set(seen)) == 7
+
+        resp = await client.get("/logs?limit=7", headers=admin_headers)
+        assert [log["id"] for log in resp.json()["logs"]] == seen
+
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self, client: AsyncClient, admin_headers):
+        resp = await client.get("/logs?cursor=not-a-cursor", headers=admin_headers)
+        assert resp.status_code == 400
+
+
+class TestCountModes:
+    @staticmethod
+    async def seed(client: AsyncClient, headers):
+        batch = [
+            {
+                "timestamp": f"2025-05-14T{10 + i % 3}:{i:02d}:00Z",
+                "level": "ERROR" if i % 2 else "INFO",
+                "service": "counted",
+                "message": f"message {i}",
+            }
+            for i in range(12)
+        ]
+        await client.post("/logs/batch", headers=headers, json=batch)
+
+    @pytest.mark.asyncio
+    async def test_count_modes(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+
+        exact = await client.get("/logs?level=ERROR&count=exact", headers=admin_headers)
+        estimate = await client.get(
+            "/logs?level=ERROR&count=estimate", headers=admin_headers
+        )
+        none = await client.get("/logs?level=ERROR&count=none", headers=admin_headers)
+
+        assert exact.json()["total"] == 6
+        assert estimate.json()["total"] == 6
+        assert none.json()["total"] is None
+        assert len(none.json()["logs"]) == 6
+
+    @pytest.mark.asyncio
+    async def test_counters_follow_retention(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+
+        resp = await client.delete(
+            "/logs?before=2025-05-14T11:05:00Z&wait=true", headers=admin_headers
+        )
+        deleted = resp.json()["deleted"]
+
+        exact = await client.get("/logs", headers=admin_headers)
+        estimate = await client.get("/logs?count=estimate", headers=admin_headers)
+        assert exact.json()["total"] == 12 - deleted
+        assert estimate.json()["total"] == exact.json()["total"]
+
+
+class TestExport:
+    @staticmethod
+    async def seed(client: AsyncClient, headers):
+        batch = [
+            {
+                "timestamp": f"2025-05-14T10:00:{i:02d}Z",
+                "level": "ERROR" if i % 2 else "INFO",
+                "service": "exported",
+                "message": f"message, {i}",
+                "metadata": {"n": i},
+            }
+            for i in range(5)
+        ]
+        await client.post("/logs/batch", headers=headers, json=batch)
+
+    @pytest.mark.asyncio
+    async def test_export_ndjson(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+        resp = await client.get("/logs/export?level=ERROR", headers=admin_headers)
+        assert resp.status_code == 200
+        rows = [json.loads(line) for line in resp.text.splitlines()]
+        assert [row["metadata"]["n"] for row in rows] == [1, 3]
+        assert rows[0]["timestamp"] == "2025-05-14T10:00:01Z"
+
+    def test_export_ndjson_corrupted_metadata(self):
+        rows = [
+            LogDB(
+                id=index,
+                timestamp=datetime(2025, 5, 14, 10, 0),
+                level="ERROR",
+                service="corrupted",
+                message="exported",
+                metadata_json=raw,
+            )
+            for index, raw in enumerate(['{"n": 1}', "{bad", '{"n": Infinity}'])
+        ]
+        lines = logs_api.format_ndjson(rows).splitlines()
+        assert [orjson.loads(line)["metadata"] for line in lines] == [
+            {"n": 1},
+            None,
+            None,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_export_csv_gzip(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+        resp = await client.get(
+            "/logs/export?format=csv&gzip=true", headers=admin_headers
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/gzip"
+        rows = list(csv.reader(io.StringIO(gzip.decompress(resp.content).decode())))
+        assert rows[0] == ["id", "timestamp", "level", "service", "message", "metadata"]
+        assert len(rows) == 6
+        assert rows[1][4] == "message, 0"
+
+
+class TestSearch:
+    @staticmethod
+    async def seed(client: AsyncClient, headers):
+        messages = [
+            "user 42 logged in from 10.0.0.1",
+            "payment failed for request req-8f3a",
+            "request req-8f3a timed out after 30s",
+            "user 42 logged out",
+        ]
+        batch = [
+            {
+                "timestamp": f"2025-05-14T10:00:{i:02d}Z",
+                "level": "INFO",
+                "service": "search",
+                "message": message,
+            }
+            for i, message in enumerate(messages)
+        ]
+        await client.post("/logs/batch", headers=headers, json=batch)
+
+    @pytest.mark.sqlite_only
+    @pytest.mark.asyncio
+    async def test_phrase_prefix_boolean(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+
+        resp = await client.get('/logs?q="logged in"', headers=admin_headers)
+        assert [log["message"] for log in resp.json()["logs"]] == [
+            "user 42 logged in from 10.0.0.1"
+        ]
+
+        resp = await client.get("/logs?q=pay*", headers=admin_headers)
+        assert resp.json()["total"] == 1
+
+        resp = await client.get("/logs?q=user NOT out", headers=admin_headers)
+        assert resp.json()["total"] == 1
+
+    @pytest.mark.asyncio
+    async def test_highlight_and_rank(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+
+        resp = await client.get(
+            '/logs?q="req 8f3a"&order=rank&highlight=true', headers=admin_headers
+        )
+        data = resp.json()
+        assert data["total"] == 2
+        assert data["next_cursor"] is None
+        assert all("<mark>" in log["snippet"] for log in data["logs"])
+
+    @pytest.mark.asyncio
+    async def test_index_follows_retention(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+        await client.delete(
+            "/logs?before=2025-05-14T10:00:02Z&wait=true", headers=admin_headers
+        )
+
+        resp = await client.get("/logs?q=user", headers=admin_headers)
+        assert [log["message"] for log in resp.json()["logs"]] == ["user 42 logged out"]
+
+    @pytest.mark.sqlite_only
+    @pytest.mark.asyncio
+    async def test_invalid_query(self, client: AsyncClient, admin_headers):
+        resp = await client.get('/logs?q="unterminated', headers=admin_headers)
+        assert resp.status_code == 400
+
+
+class TestMetadataFilters:
+    @staticmethod
+    async def seed(client: AsyncClient, headers):
+        batch = [
+            {
+                "timestamp": f"2025-05-14T10:00:{i:02d}Z",
+                "level": "ERROR" if status_code >= 500 else "INFO",
+                "service": "api",
+                "message": f"request {i}",
+                "metadata": {"status": status_code, "user": {"id": i % 2}},
+            }
+            for i, status_code in enumerate([200, 404, 500, 503, 200])
+        ]
+        await client.post("/logs/batch", headers=headers, json=batch)
+
+    @pytest.mark.asyncio
+    async def test_filter_logs(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+
+        resp = await client.get(
+            "/logs", params={"meta": "status>=500"}, headers=admin_headers
+        )
+        assert resp.json()["total"] == 2
+
+        resp = await client.get(
+            "/logs",
+            params=[("meta", "status=200"), ("meta", "user.id=0")],
+            headers=admin_headers,
+        )
+        assert resp.json()["total"] == 2
+
+    @pytest.mark.asyncio
+    async def test_filter_stats(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+
+        resp = await client.get(
+            "/stats",
+            params={"group_by": "level", "meta": "status!=200"},
+            headers=admin_headers,
+        )
+        stats = {entry["level"]: entry["count"] for entry in resp.json()["stats"]}
+        assert stats == {"ERROR": 2, "INFO": 1}
+
+    @pytest.mark.asyncio
+    async def test_invalid_filter(self, client: AsyncClient, admin_headers):
+        resp = await client.get(
+            "/logs", params={"meta": "status~500"}, headers=admin_headers
+        )
+        assert resp.status_code == 400
+
+    @pytest.mark.sqlite_only
+    @pytest.mark.asyncio
+    async def test_promoted_key(self, client: AsyncClient, admin_headers, db_engine):
+        await self.seed(client, admin_headers)
+        async with db_engine.begin() as conn:
+            await conn.run_sync(sync_promoted_columns, ["status"])
+            columns = await conn.run_sync(
+                lambda sync_conn: [
+                    c["name"] for c in inspect(sync_conn).get_columns("log")
+                ]
+            )
+        assert "meta_status" in columns
+
+        resp = await client.get(
+            "/logs", params={"meta": "status<300"}, headers=admin_headers
+        )
+        assert resp.json()["total"] == 2
+
+
+class TestRollups:
+    @staticmethod
+    async def seed(session):
+        start = datetime(2025, 5, 13, 22, 58, 30)
+        logs = [
+            LogShema(
+                timestamp=start + timedelta(seconds=97 * i),
+                level=["INFO", "ERROR", "WARNING"][i % 3],
+                service=["auth", "billing"][i % 2],
+                message=f"message {i}",
+            )
+            for i in range(2000)
+        ]
+        await create_logs_bulk(session, logs)
+
+    @staticmethod
+    async def raw(session, start, end, group_by):
+        end = end + timedelta(microseconds=1) if end else None
+        dimensions, width, unit = parse_grouping(group_by, None)
+        totals = await aggregate_counts(
+            session, start, end, dimensions, width, use_rollups=False
+        )
+        labels = {}
+        for (bucket, *values), count in totals.items():
+            if bucket is not None:
+                labels[bucket.strftime(TIME_LABELS[unit])] = count
+            else:
+                labels[values[0] if values else None] = count
+        return labels
+
+    @staticmethod
+    def as_dict(stats, group_by):
+        key = {"hour": "time_interval", "day": "time_interval"}.get(group_by, group_by)
+        return {entry.get(key) if key else None: entry["count"] for entry in stats}
+
+    @pytest.mark.asyncio
+    async def test_stats_match_raw_rows(self, db_session):
+        await self.seed(db_session)
+        ranges = [
+            (None, None),
+            (datetime(2025, 5, 13, 23, 15, 7), datetime(2025, 5, 15, 1, 2, 3)),
+            (datetime(2025, 5, 14, 0, 0), datetime(2025, 5, 14, 23, 59, 59)),
+            (datetime(2025, 5, 14, 10, 30, 30), None),
+            (None, datetime(2025, 5, 14, 5, 0, 1)),
+        ]
+        for start, end in ranges:
+            for group_by in (None, "hour", "day", "level", "service"):
+                stats = await get_logs_stats(
+                    db_session, start_time=start, end_time=end, group_by=group_by
+                )
+                expected = await self.raw(db_session, start, end, group_by)
+                assert self.as_dict(stats, group_by) == expected
+
+    @pytest.mark.asyncio
+    async def test_rollups_follow_retention(self, db_session):
+        await self.seed(db_session)
+        await delete_old_logs(db_session, datetime(2025, 5, 14, 13, 47, 12))
+
+        for group_by in (None, "hour", "day", "level"):
+            stats = await get_logs_stats(db_session, group_by=group_by)
+            expected = await self.raw(db_session, None, None, group_by)
+            assert self.as_dict(stats, group_by) == expected
+
+        for model in (LogRollupMinute, LogRollupHour, LogRollupDay):
+            total = await db_session.scalar(select(func.sum(model.count)))
+            assert total == await db_session.scalar(select(func.count(LogDB.id)))
+
+
+class TestStatsGrouping:
+    @staticmethod
+    async def seed(client: AsyncClient, headers):
+        batch = [
+            {
+                "timestamp": f"2025-05-14T10:{minute:02d}:30Z",
+                "level": level,
+                "service": service,
+                "message": "grouped",
+            }
+            for minute, level, service in [
+                (1, "ERROR", "auth"),
+                (2, "ERROR", "auth"),
+                (3, "INFO", "billing"),
+                (12, "ERROR", "billing"),
+                (14, "ERROR", "search"),
+                (16, "INFO", "auth"),
+            ]
+        ]
+        await client.post("/logs/batch", headers=headers, json=batch)
+
+    @pytest.mark.asyncio
+    async def test_multi_dimensional(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+        resp = await client.get(
+            "/stats?group_by=minute,service,level&interval=5m", headers=admin_headers
+        )
+        assert resp.status_code == 200
+        assert resp.json()["stats"] == [
+            {
+                "count": 2,
+                "time_interval": "2025-05-14T10:00:00Z",
+                "service": "auth",
+                "level": "ERROR",
+            },
+            {
+                "count": 1,
+                "time_interval": "2025-05-14T10:00:00Z",
+                "service": "billing",
+                "level": "INFO",
+            },
+            {
+                "count": 1,
+                "time_interval": "2025-05-14T10:10:00Z",
+                "service": "billing",
+                "level": "ERROR",
+            },
+            {
+                "count": 1,
+                "time_interval": "2025-05-14T10:10:00Z",
+                "service": "search",
+                "level": "ERROR",
+            },
+            {
+                "count": 1,
+                "time_interval": "2025-05-14T10:15:00Z",
+                "service": "auth",
+                "level": "INFO",
+            },
+        ]
+
+    @pytest.mark.asyncio
+    async def test_fill_and_top(self, client: AsyncClient, admin_headers):
+        await self.seed(client, admin_headers)
+        resp = await client.get(
+            "/stats?group_by=service&interval=5m&fill=true&top=1"
+            "&start_time=2025-05-14T10:00:00Z&end_time=2025-05-14T10:19:59Z",
+            headers=admin_headers,
+        )
+        stats = resp.json()["stats"]
+        assert {entry["service"] for entry in stats} == {"auth", "__other__"}
+        assert len(stats) == 8
+        assert sum(entry["count"] for entry in stats) == 6
+        assert {
+            "count": 0,
+            "time_interval": "2025-05-14T10:05:00Z",
+            "service": "auth",
+        } in stats
+
+    @pytest.mark.asyncio
+    async def test_invalid_grouping(self, client: AsyncClient, admin_headers):
+        resp = await client.get("/stats?group_by=hour,day", headers=admin_headers)
+        assert resp.status_code == 400
+        resp = await client.get(
+            "/stats?group_by=hour&interval=5m", headers=admin_headers
+        )
+        assert resp.status_code == 400
+        resp = await client.get("/stats?interval=5x", headers=admin_headers)
+        assert resp.status_code == 400
+
+
+class TestResponseCache:
+    CLOSED_WINDOW = "start_time=2025-05-14T00:00:00Z&end_time=2025-05-14T23:59:59Z"
+
+    @staticmethod
+    async def add(client: AsyncClient, headers, timestamp: str):
+        await client.post(
+            "/logs/batch",
+            headers=headers,
+            json=[
+                {
+                    "timestamp": timestamp,
+                    "level": "INFO",
+                    "service": "cached",
+                    "message": "cached message",
+                }
+            ],
+        )
+
+    def test_byte_budget(self):
+        cache = ResponseCache(max_size=10, open_ttl=60, closed_ttl=60, max_bytes=100)
+        for name in ("a", "b", "c"):
+            cache.put((name,), b"x" * 40)
+        # Третье тело не помещается в 100 байт: вытесняется самое старое
+        assert cache.get(("a",)) is None
+        assert cache.get(("b",)) is not None
+        assert cache.stats()["bytes"] == 80
+
+        cache.put(("big",), b"x" * 101)
+        assert cache.get(("big",)) is None
+        assert cache.stats()["bytes"] == 80
+
+        cache.invalidate(None, None, include_open=True)
+        assert cache.stats()["bytes"] == 0
+
+    @pytest.mark.asyncio
+    async def test_etag_and_hits(self, client: AsyncClient, admin_headers):
+        await self.add(client, admin_headers, "2025-05-14T10:00:00Z")
+        url = f"/stats?group_by=level&{self.CLOSED_WINDOW}"
+
+        first = await client.get(url, headers=admin_headers)
+        second = await client.get(url, headers=admin_headers)
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == first.json()
+
+        resp = await client.get(
+            url, headers={**admin_headers, "If-None-Match": first.headers["etag"]}
+        )
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+        stats = (await client.get("/cache/stats", headers=admin_headers)).json()
+        assert stats["hits"] >= 2
+        assert stats["misses"] >= 1
+
+    @pytest.mark.asyncio
+    async def test_ingest_invalidates_closed_window(
+        self, client: AsyncClient, admin_headers
+    ):
+        url = f"/logs?{self.CLOSED_WINDOW}"
+        await self.add(client, admin_headers, "2025-05-14T10:00:00Z")
+        assert (await client.get(url, headers=admin_headers)).json()["total"] == 1
+
+        await self.add(client, admin_headers, "2025-05-16T10:00:00Z")
+        resp = await client.get(url, headers=admin_headers)
+        assert resp.headers["x-cache"] == "HIT"
+
+        await self.add(client, admin_headers, "2025-05-14T12:00:00Z")
+        resp = await client.get(url, headers=admin_headers)
+        assert resp.headers["x-cache"] == "MISS"
+        assert resp.json()["total"] == 2
+
+    @pytest.mark.asyncio
+    async def test_retention_invalidates(self, client: AsyncClient, admin_headers):
+        url = f"/logs?{self.CLOSED_WINDOW}"
+        await self.add(client, admin_headers, "2025-05-14T10:00:00Z")
+        assert (await client.get(url, headers=admin_headers)).json()["total"] == 1
+
+        await client.delete(
+            "/logs?before=2025-05-15T00:00:00Z&wait=true", headers=admin_headers
+        )
+        assert (await client.get(url, headers=admin_headers)).json()["total"] == 0
+
+
+class TestPrincipalCache:
+    @pytest.mark.asyncio
+    async def test_user_loaded_once(
+        self, client: AsyncClient, admin_headers, monkeypatch
+    ):
+        calls = []
+
+        async def counting_get_user_by_id(session, user_id):
+            calls.append(user_id)
+            return await get_user_by_id(session, user_id)
+
+        monkeypatch.setattr("app.core.security.get_user_by_id", counting_get_user_by_id)
+        for _ in range(3):
+            resp = await client.get("/cache/stats", headers=admin_headers)
+            assert resp.status_code == 200
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_caches_plain_principal(
+        self, client: AsyncClient, admin_headers, admin_user
+    ):
+        assert (
+            await client.get("/cache/stats", headers=admin_headers)
+        ).status_code == 200
+        assert principal_cache.get(admin_user.id) == Principal(
+            id=admin_user.id, username="admin", role="admin"
+        )
+
+
+    @pytest.mark.asyncio
+    async def test_invalidate_principal(
+        self, client: AsyncClient, admin_headers, admin_user, db_session
+    ):
+        assert (
+            await client.get("/cache/stats", headers=admin_headers)
+        ).status_code == 200
+
+        await db_session.delete(admin_user)
+        await db_session.commit()
+        assert (
+            await client.get("/cache/stats", headers=admin_headers)
+        ).status_code == 200
+
+        invalidate_principal(admin_user.id)
+        token = admin_headers["Authorization"].removeprefix("Bearer ")
+        assert principal_cache.get(admin_user.id) is None
+        assert token_cache.get(token) is None
+        assert (
+            await client.get("/cache/stats", headers=admin_headers)
+        ).status_code == 401
+
+class TestPasswordHasher:
+    @pytest.mark.asyncio
+    async def test_hashing_does_not_block_event_loop(self):
+        hasher = PasswordHasher(workers=1, max_pending=4, timeout=5)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        await hasher.run(time.sleep, 0.3)
+        task.cancel()
+        assert ticks >= 10
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        hasher = PasswordHasher(workers=1, max_pending=4, timeout=0.05)
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.run(time.sleep, 0.3)
+
+    @pytest.mark.asyncio
+    async def test_login_returns_503_when_busy(
+        self, client: AsyncClient, admin_user, monkeypatch
+    ):
+        monkeypatch.setattr(password_hasher, "max_pending", 0)
+        response = await client.post(
+            "/auth/login", json={"username": "admin", "password": "adminpass123"}
+        )
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+
+class TestRetention:
+    @staticmethod
+    async def seed(db_session, count=12):
+        await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=datetime(2025, 5, 14, 10, 0, 0)
+                    + timedelta(minutes=i * 7),
+                    level="ERROR" if i % 3 == 0 else "INFO",
+                    service="auth" if i % 2 else "billing",
+                    message=f"retention {i}",
+                )
+                for i in range(count)
+            ],
+        )
+
+    @pytest.mark.asyncio
+    async def test_deletes_in_chunks(self, db_session):
+        await self.seed(db_session)
+        chunks = [
+            count
+            async for count in iter_delete_old_logs(
+                db_session, datetime(2025, 5, 14, 11, 0, 0), chunk_size=4
+            )
+        ]
+        assert chunks == [4, 4, 1]
+        for model in (LogRollupMinute, LogRollupHour, LogRollupDay):
+            total = await db_session.scalar(select(func.sum(model.count)))
+            assert total == await db_session.scalar(select(func.count(LogDB.id)))
+
+    @pytest.mark.asyncio
+    async def test_background_job_status(
+        self, client: AsyncClient, admin_headers, db_session
+    ):
+        await self.seed(db_session)
+        resp = await client.delete(
+            "/logs?before=2025-05-14T11:00:00Z&service=auth", headers=admin_headers
+        )
+        assert resp.status_code == 202
+        job_id = resp.json()["job_id"]
+
+        await retention_manager.get(job_id).task
+        resp = await client.get(f"/logs/retention/jobs/{job_id}", headers=admin_headers)
+        job = resp.json()
+        assert job["status"] == "completed"
+        assert job["deleted"] == job["estimated_total"] == 4
+        assert job["rate_per_second"] is not None
+        assert await db_session.scalar(select(func.count(LogDB.id))) == 8
+
+    @pytest.mark.asyncio
+    async def test_cancel_job(
+        self, client: AsyncClient, admin_headers, db_session, monkeypatch
+    ):
+        await self.seed(db_session)
+        monkeypatch.setattr(retention_manager, "chunk_size", 2)
+        monkeypatch.setattr(retention_manager, "chunk_pause", 0.2)
+
+        resp = await client.delete(
+            "/logs?before=2025-05-15T00:00:00Z", headers=admin_headers
+        )
+        job_id = resp.json()["job_id"]
+        resp = await client.delete(
+            f"/logs/retention/jobs/{job_id}", headers=admin_headers
+        )
+        assert resp.status_code == 200
+
+        await retention_manager.get(job_id).task
+        job = retention_manager.get(job_id).to_dict()
+        assert job["status"] == "cancelled"
+        assert 0 < job["deleted"] < 12
+        assert (
+            await client.get("/logs/retention/jobs/unknown", headers=admin_headers)
+        ).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_policy_per_service(self, db_session, monkeypatch):
+        now = datetime.now(timezone.utc)
+        await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=now - timedelta(days=days),
+                    level="INFO",
+                    service=service,
+                    message="policy",
+                )
+                for service in ("auth", "billing")
+                for days in (1, 10, 40)
+            ],
+        )
+        monkeypatch.setattr(retention_manager, "default_days", 30)
+        monkeypatch.setattr(retention_manager, "service_days", {"auth": 7})
+
+        jobs = await retention_manager.run_policy(db_session.bind)
+        assert [job.status for job in jobs] == ["completed", "completed"]
+
+        remaining = await db_session.execute(
+            select(LogDB.service, func.count()).group_by(LogDB.service)
+        )
+        assert dict(remaining.all()) == {"auth": 1, "billing": 2}
+
+
+@pytest.mark.sqlite_only
+class TestPartitions:
+    @staticmethod
+    async def seed(db_session):
+        return await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=datetime(2025, 5, 12, 22, 0, 0) + timedelta(hours=i * 5),
+                    level="ERROR" if i % 2 else "INFO",
+                    service="auth" if i % 3 else "billing",
+                    message=f"partitioned message {i}",
+                )
+                for i in range(12)
+            ],
+        )
+
+    @pytest.mark.asyncio
+    async def test_rows_routed_to_daily_tables(self, db_session, partitioned):
+        ids = await self.seed(db_session)
+        assert sorted(partitioned.partitions) == [
+            "log_day_20250512",
+            "log_day_20250513",
+            "log_day_20250514",
+            "log_day_20250515",
+        ]
+        assert len(set(ids)) == 12
+        assert await db_session.scalar(select(func.count(LogDB.id))) == 0
+
+        pruned = partitioned.select_partitions(
+            datetime(2025, 5, 13, 12, 0), datetime(2025, 5, 14, 1, 0)
+        )
+        assert [partition.table.name for partition in pruned] == [
+            "log_day_20250513",
+            "log_day_20250514",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_queries_span_partitions(
+        self, client: AsyncClient, admin_headers, db_session, partitioned
+    ):
+        ids = await self.seed(db_session)
+
+        resp = await client.get("/logs?limit=5", headers=admin_headers)
+        page = resp.json()
+        assert page["total"] == 12
+        assert [log["id"] for log in page["logs"]] == ids[:5]
+        resp = await client.get(
+            f"/logs?limit=100&cursor={page['next_cursor']}", headers=admin_headers
+        )
+        assert [log["id"] for log in resp.json()["logs"]] == ids[5:]
+
+        resp = await client.get(
+            "/logs?start_time=2025-05-13T00:00:00Z&end_time=2025-05-13T23:59:59Z"
+            "&level=ERROR",
+            headers=admin_headers,
+        )
+        assert resp.json()["total"] == 3
+
+        resp = await client.get(
+            '/logs?q="message 7"&highlight=true', headers=admin_headers
+        )
+        [log] = resp.json()["logs"]
+        assert log["id"] == ids[7]
+        assert "<mark>" in log["snippet"]
+
+        stats = await get_logs_stats(
+            db_session,
+            start_time=datetime(2025, 5, 13, 2, 30),
+            end_time=datetime(2025, 5, 14, 4, 30),
+            group_by="level",
+        )
+        assert {entry["level"]: entry["count"] for entry in stats} == {
+            "ERROR": 3,
+            "INFO": 3,
+        }
+
+    @pytest.mark.asyncio
+    async def test_retention_drops_whole_partitions(self, db_session, partitioned):
+        await self.seed(db_session)
+        deleted = await delete_old_logs(db_session, datetime(2025, 5, 14, 10, 0))
+
+        assert deleted == 8
+        assert sorted(partitioned.partitions) == [
+            "log_day_20250514",
+            "log_day_20250515",
+        ]
+        tables = await db_session.run_sync(
+            lambda session: inspect(session.connection()).get_table_names()
+        )
+        assert "log_day_20250512" not in tables
+        assert "log_day_20250513_fts" not in tables
+
+        logs, total = await get_logs_filtered(db_session)
+        assert total == 4
+        for model in (LogRollupMinute, LogRollupHour, LogRollupDay):
+            assert await db_session.scalar(select(func.sum(model.count))) == 4
+
+
+class TestArchive:
+    @staticmethod
+    async def seed(db_session):
+        return await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=datetime(2025, 5, 12, 22, 0, 0) + timedelta(hours=i * 5),
+                    level="ERROR" if i % 2 else "INFO",
+                    service="auth" if i % 3 else "billing",
+                    message=f"archived message {i}",
+                    metadata={"n": i, "user": "пользователь"},
+                )
+                for i in range(12)
+            ],
+        )
+
+    @staticmethod
+    async def archive_before(client, admin_headers, before):
+        resp = await client.post(
+            f"/logs/archive?before={before}&wait=true", headers=admin_headers
+        )
+        assert resp.status_code == 200
+        return resp.json()["archived"]
+
+    def test_segment_roundtrip(self, tmp_path):
+        rows = [
+            {
+                "id": i,
+                "timestamp": datetime(2025, 5, 12, 10, 0, 0, 123456)
+                + timedelta(minutes=i),
+                "level": "ERROR" if i % 2 else "INFO",
+                "service": "auth",
+                "message": f"сообщение {i}",
+                "metadata_json": None if i == 0 else json.dumps({"n": i}),
+                "template_id": i % 2 or None,
+            }
+            for i in range(5)
+        ]
+        write_segment(tmp_path / "test.seg", rows)
+
+        segment = read_segment_footer(tmp_path / "test.seg")
+        assert segment.rows == 5
+        assert segment.min_time == rows[0]["timestamp"]
+        assert segment.max_time == rows[-1]["timestamp"]
+        assert segment.counts == {("INFO", "auth"): 3, ("ERROR", "auth"): 2}
+
+        columns = read_segment_columns(segment)
+        assert [dict(zip(columns, values)) for values in zip(*columns.values())] == rows
+        assert list(read_segment_columns(segment, ["level"])) == ["level"]
+
+    @pytest.mark.asyncio
+    async def test_archived_logs_remain_queryable(
+        self, client: AsyncClient, admin_headers, db_session, archive, monkeypatch
+    ):
+        monkeypatch.setattr(retention_manager, "archive_chunk_size", 4)
+        ids = await self.seed(db_session)
+
+        archived = await self.archive_before(
+            client, admin_headers, "2025-05-14T00:00:00Z"
+        )
+        assert archived == 6
+        assert len(archive.segments) == 2
+        assert await db_session.scalar(select(func.count(LogDB.id))) == 6
+
+        resp = await client.get("/logs?limit=5&offset=3", headers=admin_headers)
+        page = resp.json()
+        assert page["total"] == 12
+        assert [log["id"] for log in page["logs"]] == ids[3:8]
+        assert page["logs"][0]["metadata"] == {"n": 3, "user": "пользователь"}
+
+        seen = []
+        resp = await client.get("/logs?limit=5", headers=admin_headers)
+        while True:
+            page = resp.json()
+            seen += [log["id"] for log in page["logs"]]
+            if not page["next_cursor"]:
+                break
+            resp = await client.get(
+                f"/logs?limit=5&cursor={page['next_cursor']}", headers=admin_headers
+            )
+        assert seen == ids
+
+        resp = await client.get(
+            "/logs?level=ERROR&service=auth&meta=n>=3", headers=admin_headers
+        )
+        assert [log["id"] for log in resp.json()["logs"]] == [
+            ids[i] for i in (5, 7, 11)
+        ]
+        assert resp.json()["total"] == 3
+
+        resp = await client.get('/logs?q="message 4"', headers=admin_headers)
+        assert [log["id"] for log in resp.json()["logs"]] == [ids[4]]
+
+    @pytest.mark.asyncio
+    async def test_deep_pages_and_export_merge_archive(
+        self, client: AsyncClient, admin_headers, db_session, archive, monkeypatch
+    ):
+        monkeypatch.setattr(retention_manager, "archive_chunk_size", 4)
+        monkeypatch.setattr("app.crud.log_crud.MERGE_CHUNK_SIZE", 2)
+        ids = await self.seed(db_session)
+        await self.archive_before(client, admin_headers, "2025-05-14T00:00:00Z")
+
+        for offset in range(13):
+            resp = await client.get(
+                f"/logs?limit=3&offset={offset}", headers=admin_headers
+            )
+            assert [log["id"] for log in resp.json()["logs"]] == ids[offset:][:3]
+
+        resp = await client.get("/logs/export", headers=admin_headers)
+        exported = [json.loads(line) for line in resp.text.splitlines()]
+        assert [log["id"] for log in exported] == ids
+        assert exported[0]["metadata"] == {"n": 0, "user": "пользователь"}
+
+        resp = await client.get(
+            "/logs/export?format=csv&service=billing", headers=admin_headers
+        )
+        rows = list(csv.reader(io.StringIO(resp.text)))[1:]
+        assert [int(row[0]) for row in rows] == [ids[i] for i in (0, 3, 6, 9)]
+
+    @pytest.mark.asyncio
+    async def test_archive_search_matches_fts(
+        self, client: AsyncClient, admin_headers, db_session, archive
+    ):
+        await self.seed(db_session)
+        queries = [
+            "messag",
+            "messag*",
+            '"archived message"',
+            "message NOT 4",
+            "4 OR 7",
+            "NEAR(archived 3, 1)",
+            '"message 1"*',
+        ]
+
+        async def search():
+            found = {}
+            for q in queries:
+                resp = await client.get(f"/logs?q={q}", headers=admin_headers)
+                found[q] = [log["id"] for log in resp.json()["logs"]]
+            return found
+
+        hot = await search()
+        assert hot["messag"] == [] and len(hot["messag*"]) == 12
+        await self.archive_before(client, admin_headers, "2025-05-14T00:00:00Z")
+        assert await db_session.scalar(select(func.count(LogDB.id))) == 6
+        assert await search() == hot
+
+    @pytest.mark.sqlite_only
+    def test_search_query_agrees_with_fts5(self):
+        words = ["user", "users", "login", "failed", "Ошибка", "café", "cafe", "id_1"]
+        messages = [
+            " ".join(words[(i * 7 + j * 3) % len(words)] for j in range(i % 5 + 1))
+            for i in range(40)
+        ]
+        connection = sqlite3.connect(":memory:")
+        connection.execute("CREATE VIRTUAL TABLE f USING fts5(message)")
+        connection.executemany(
+            "INSERT INTO f(rowid, message) VALUES (?, ?)", enumerate(messages)
+        )
+        for q in [
+            "use*",
+            '"user login"',
+            "user OR failed login",
+            "user NOT (login OR failed)",
+            "NEAR(user failed, 1)",
+            "ошибка",
+            "cafe",
+            "^users",
+            '"id" + "1"',
+        ]:
+            expected = {
+                rowid
+                for (rowid,) in connection.execute(
+                    "SELECT rowid FROM f WHERE f MATCH ?", (q,)
+                )
+            }
+            query = SearchQuery(q)
+            found = {i for i, message in enumerate(messages) if query.matches(message)}
+            assert found == expected, q
+
+    @pytest.mark.asyncio
+    async def test_stats_include_archived_logs(
+        self, client: AsyncClient, admin_headers, db_session, archive
+    ):
+        await self.seed(db_session)
+        await self.archive_before(client, admin_headers, "2025-05-14T00:00:00Z")
+
+        start, end = datetime(2025, 5, 13, 2, 30), datetime(2025, 5, 14, 4, 30)
+        for width in (None, timedelta(hours=1)):
+            raw = await aggregate_counts(
+                db_session, start, end, ["level"], width, use_rollups=False
+            )
+            rolled = await aggregate_counts(db_session, start, end, ["level"], width)
+            assert raw == rolled
+        assert sum(raw.values()) == 6
+
+        totals = await aggregate_counts(
+            db_session, dimensions=["service"], metadata=[("n", "<", 4)]
+        )
+        assert totals == {(None, "auth"): 2, (None, "billing"): 2}
+
+        assert await archive.count(ArchiveFilter(level="INFO")) == 3
+
+    @pytest.mark.asyncio
+    async def test_retention_prunes_archive_segments(
+        self, client: AsyncClient, admin_headers, db_session, archive, monkeypatch
+    ):
+        monkeypatch.setattr(retention_manager, "archive_chunk_size", 4)
+        ids = await self.seed(db_session)
+        await self.archive_before(client, admin_headers, "2025-05-14T00:00:00Z")
+
+        deleted = await delete_old_logs(db_session, datetime(2025, 5, 13, 10, 0))
+        assert deleted == 3
+        assert sum(segment.rows for segment in archive.segments.values()) == 3
+
+        logs, total = await get_logs_filtered(db_session)
+        assert total == 9
+        assert [log.id for log in logs] == ids[3:]
+        for model in (LogRollupMinute, LogRollupHour, LogRollupDay):
+            assert await db_session.scalar(select(func.sum(model.count))) == 9
+
+        await delete_old_logs(db_session, datetime(2025, 5, 14, 0, 0))
+        assert archive.segments == {}
+        assert list(archive.directory.glob("*.seg")) == []
+
+    @pytest.mark.sqlite_only
+    @pytest.mark.asyncio
+    async def test_partition_drop_counts_only_its_rows(
+        self, client: AsyncClient, admin_headers, db_session, archive, partitioned
+    ):
+        await self.seed(db_session)
+        await self.archive_before(client, admin_headers, "2025-05-13T10:00:00Z")
+
+        # Роллапы дня 2025-05-13 включают два архивных лога и три из секции
+        deleted = await delete_old_logs(db_session, datetime(2025, 5, 14, 0, 0))
+        assert deleted == 6
+        assert archive.segments == {}
+        for model in (LogRollupMinute, LogRollupHour, LogRollupDay):
+            assert await db_session.scalar(select(func.sum(model.count))) == 6
+
+
+class TestDictionaryEncoding:
+    @pytest.mark.asyncio
+    async def test_levels_and_services_stored_as_codes(
+        self, client: AsyncClient, admin_headers, db_session
+    ):
+        for i, (level, service) in enumerate(
+            [("ERROR", "auth"), ("INFO", "auth"), ("ERROR", "billing")]
+        ):
+            resp = await client.post(
+                "/add_log",
+                headers=admin_headers,
+                json={
+                    "timestamp": f"2025-05-14T12:0{i}:00Z",
+                    "level": level,
+                    "service": service,
+                    "message": f"encoded {i}",
+                },
+            )
+            assert resp.status_code == 200
+
+        services = dict(
+            (await db_session.execute(select(Service.name, Service.id))).all()
+        )
+        assert sorted(services) == ["auth", "billing"]
+        rows = (await db_session.execute(text("SELECT level, service FROM log"))).all()
+        assert sorted(rows) == sorted(
+            [(40, services["auth"]), (20, services["auth"]), (40, services["billing"])]
+        )
+
+        resp = await client.get("/logs?level=ERROR&service=auth", headers=admin_headers)
+        [log] = resp.json()["logs"]
+        assert (log["level"], log["service"], log["message"]) == (
+            "ERROR",
+            "auth",
+            "encoded 0",
+        )
+        resp = await client.get("/logs?service=unknown", headers=admin_headers)
+        assert resp.json()["total"] == 0
+
+        stats = await aggregate_counts(
+            db_session, dimensions=["level", "service"], use_rollups=False
+        )
+        assert stats == {
+            (None, "ERROR", "auth"): 1,
+            (None, "INFO", "auth"): 1,
+            (None, "ERROR", "billing"): 1,
+        }
+
+    @pytest.mark.asyncio
+    async def test_services_cached_only_after_commit(self, db_session):
+        ids, created = await resolve_service_ids(db_session, ["auth"])
+        assert created == ids
+        await db_session.rollback()
+        assert "auth" not in service_names.ids
+
+        [log_id] = await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=datetime(2025, 5, 14, 12, 0),
+                    level="WARNING",
+                    service="auth",
+                    message="after rollback",
+                )
+            ],
+        )
+        service_id = await db_session.scalar(
+            select(Service.id).where(Service.name == "auth")
+        )
+        assert service_names.ids == {"auth": service_id}
+        assert service_names.names == {service_id: "auth"}
+        logs, _ = await get_logs_filtered(db_session, service="auth")
+        assert [(log.id, log.level) for log in logs] == [(log_id, "WARNING")]
+
+    @pytest.mark.asyncio
+    async def test_services_created_by_another_process(
+        self, client: AsyncClient, admin_headers, db_session
+    ):
+        # Сервис и лог пишет другой процесс: в словаре этого процесса их нет
+        await db_session.execute(text("INSERT INTO service (name) VALUES ('remote')"))
+        await db_session.execute(
+            text(
+                "INSERT INTO log (timestamp, level, service, message) "
+                "SELECT '2025-05-14 12:00:00', 40, id, 'from another worker' "
+                "FROM service WHERE name = 'remote'"
+            )
+        )
+        await db_session.commit()
+        assert "remote" not in service_names.ids
+
+        resp = await client.get("/logs?service=remote", headers=admin_headers)
+        [log] = resp.json()["logs"]
+        assert (log["service"], log["message"]) == ("remote", "from another worker")
+
+        service_names.clear()
+        resp = await client.get("/logs/export", headers=admin_headers)
+        assert json.loads(resp.text)["service"] == "remote"
+
+        service_names.clear()
+        assert (
+            await delete_old_logs(db_session, datetime(2025, 5, 15), service="remote")
+            == 1
+        )
+
+        with pytest.raises(UnknownService):
+            ServiceRef().process_bind_param("missing", None)
+
+
+class TestTemplates:
+    def test_miner_groups_variable_tokens(self):
+        miner = TemplateMiner()
+        templates = miner.add_messages(
+            [
+                "user 123 logged in from 10.0.0.1",
+                "user 456 logged in from 10.0.0.2:8080",
+                "payment failed for order A-1 after 3 retries",
+                "payment failed for order B-2 after 5 retries",
+                "connection reset by peer",
+            ]
+        )
+        assert [template.id for template in templates] == [None] * 5
+        assert templates[0] is templates[1]
+        assert templates[2] is templates[3]
+        assert templates[0].text == "user <*> logged in from <*>"
+        assert templates[2].text == "payment failed for order <*> after <*> retries"
+        # До register дерево не меняется
+        assert miner.templates == {} and miner.add_messages(["user 1"])[0].id is None
+        assert miner.root == {}
+
+        for template_id, index in ((1, 0), (2, 2), (3, 4)):
+            templates[index].id = template_id
+        restored = TemplateMiner()
+        restored.load([(template.id, template.text) for template in templates])
+        [template] = restored.add_messages(
+            ["payment failed for order C-3 after 1 retries"]
+        )
+        assert template.id == 2
+        tree = repr(restored.root)
+        [template] = restored.add_messages(["disk full"])
+        assert template.id is None
+        assert repr(restored.root) == tree
+
+    @pytest.mark.asyncio
+    async def test_template_ids_come_from_database(
+        self, client: AsyncClient, admin_headers, db_session
+    ):
+        def log(message: str):
+            return LogShema(
+                timestamp=datetime(2025, 5, 14, 12, 0),
+                level="ERROR",
+                service="billing",
+                message=message,
+            )
+
+        # Шаблон уже создал другой процесс, локальное дерево о нём не знает
+        await db_session.execute(
+            insert(LogTemplate),
+            [
+                {
+                    "id": 40,
+                    "template": "disk full on <*>",
+                    "count": 2,
+                    "first_seen": datetime(2025, 5, 14, 11, 0),
+                    "last_seen": datetime(2025, 5, 14, 11, 0),
+                }
+            ],
+        )
+        await db_session.commit()
+        await create_logs_bulk(db_session, [log("disk full on 12")])
+        assert template_miner.templates[40].text == "disk full on <*>"
+
+        # Откаченный пакет не оставляет шаблонов ни в базе, ни в дереве
+        await assign_templates(db_session, [log_to_row(log("queue overflow"))])
+        await db_session.rollback()
+        assert [t.text for t in template_miner.templates.values()] == [
+            "disk full on <*>"
+        ]
+
+        await create_logs_bulk(db_session, [log("queue overflow")])
+        result = await db_session.execute(
+            select(LogTemplate.id, LogTemplate.template, LogTemplate.count).order_by(
+                LogTemplate.id
+            )
+        )
+        assert result.all() == [(40, "disk full on <*>", 3), (41, "queue overflow", 1)]
+
+    @pytest.mark.asyncio
+    async def test_patterns_and_template_stats(
+        self, client: AsyncClient, admin_headers, db_session
+    ):
+        messages = [
+            ("ERROR", "payment failed for order 1 code=E1"),
+            ("ERROR", "payment failed for order 2 code=E2"),
+            ("ERROR", "payment failed for order 3 code=E2"),
+            ("ERROR", "connection reset by peer"),
+            ("INFO", "user 7 logged in from 10.0.0.7"),
+            ("INFO", "user 8 logged in from 10.0.0.8"),
+        ]
+        ids = await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=datetime(2025, 5, 14, 12, i),
+                    level=level,
+                    service="billing",
+                    message=message,
+                )
+                for i, (level, message) in enumerate(messages)
+            ],
+        )
+
+        resp = await client.get("/patterns?level=ERROR", headers=admin_headers)
+        assert resp.status_code == 200
+        patterns = resp.json()["patterns"]
+        assert [(p["template"], p["count"]) for p in patterns] == [
+            ("payment failed for order <*> <*>", 3),
+            ("connection reset by peer", 1),
+        ]
+        assert patterns[0]["first_seen"] == "2025-05-14T12:00:00Z"
+        assert patterns[0]["last_seen"] == "2025-05-14T12:02:00Z"
+
+        resp = await client.get(
+            "/stats?group_by=template&level=ERROR&top=1"
+            "&start_time=2025-05-14T12:00:00Z&end_time=2025-05-14T13:00:00Z",
+            headers=admin_headers,
+        )
+        assert resp.json()["stats"] == [
+            {
+                "count": 3,
+                "template_id": patterns[0]["template_id"],
+                "template": "payment failed for order <*> <*>",
+            },
+            {"count": 1, "template_id": None, "template": "__other__"},
+        ]
+
+        resp = await client.get("/logs?level=INFO", headers=admin_headers)
+        logs = resp.json()["logs"]
+        assert [log["id"] for log in logs] == ids[4:]
+        assert logs[0]["template_id"] == logs[1]["template_id"]
+        assert logs[0]["message"] == "user 7 logged in from 10.0.0.7"
+
+
+    @pytest.mark.asyncio
+    async def test_stats_load_templates_mined_elsewhere(
+        self, client: AsyncClient, admin_headers, db_session
+    ):
+        await create_logs_bulk(
+            db_session,
+            [
+                LogShema(
+                    timestamp=datetime(2025, 5, 14, 12, i),
+                    level="ERROR",
+                    service="billing",
+                    message=f"payment failed for order {i}",
+                )
+                for i in range(2)
+            ],
+        )
+        # Шаблон нашёл другой процесс: в дереве этого процесса его нет
+        template_miner.clear()
+
+        resp = await client.get("/stats?group_by=template", headers=admin_headers)
+        [entry] = resp.json()["stats"]
+        assert entry["template"] == "payment failed for order <*>"
+        assert entry["template_id"] in template_miner.templates
+
+class TestTail:
+    @staticmethod
+    def tail_log(i: int, level: str = "ERROR", message: str = "payment failed"):
+        return LogShema(
+            timestamp=datetime(2025, 5, 14, 12, 0, i),
+            level=level,
+            service="billing",
+            message=f"{message} {i}",
+            metadata={"n": i},
+        )
+
+    @pytest.mark.asyncio
+    async def test_tail_pushes_matching_rows(self, db_session):
+        subscription = tail_broker.subscribe(level="ERROR", q="payment")
+        try:
+            ids = await create_logs_bulk(
+                db_session,
+                [
+                    self.tail_log(0),
+                    self.tail_log(1, level="INFO"),
+                    self.tail_log(2, message="connection reset"),
+                    self.tail_log(3),
+                ],
+            )
+            rows = []
+            while not subscription.queue.empty():
+                rows.append(subscription.queue.get_nowait())
+        finally:
+            tail_broker.unsubscribe(subscription)
+
+        assert [row["id"] for row in rows] == [ids[0], ids[3]]
+        assert rows[0]["message"] == "payment failed 0"
+        assert subscription not in tail_broker.subscribers
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_drops_rows(self, monkeypatch):
+        broker = TailBroker(queue_size=2)
+        monkeypatch.setattr("app.api.logs.tail_broker", broker)
+        subscription = broker.subscribe()
+        broker.publish(
+            [
+                {**log_to_row(self.tail_log(i)), "id": i + 1, "template_id": None}
+                for i in range(5)
+            ]
+        )
+        assert subscription.queue.qsize() == 2
+        assert subscription.dropped == 3
+
+        class Request:
+            async def is_disconnected(self):
+                return True
+
+        events = tail_events(Request(), subscription)
+        assert await events.__anext__() == 'event: dropped\ndata: {"dropped": 3}\n\n'
+        event = await events.__anext__()
+        assert event.startswith("id: 1\nevent: log\ndata: ")
+        entry = json.loads(event.split("data: ", 1)[1])
+        assert entry["timestamp"] == "2025-05-14T12:00:00Z"
+        assert entry["metadata"] == {"n": 0}
+        await events.aclose()
+        assert broker.subscribers == set()
+
+    @pytest.mark.asyncio
+    async def test_tail_limits_subscribers(
+        self, client: AsyncClient, admin_headers, monkeypatch
+    ):
+        resp = await client.get("/logs/tail")
+        assert resp.status_code == 401
+
+        monkeypatch.setattr(tail_broker, "max_subscribers", 0)
+        resp = await client.get("/logs/tail", headers=admin_headers)
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"] == "5"
+
+
+@pytest.mark.sqlite_only
+class TestSqliteTuning:
+    @pytest.mark.asyncio
+    async def test_pragmas_and_read_only_pool(self, tmp_path):
+        url = f"sqlite+aiosqlite:///{tmp_path / 'tuned.db'}"
+        writer = create_engine(url)
+        reader = create_engine(url, readonly=True)
+        try:
+            async with writer.begin() as conn:
+                mode = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+                assert mode == "wal"
+                assert (await conn.exec_driver_sql("PRAGMA synchronous")).scalar() == 1
+                assert (await conn.exec_driver_sql("PRAGMA temp_store")).scalar() == 2
+                await conn.exec_driver_sql("CREATE TABLE item (id INTEGER)")
+                await conn.exec_driver_sql("INSERT INTO item VALUES (1)")
+
+            async with reader.connect() as conn:
+                count = (
+                    await conn.exec_driver_sql("SELECT count(*) FROM item")
+                ).scalar()
+                assert count == 1
+                with pytest.raises(OperationalError):
+                    await conn.exec_driver_sql("INSERT INTO item VALUES (2)")
+            assert writer.pool.size() == 1
+        finally:
+            await reader.dispose()
+            await writer.dispose()
+
+    @pytest.mark.asyncio
+    async def test_maintenance_checkpoints_and_vacuums(self, tmp_path):
+        url = f"sqlite+aiosqlite:///{tmp_path / 'maintained.db'}"
+        writer = create_engine(url)
+        try:
+            async with writer.begin() as conn:
+                await conn.exec_driver_sql("CREATE TABLE item (payload TEXT)")
+                for _ in range(50):
+                    await conn.exec_driver_sql(
+                        "INSERT INTO item VALUES (?)", ("x" * 4000,)
+                    )
+            async with writer.begin() as conn:
+                await conn.exec_driver_sql("DELETE FROM item")
+
+            result = await SqliteMaintenance(vacuum_pages=1000).run_once(writer)
+            assert not result["checkpoint_busy"]
+            assert (tmp_path / "maintained.db-wal").stat().st_size == 0
+            assert result["free_pages"] > 0
+            assert result["vacuumed"]
+
+            async with writer.connect() as conn:
+                free = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+                assert free == 0
+                stats = await conn.exec_driver_sql("SELECT count(*) FROM sqlite_stat1")
+                assert stats.scalar() >= 0
+        finally:
+            await writer.dispose()
+
+
+class TestMetrics:
+    @pytest.mark.asyncio
+    async def test_timing_headers_and_exposition(
+        self, client: AsyncClient, admin_headers
+    ):
+        await client.post(
+            "/add_log",
+            headers=admin_headers,
+            json={
+                "timestamp": "2025-05-15T10:00:00Z",
+                "level": "INFO",
+                "service": "metered",
+                "message": "metered message",
+            },
+        )
+        resp = await client.get("/logs?service=metered", headers=admin_headers)
+        assert float(resp.headers["x-query-time"]) >= 0
+        assert resp.headers["server-timing"].startswith("db;dur=")
+        assert "total;dur=" in resp.headers["server-timing"]
+
+        metrics = await client.get("/metrics")
+        assert metrics.status_code == 200
+        assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = metrics.text
+        assert "# TYPE http_request_duration_seconds histogram" in body
+        assert (
+            'http_request_duration_seconds_bucket{method="GET",route="/logs",le="+Inf"}'
+            in body
+        )
+        assert 'http_response_rows_count{method="GET",route="/logs"}' in body
+        assert (
+            'http_requests_total{method="POST",route="/add_log",status="200"}' in body
+        )
+        assert "log_ingest_queue_depth 0" in body
+
+    @pytest.mark.asyncio
+    async def test_slow_request_log(
+        self, client: AsyncClient, admin_headers, caplog, monkeypatch, db_engine
+    ):
+        middleware = app.middleware_stack
+        while not isinstance(middleware, MetricsMiddleware):
+            middleware = middleware.app
+        monkeypatch.setattr(middleware, "slow_threshold", 0.000001)
+        monkeypatch.setattr(middleware, "explain_engine", db_engine)
+
+        with caplog.at_level("WARNING", logger="app.core.metrics"):
+            resp = await client.get("/logs", headers=admin_headers)
+        assert resp.status_code == 200
+        assert "Медленный запрос GET /logs" in caplog.text
+        assert "План:" in caplog.text
+
+        caplog.clear()
+        monkeypatch.setattr(middleware, "explain_engine", None)
+        with caplog.at_level("WARNING", logger="app.core.metrics"):
+            await client.get("/logs?level=ERROR", headers=admin_headers)
+        assert "SQL за" in caplog.text
+        assert "План:" not in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_background_work_is_not_counted_in_request(self, session_factory):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            # Очередь запущена из запроса, но пишет уже вне его контекста
+            queue = IngestQueue(session_factory, flush_interval=0.01)
+            await queue.start()
+            await queue.put(
+                LogShema(
+                    timestamp=datetime(2025, 5, 14, 12, 0),
+                    level="INFO",
+                    service="background",
+                    message="flushed later",
+                ),
+                wait=True,
+            )
+            await queue.stop()
+        finally:
+            current_stats.reset(token)
+        assert stats.queries == 0
+
+
+class TestProfiling:
+    @staticmethod
+    async def add(client: AsyncClient, headers):
+        await client.post(
+            "/logs/batch",
+            headers=headers,
+            json=[
+                {
+                    "timestamp": f"2025-05-16T10:00:{second:02d}Z",
+                    "level": "ERROR" if second % 3 else "INFO",
+                    "service": "profiled",
+                    "message": f"profiled message {second}",
+                }
+                for second in range(30)
+            ],
+        )
+
+    @pytest.mark.asyncio
+    async def test_sampled_request(self, client: AsyncClient, admin_headers, profiles):
+        await self.add(client, admin_headers)
+        resp = await client.get(
+            "/stats?group_by=level", headers={**admin_headers, "X-Profile": "1"}
+        )
+        assert resp.status_code == 200
+        profile_id = resp.headers["x-profile-id"]
+        assert profile_id.endswith(".collapsed.txt")
+
+        listed = (await client.get("/profiles", headers=admin_headers)).json()
+        assert [item["id"] for item in listed] == [profile_id]
+
+        profile = await client.get(f"/profiles/{profile_id}", headers=admin_headers)
+        assert profile.status_code == 200
+        for line in profile.text.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert stack and int(count) > 0
+
+    @pytest.mark.asyncio
+    async def test_cprofile_request(self, client: AsyncClient, admin_headers, profiles):
+        await self.add(client, admin_headers)
+        resp = await client.get(
+            "/stats?group_by=level",
+            headers={**admin_headers, "X-Profile": "cprofile"},
+        )
+        profile_id = resp.headers["x-profile-id"]
+        assert profile_id.endswith(".prof")
+
+        stats = pstats.Stats(str(profiles.directory / profile_id))
+        functions = {name for _, _, name in stats.stats}
+        assert "get_logs_stats" in functions
+
+    @pytest.mark.asyncio
+    async def test_requires_admin(self, client: AsyncClient, admin_headers, profiles):
+        register = await client.post(
+            "/auth/register", json={"username": "viewer", "password": "viewerpass"}
+        )
+        viewer_id = register.json()["id"]
+        login = await client.post(
+            "/auth/login", json={"username": "viewer", "password": "viewerpass"}
+        )
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        resp = await client.get("/stats", headers={**headers, "X-Profile": "1"})
+        assert resp.status_code == 200
+        assert "x-profile-id" not in resp.headers
+
+        # Имя admin в токене не даёт прав: решает роль пользователя из базы
+        forged = create_access_token(viewer_id, "admin")
+        resp = await client.get(
+            "/stats",
+            headers={"Authorization": f"Bearer {forged}", "X-Profile": "1"},
+        )
+        assert resp.status_code == 200
+        assert "x-profile-id" not in resp.headers
+        assert not profiles.directory.exists()
+
+        resp = await client.post("/profiles/sample?seconds=0.1", headers=headers)
+        assert resp.status_code == 403
+        assert resp.json()["detail"] == (
+            "Только администратор может снять профиль процесса"
+        )
+
+    @pytest.mark.asyncio
+    async def test_process_sample(self, client: AsyncClient, admin_headers, profiles):
+        resp = await client.post("/profiles/sample?seconds=0.1", headers=admin_headers)
+        assert resp.status_code == 200
+        assert resp.text.startswith("thread ")
+        assert (profiles.directory / resp.headers["x-profile-id"]).is_file()
+
+        resp = await client.post(
+            f"/profiles/sample?seconds={profiles.max_seconds + 1}",
+            headers=admin_headers,
+        )
+        assert resp.status_code == 400
+
+        resp = await client.get("/profiles/..%2Fapp.log", headers=admin_headers)
+        assert resp.status_code == 404
+
+
+class TestSerialization:
+    @pytest.mark.asyncio
+    async def test_logs_page_embeds_metadata(self, client: AsyncClient, admin_headers):
+        metadata = {"user": {"id": 42, "name": "Иван"}, "tags": ["a", "b"], "ok": None}
+        await client.post(
+            "/add_log",
+            headers=admin_headers,
+            json={
+                "timestamp": "2025-05-17T10:00:00.123456Z",
+                "level": "INFO",
+                "service": "serialized",
+                "message": "сообщение с юникодом",
+                "metadata": metadata,
+            },
+        )
+        await client.post(
+            "/add_log",
+            headers=admin_headers,
+            json={
+                "timestamp": "2025-05-17T10:00:01Z",
+                "level": "INFO",
+                "service": "serialized",
+                "message": "без метаданных",
+            },
+        )
+
+        resp = await client.get("/logs?service=serialized", headers=admin_headers)
+        assert resp.headers["content-type"] == "application/json"
+        assert "сообщение с юникодом".encode() in resp.content
+        data = resp.json()
+        assert data["total"] == 2
+        entries = {entry["message"]: entry for entry in data["logs"]}
+
+        entry = entries["сообщение с юникодом"]
+        assert entry["timestamp"] == "2025-05-17T10:00:00.123456Z"
+        assert entry["metadata"] == metadata
+        entry = entries["без метаданных"]
+        assert entry["timestamp"] == "2025-05-17T10:00:01Z"
+        assert entry["metadata"] is None
+
+    @pytest.mark.asyncio
+    async def test_big_integer_metadata(self, client: AsyncClient, admin_headers):
+        resp = await client.post(
+            "/add_log",
+            headers=admin_headers,
+            json={
+                "timestamp": "2025-05-17T11:00:00Z",
+                "level": "INFO",
+                "service": "bigint",
+                "message": "big number",
+                "metadata": {"trace": 2**70},
+            },
+        )
+        assert resp.status_code == 200
+
+        resp = await client.get("/logs?service=bigint", headers=admin_headers)
+        assert resp.json()["logs"][0]["metadata"] == {"trace": 2**70}
+
+    def test_corrupted_metadata_is_null(self, caplog):
+        rows = [
+            LogDB(
+                id=index,
+                timestamp=datetime(2025, 5, 17, 12, 0),
+                level="INFO",
+                service="corrupted",
+                message=raw,
+                metadata_json=raw,
+            )
+            for index, raw in enumerate(['{"n": 1}', "{bad", '{"n": NaN}', None])
+        ]
+        with caplog.at_level("WARNING", logger="app.utils.serialization"):
+            entries = orjson.loads(b"[%s]" % b",".join(map(logs_api.log_entry, rows)))
+        assert [entry["metadata"] for entry in entries] == [{"n": 1}, None, None, None]
+        assert "Некорректный JSON в логе ID=1" in caplog.text
+        assert "Некорректный JSON в логе ID=2" in caplog.text
+
+
+class TestLogging:
+    @pytest.fixture
+    def log_file(self, tmp_path):
+        yield tmp_path / "logs" / "app.log"
+        setup_logger()
+
+    def test_queue_rotation_and_sampling(self, log_file):
+        setup_logger(
+            filename=str(log_file), level="INFO", max_bytes=2000, backup_count=2
+        )
+        log = logging.getLogger("tests.logging")
+        for index in range(100):
+            log.info("Запись %d с аргументом %s", index, "x" * 20)
+        log.debug("Отладочная запись не пишется")
+        stop_logger()
+
+        files = sorted(log_file.parent.iterdir())
+        assert [path.name for path in files] == ["app.log", "app.log.1", "app.log.2"]
+        assert all(path.stat().st_size <= 2000 for path in files)
+        text = log_file.read_text(encoding="utf-8")
+        assert f"Запись 99 с аргументом {'x' * 20}" in text
+        assert "Отладочная" not in text
+
+        setup_logger(filename=str(log_file), sample_rate=0)
+        log.info("Запись на каждый запрос", extra=SAMPLED)
+        log.info("Обычная запись")
+        log.warning("Предупреждение", extra=SAMPLED)
+        stop_logger()
+        text = log_file.read_text(encoding="utf-8")
+        assert "Запись на каждый запрос" not in text
+        assert "Обычная запись" in text
+        assert "Предупреждение" in text
+
+
+@pytest.mark.sqlite_only
+class TestMigrations:
+    # Схема, которую создавала исходная версия приложения через create_all
+    BASELINE_SCHEMA = (
+        "CREATE TABLE log (id INTEGER NOT NULL, timestamp DATETIME NOT NULL, "
+        "level VARCHAR(20) NOT NULL, service VARCHAR(100) NOT NULL, "
+        "message VARCHAR NOT NULL, metadata_json TEXT, PRIMARY KEY (id))",
+        "CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR(20) NOT NULL, "
+        "password VARCHAR(20) NOT NULL, PRIMARY KEY (id))",
+        "CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL, "
+        "CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))",
+        "INSERT INTO alembic_version VALUES ('7c07acdb1498')",
+    )
+
+    @staticmethod
+    def alembic(path, *args):
+        env = {**os.environ, "SYNC_DATABASE_URL": f"sqlite:///{path}"}
+        result = subprocess.run(
+            [sys.executable, "-m", "alembic", *args],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=Path(__file__).resolve().parent.parent,
+        )
+        assert result.returncode == 0, result.stderr
+
+    def test_upgrade_from_baseline(self, tmp_path):
+        path = tmp_path / "baseline.db"
+        with sqlite3.connect(path) as conn:
+            for statement in self.BASELINE_SCHEMA:
+                conn.execute(statement)
+            conn.executemany(
+                "INSERT INTO log (timestamp, level, service, message, metadata_json) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    ("2025-06-15 10:30:00", "INFO", "auth", "User 1 logged in", None),
+                    ("2025-06-15 10:31:00", "ERROR", "billing", "Charge failed", "{}"),
+                ],
+            )
+
+        self.alembic(path, "upgrade", "head")
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute(
+                "SELECT l.id, l.level, s.name FROM log AS l "
+                "JOIN service AS s ON s.id = l.service ORDER BY l.id"
+            ).fetchall()
+            assert rows == [
+                (1, LEVEL_CODES["INFO"], "auth"),
+                (2, LEVEL_CODES["ERROR"], "billing"),
+            ]
+
+        self.alembic(path, "downgrade", "7c07acdb1498")
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute("SELECT id, level, service FROM log ORDER BY id")
+            assert rows.fetchall() == [(1, "INFO", "auth"), (2, "ERROR", "billing")]